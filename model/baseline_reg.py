@@ -0,0 +1,75 @@
+# fast baseline predictions for the volume and the travel time task, see baselines.py for the models
+# the window data is loaded like in gp_reg.py and the predictions are written in the same submission format,
+# with the MAPE of each baseline on the last --holdout-days days of the training data for a quick check
+# Usage: python baseline_reg.py [--task volume travel_time] [--baseline median ridge gbm] [--holdout-days 7]
+
+import argparse
+import datetime as dt
+import time
+import numpy as np
+import baselines
+import metrics
+import weather
+import window_data
+
+
+# settings
+output_prefix = "../prediction/"+dt.datetime.strftime(dt.datetime.now(),"%Y-%m-%d_%H:%M:%S")
+
+parser = argparse.ArgumentParser(description="Fast baseline models for all output columns of each task")
+parser.add_argument('--task',
+  dest='tasks',
+  action='store',
+  nargs='+',
+  help='Tasks to train and predict',
+  choices=sorted(window_data.tasks.keys()),
+  default=['volume', 'travel_time'])
+parser.add_argument('--baseline',
+  dest='baselines',
+  action='store',
+  nargs='+',
+  help='Baselines to train, each writes its own predictions',
+  choices=sorted(baselines.models.keys()),
+  default=['median'])
+parser.add_argument('--holdout-days',
+  dest='holdout_days',
+  action='store',
+  help='Days at the end of the training data held out for the MAPE, 0 to skip it',
+  type=int,
+  default=7)
+weather.add_weather_args(parser)
+args = parser.parse_args()
+
+
+# MAPE of a fresh baseline on the held out days, trained on the windows whose outputs end before them
+def holdout_mape(name, filename, train_x, train_y):
+  data = window_data.utils.loadWindowData(filename, window_data.input_windows(filename))
+  (n_in, n_out, width) = window_data.window_geometry(data)
+  win_start = np.asarray(data["win_start"])
+  output_end = win_start + (n_in + n_out) * width
+  origin = output_end.max() // 86400 * 86400 - args.holdout_days * 86400
+  (is_train, is_val) = (output_end <= origin, win_start >= origin)
+  model = baselines.build(name).fit(train_x[is_train], train_y[is_train])
+  return metrics.mape(model.predict(train_x[is_val]), train_y[is_val])
+
+
+for task in args.tasks:
+  print "task: " + task
+  (train_header, train_x, train_y, test_x, test_times) = window_data.load_data(window_data.tasks[task]["train"],
+    window_data.tasks[task]["test"], weather_columns = weather.selected_columns(args), weather_fill = args.weather_fill)
+  targets = window_data.output_targets(train_header)
+
+  for name in args.baselines:
+    if args.holdout_days > 0:
+      score = holdout_mape(name, window_data.tasks[task]["train"], train_x, train_y)
+      print "%s %s holdout MAPE over the last %d days: %.4f" % (task, name, args.holdout_days, score)
+
+    print "training %s baseline ..." % name
+    start = time.time()
+    pred_y = baselines.build(name).fit(train_x, train_y).predict(test_x)
+    print "done in %.1f s" % (time.time() - start)
+
+    output_filename = "%s_%s_%s.csv" % (output_prefix, name, task)
+    print "output to: " + output_filename
+    window_data.write_predictions(output_filename, task, targets, test_times,
+                                  (pred_y[:,m] for m in xrange(pred_y.shape[1])))
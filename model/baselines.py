@@ -0,0 +1,171 @@
+# fast baseline models for all output columns at once, as a fallback for the GP models and for quick checks
+# every model has fit(x, y) and predict(x) on the window data of window_data.py (unnormalized), where inputs 0 and 1
+# are the time of day and weekday of the last input window
+# median: median of the training outputs with the same weekday and time of day, falling back to the same time of day
+#         and then to the median of the column
+# ridge:  closed-form multi-output ridge regression on the window values, weekday and time-of-day harmonics
+# gbm:    histogram gradient boosting with squared loss, inputs are binned by quantiles once and each boosting round
+#         grows one depth-limited tree shared by all outputs (each leaf holds a value per output)
+# the GP scripts serve the predictions of a chain of baselines (--fallback) for the columns whose model is
+# stale or failed to train, baseline_reg.py writes the predictions of a baseline alone
+
+import numpy as np
+import scipy.linalg as la
+
+
+slots_per_day = 72
+
+
+def time_slots(x):
+  return (x[:,0] // 1200).astype(int) % slots_per_day, x[:,1].astype(int) % 7
+
+
+class MedianLookup(object):
+
+  def fit(self, x, y):
+    (tod, weekday) = time_slots(x)
+    self.by_week = np.full((7 * slots_per_day, y.shape[1]), np.nan)
+    self.by_day = np.full((slots_per_day, y.shape[1]), np.nan)
+    week_slot = weekday * slots_per_day + tod
+    for s in np.unique(week_slot):
+      self.by_week[s] = np.median(y[week_slot == s], 0)
+    for s in np.unique(tod):
+      self.by_day[s] = np.median(y[tod == s], 0)
+    self.overall = np.median(y, 0)
+    return self
+
+  def predict(self, x):
+    (tod, weekday) = time_slots(x)
+    pred = self.by_week[weekday * slots_per_day + tod]
+    pred = np.where(np.isnan(pred), self.by_day[tod], pred)
+    return np.where(np.isnan(pred), self.overall, pred)
+
+
+class Ridge(object):
+
+  def __init__(self, alpha = 1., harmonics = 4):
+    self.alpha = alpha
+    self.harmonics = harmonics
+
+  def features(self, x):
+    (tod, weekday) = time_slots(x)
+    angle = 2 * np.pi * x[:,0] / 86400.
+    fourier = [f(k * angle) for k in xrange(1, self.harmonics + 1) for f in (np.sin, np.cos)]
+    return np.column_stack([x[:,2:], np.eye(7)[weekday]] + fourier)
+
+  def fit(self, x, y):
+    f = self.features(x)
+    (self.mean_f, self.std_f) = (f.mean(0), f.std(0))
+    self.std_f[self.std_f == 0] = 1.
+    self.mean_y = y.mean(0)
+    f = (f - self.mean_f) / self.std_f
+    self.coef = la.solve(f.T.dot(f) + self.alpha * np.eye(f.shape[1]), f.T.dot(y - self.mean_y), sym_pos = True)
+    return self
+
+  def predict(self, x):
+    return ((self.features(x) - self.mean_f) / self.std_f).dot(self.coef) + self.mean_y
+
+
+class HistGradientBoosting(object):
+
+  def __init__(self, rounds = 100, learning_rate = 0.1, depth = 3, bins = 32, min_leaf = 20, l2 = 1.):
+    (self.rounds, self.learning_rate, self.depth) = (rounds, learning_rate, depth)
+    (self.bins, self.min_leaf, self.l2) = (bins, min_leaf, l2)
+
+  def binned(self, x):
+    return np.column_stack([np.searchsorted(e, x[:,f], side = "right") for (f, e) in enumerate(self.edges)])
+
+  # best split of the rows of a node over all features and bins: (feature, bin) or None
+  def best_split(self, onehot, grad):
+    hist = onehot.T.dot(grad).reshape(len(self.edges), self.bins, grad.shape[1])
+    count = onehot.sum(0).reshape(len(self.edges), self.bins)
+    (left_g, left_n) = (np.cumsum(hist, 1)[:,:-1], np.cumsum(count, 1)[:,:-1])
+    (total_g, total_n) = (grad.sum(0), grad.shape[0])
+    (right_g, right_n) = (total_g - left_g, total_n - left_n)
+    gain = (left_g**2).sum(2) / (left_n + self.l2) + (right_g**2).sum(2) / (right_n + self.l2) \
+           - (total_g**2).sum() / (total_n + self.l2)
+    gain[(left_n < self.min_leaf) | (right_n < self.min_leaf)] = -np.inf
+    (f, b) = np.unravel_index(np.argmax(gain), gain.shape)
+    return None if not gain[f, b] > 0 else (f, b)
+
+  # one tree in array layout: node k has children 2k+1 and 2k+2, feature -1 marks a leaf
+  def fit_tree(self, codes, onehot, grad):
+    num_of_nodes = 2**(self.depth + 1) - 1
+    (feature, threshold) = (np.full(num_of_nodes, -1), np.zeros(num_of_nodes, int))
+    value = np.zeros((num_of_nodes, grad.shape[1]))
+    rows = {0: np.arange(grad.shape[0])}
+    for k in xrange(num_of_nodes):
+      if k not in rows:
+        continue
+      r = rows.pop(k)
+      value[k] = grad[r].sum(0) / (len(r) + self.l2)
+      if 2*k + 2 >= num_of_nodes:
+        continue
+      split = self.best_split(onehot[r], grad[r])
+      if split is not None:
+        (feature[k], threshold[k]) = split
+        go_right = codes[r, feature[k]] > threshold[k]
+        (rows[2*k + 1], rows[2*k + 2]) = (r[~go_right], r[go_right])
+    return (feature, threshold, value)
+
+  def predict_tree(self, tree, codes):
+    (feature, threshold, value) = tree
+    node = np.zeros(codes.shape[0], int)
+    rows = np.arange(codes.shape[0])
+    for d in xrange(self.depth):
+      is_split = feature[node] >= 0
+      go_right = codes[rows, np.maximum(feature[node], 0)] > threshold[node]
+      node = np.where(is_split, 2*node + 1 + go_right, node)
+    return value[node]
+
+  def fit(self, x, y):
+    quantiles = np.linspace(0, 100, self.bins + 1)[1:-1]
+    self.edges = [np.unique(np.percentile(x[:,f], quantiles)) for f in xrange(x.shape[1])]
+    codes = self.binned(x)
+    onehot = np.zeros((x.shape[0], len(self.edges) * self.bins), np.float32)
+    onehot[np.arange(x.shape[0])[:,None], np.arange(len(self.edges)) * self.bins + codes] = 1
+    (self.mean_y, self.std_y) = (y.mean(0), y.std(0))
+    self.std_y[self.std_y == 0] = 1.
+    residual = (y - self.mean_y) / self.std_y
+    self.trees = []
+    for i in xrange(self.rounds):
+      tree = self.fit_tree(codes, onehot, residual)
+      residual -= self.learning_rate * self.predict_tree(tree, codes)
+      self.trees.append(tree)
+    return self
+
+  def predict(self, x):
+    codes = self.binned(x)
+    pred = sum(self.predict_tree(tree, codes) for tree in self.trees) * self.learning_rate
+    return pred * self.std_y + self.mean_y
+
+
+models = {"median": MedianLookup, "ridge": Ridge, "gbm": HistGradientBoosting}
+
+
+def build(name):
+  return models[name]()
+
+
+def add_fallback_args(parser):
+  parser.add_argument('--fallback',
+    dest='fallback',
+    action='store',
+    nargs='*',
+    help='Baselines served, in this order, for the columns whose GP model is stale or failed to train',
+    choices=sorted(models.keys()),
+    default=[])
+
+
+# predictions of the first baseline of the chain that trains, None if there is none
+# all columns are predicted at once, so a GP model falling back only picks its column
+def fallback_predictions(chain, train_x, train_y, test_x):
+  for name in chain:
+    try:
+      print "training %s baseline ..." % name
+      pred_y = build(name).fit(train_x, train_y).predict(test_x)
+      print "done"
+      return pred_y
+    except Exception as e:
+      print "%s baseline failed: %s" % (name, e)
+  return None
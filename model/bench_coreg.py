@@ -0,0 +1,80 @@
+# compare the coregionalized multi-output GP with the separate (gp_reg_sep.py) and joint (gp_reg_joint.py) models
+# Usage: python bench_coreg.py [--size 1000] [--holdout 144] [--rank 2]
+# the last --holdout windows of the training data are held out for MAPE, each fit uses the --size windows before them
+# every fit runs in its own process, so peak memory (max RSS) of one fit does not carry over to the next
+
+import argparse
+import multiprocessing
+import resource
+import time
+import numpy as np
+import GPy
+import gp_coreg
+import gp_models
+import metrics
+import window_data
+
+
+# settings
+train_filename = "../dataSets/training/volume_table6_training_20min_avg_6_window.csv"
+max_iters = 200
+
+parser = argparse.ArgumentParser(description="Fit time, memory and MAPE of separate, joint and coregionalized GPs")
+parser.add_argument('--size', dest='size', action='store', type=int,
+  help='Number of training windows', default=1000)
+parser.add_argument('--holdout', dest='holdout', action='store', type=int,
+  help='Number of held out windows at the end of the training data', default=144)
+parser.add_argument('--rank', dest='rank', action='store', type=int,
+  help='Rank of the coregionalized output covariance', default=2)
+parser.add_argument('--models', dest='models', action='store', nargs='+',
+  help='Models to compare', choices=['sep', 'joint', 'coreg'], default=['sep', 'joint', 'coreg'])
+args = parser.parse_args()
+
+(header, x, y, times) = window_data.load_window_file(train_filename)
+n = min(args.size, x.shape[0] - args.holdout)
+(train_x, train_y) = (x[-args.holdout-n:-args.holdout], y[-args.holdout-n:-args.holdout])
+(test_x, test_y) = (x[-args.holdout:], y[-args.holdout:])
+(mean_x, std_x) = (np.mean(train_x, 0), np.std(train_x, 0))
+(mean_y, std_y) = (np.mean(train_y, 0), np.std(train_y, 0))
+(norm_train_x, norm_train_y, norm_test_x) = ((train_x - mean_x) / std_x, (train_y - mean_y) / std_y,
+                                             (test_x - mean_x) / std_x)
+
+
+def fit_joint():
+  kernel = gp_models.ard_rbf_kernel(x.shape[1])
+  model = GPy.models.GPRegression(norm_train_x, norm_train_y, kernel)
+  model.optimize(max_iters = max_iters)
+  return model
+
+
+def fit(name, queue):
+  start = time.time()
+  if name == "sep":
+    pred = []
+    for m in xrange(y.shape[1]):
+      model = gp_models.build_model(norm_train_x, norm_train_y[:,m:m+1], gp_models.ard_rbf_kernel(x.shape[1]))
+      model.optimize(max_iters = max_iters)
+      pred.append(model.predict(norm_test_x)[0])
+    pred = np.hstack(pred)
+  elif name == "joint":
+    pred = fit_joint().predict(norm_test_x)[0]
+  else:
+    joint = fit_joint()
+    model = gp_coreg.CoregionalizedGP(norm_train_x, norm_train_y, joint.kern.lengthscale.values, args.rank)
+    model.init_output_cov(float(joint.kern.variance), float(joint.likelihood.variance))
+    model.fit(max_iters = max_iters)
+    pred = model.predict(norm_test_x, with_var = False)[0]
+  fit_time = time.time() - start
+  error = metrics.mape(pred * std_y + mean_y, test_y)
+  queue.put((fit_time, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024., error))
+
+
+print "%d training windows, %d held out windows, %d outputs" % (n, args.holdout, y.shape[1])
+print "%8s %10s %10s %8s" % ("model", "fit s", "peak MB", "MAPE")
+for name in args.models:
+  queue = multiprocessing.Queue()
+  proc = multiprocessing.Process(target = fit, args = (name, queue))
+  proc.start()
+  (fit_time, peak_mb, error) = queue.get()
+  proc.join()
+  print "%8s %10.2f %10.1f %8.4f" % (name, fit_time, peak_mb, error)
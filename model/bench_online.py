@@ -0,0 +1,50 @@
+# benchmark online posterior updates (see gp_posterior.py) against refactorizing, as the number of windows grows
+# Usage: python bench_online.py [--sizes 500 1000 2000] [--steps 20] [--column 0] [--train-file <window csv>]
+# a posterior of n windows slides over the next --steps windows: each step drops the oldest window and appends the
+# next one, then the same n windows are conditioned on from scratch; hyperparameters are fixed (unit variance,
+# lengthscales 3, noise 0.1 on normalized data), the predictions of both are compared at the last --holdout windows
+
+import argparse
+import time
+import numpy as np
+import gp_posterior
+import window_data
+
+
+parser = argparse.ArgumentParser(description="Update time of online GP posteriors vs refactorizing")
+parser.add_argument('--train-file', dest='train_filename', action='store',
+  help='Window csv written by scripts/utils.py', default=window_data.tasks["volume"]["train"])
+parser.add_argument('--sizes', dest='sizes', action='store', nargs='+', type=int,
+  help='Numbers of training windows', default=[500, 1000, 2000])
+parser.add_argument('--steps', dest='steps', action='store', type=int,
+  help='Number of windows slid over', default=20)
+parser.add_argument('--column', dest='column', action='store', type=int,
+  help='Output column to model', default=0)
+parser.add_argument('--holdout', dest='holdout', action='store', type=int,
+  help='Number of held out windows at the end of the training data', default=144)
+args = parser.parse_args()
+
+(header, x, y, times) = window_data.load_window_file(args.train_filename)
+y = y[:, args.column:args.column+1]
+(test_x, train_x, train_y) = (x[-args.holdout:], x[:-args.holdout], y[:-args.holdout])
+stats = {"mean_train_x": np.mean(train_x, 0), "std_train_x": np.std(train_x, 0),
+         "mean_train_y": np.mean(train_y, 0), "std_train_y": np.std(train_y, 0)}
+params = np.r_[1., np.full(x.shape[1], 3.), 0.1]
+
+print "%8s %12s %12s %8s %12s %12s" % ("windows", "update ms", "refactor ms", "speedup", "max d mean", "max d var")
+for n in args.sizes:
+  n = min(n, train_x.shape[0] - args.steps)
+  posterior = gp_posterior.GPPosterior(train_x[:n], train_y[:n], params, stats)
+  start = time.time()
+  for k in xrange(n, n + args.steps):
+    posterior.slide(train_x[k:k+1], train_y[k:k+1], n)
+  update_time = (time.time() - start) / args.steps
+
+  start = time.time()
+  for k in xrange(args.steps):
+    fresh = gp_posterior.GPPosterior(train_x[args.steps:n+args.steps], train_y[args.steps:n+args.steps], params, stats)
+  refactor_time = (time.time() - start) / args.steps
+
+  ((mean, var), (fresh_mean, fresh_var)) = (posterior.predict(test_x), fresh.predict(test_x))
+  print "%8d %12.1f %12.1f %8.1f %12.2e %12.2e" % (n, update_time * 1e3, refactor_time * 1e3,
+    refactor_time / update_time, np.abs(mean - fresh_mean).max(), np.abs(var - fresh_var).max())
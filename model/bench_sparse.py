@@ -0,0 +1,63 @@
+# benchmark the sparse GP backend against the exact GP as the number of training windows grows
+# Usage: python bench_sparse.py [--sizes 250 500 1000 2000] [--inducing 50 200] [--column 0]
+# the last --holdout windows of the training data are held out for MAPE, each fit uses the windows right before them
+# every fit runs in its own process, so peak memory (max RSS) of one fit does not carry over to the next
+
+import argparse
+import multiprocessing
+import resource
+import time
+import numpy as np
+import gp_models
+import metrics
+import window_data
+
+
+# settings
+train_filename = "../dataSets/training/volume_table6_training_20min_avg_6_window.csv"
+max_iters = 200
+
+parser = argparse.ArgumentParser(description="Fit time, memory and MAPE of exact vs sparse GP")
+parser.add_argument('--sizes', dest='sizes', action='store', nargs='+', type=int,
+  help='Numbers of training windows', default=[250, 500, 1000, 2000])
+parser.add_argument('--inducing', dest='inducing', action='store', nargs='+', type=int,
+  help='Numbers of inducing points of the sparse backend', default=[50, 200])
+parser.add_argument('--column', dest='column', action='store', type=int,
+  help='Output column to model', default=0)
+parser.add_argument('--holdout', dest='holdout', action='store', type=int,
+  help='Number of held out windows at the end of the training data', default=144)
+args = parser.parse_args()
+
+(header, x, y, times) = window_data.load_window_file(train_filename)
+y = y[:, args.column:args.column+1]
+(test_x, test_y) = (x[-args.holdout:], y[-args.holdout:])
+
+
+def fit(n, backend, num_inducing, queue):
+  (train_x, train_y) = (x[-args.holdout-n:-args.holdout], y[-args.holdout-n:-args.holdout])
+  (mean_x, std_x) = (np.mean(train_x, 0), np.std(train_x, 0))
+  (mean_y, std_y) = (np.mean(train_y, 0), np.std(train_y, 0))
+
+  start = time.time()
+  model = gp_models.build_model((train_x - mean_x) / std_x, (train_y - mean_y) / std_y,
+                                gp_models.ard_rbf_kernel(x.shape[1]), backend, num_inducing)
+  model.optimize(max_iters = max_iters)
+  fit_time = time.time() - start
+
+  (pred_mean, pred_var) = model.predict((test_x - mean_x) / std_x)
+  error = metrics.mape(pred_mean * std_y + mean_y, test_y)
+  queue.put((fit_time, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024., error))
+
+
+print "column %s, %d held out windows, baseline RSS %.1f MB" % (header[3 + x.shape[1] - 2 + args.column],
+  args.holdout, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.)
+print "%8s %8s %6s %10s %10s %8s" % ("windows", "model", "M", "fit s", "peak MB", "MAPE")
+for n in args.sizes:
+  n = min(n, x.shape[0] - args.holdout)
+  for (backend, num_inducing) in [("exact", 0)] + [("sparse", m) for m in args.inducing if m < n]:
+    queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(target = fit, args = (n, backend, num_inducing, queue))
+    proc.start()
+    (fit_time, peak_mb, error) = queue.get()
+    proc.join()
+    print "%8d %8s %6s %10.2f %10.1f %8.4f" % (n, backend, num_inducing or "-", fit_time, peak_mb, error)
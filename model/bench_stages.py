@@ -0,0 +1,49 @@
+# time the model stages on one window csv, for the scaling benchmark of scripts/bench_scaling.py
+# stages are recorded by profiling.py: load, normalize, optimize and predict of a sparse GP for one output column
+# (the exact GP is O(n^3) and does not reach 100x data), then fit and predict of the median and ridge baselines
+# Usage: python bench_stages.py --train-file <window csv> --stats-file stats.jsonl [--inducing 100] [--max-iters 50]
+
+import argparse
+import numpy as np
+import baselines
+import gp_models
+import profiling
+import window_data
+
+
+parser = argparse.ArgumentParser(description="Time the model stages on a window csv")
+parser.add_argument('--train-file', dest='train_filename', action='store',
+  help='Window csv written by scripts/utils.py', required=True)
+parser.add_argument('--inducing', dest='inducing', action='store', type=int,
+  help='Number of inducing points of the sparse GP', default=100)
+parser.add_argument('--max-iters', dest='max_iters', action='store', type=int,
+  help='Optimizer iterations of the sparse GP', default=50)
+parser.add_argument('--column', dest='column', action='store', type=int,
+  help='Output column of the GP', default=0)
+profiling.addProfileArgs(parser)
+args = parser.parse_args()
+profiling.configure(args)
+
+(header, x, y, times) = window_data.load_window_file(args.train_filename)
+n = x.shape[0]
+
+with profiling.stage("normalize", rows = n, inputs = x.shape[1], outputs = y.shape[1]):
+  (mean_x, std_x) = (np.mean(x, 0), np.std(x, 0))
+  std_x[std_x == 0] = 1.
+  (mean_y, std_y) = (np.mean(y, 0), np.std(y, 0))
+  std_y[std_y == 0] = 1.
+  (norm_x, norm_y) = ((x - mean_x) / std_x, (y - mean_y) / std_y)
+
+m = args.column
+model = gp_models.build_model(norm_x, norm_y[:,m:m+1], gp_models.ard_rbf_kernel(x.shape[1]), "sparse", args.inducing)
+gp_models.optimize(model, args.max_iters, backend = "sparse", rows = n, inducing = args.inducing)
+with profiling.stage("predict", backend = "sparse", rows = n):
+  model.predict(norm_x)
+
+for name in ["median", "ridge"]:
+  with profiling.stage("fit", model = name, rows = n):
+    baseline = baselines.build(name).fit(x, y)
+  with profiling.stage("predict", model = name, rows = n):
+    baseline.predict(x)
+
+print "%s: %d windows, %d inputs, %d outputs" % (args.train_filename, n, x.shape[1], y.shape[1])
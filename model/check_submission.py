@@ -0,0 +1,26 @@
+# check a prediction file against the submission sample of its task: every sample row once, in sample order,
+# with a finite value (see window_data.validate_predictions), exits with status 1 if anything is off
+# the task is told by the header of the file
+# Usage: python check_submission.py ../prediction/<file>.csv [--sample ../submission_sample_volume.csv]
+
+import argparse
+import sys
+import window_data
+
+
+parser = argparse.ArgumentParser(description="Check a prediction file against the submission sample")
+parser.add_argument('filename', action='store', help='Prediction file')
+parser.add_argument('--sample', dest='sample', action='store',
+  help='Submission sample (default: the sample of the task)', default=None)
+args = parser.parse_args()
+
+with open(args.filename) as f:
+  header = f.readline().strip()
+task = [t for t in window_data.tasks if window_data.tasks[t]["header"] == header]
+if not task:
+  print "%s: unknown header %s" % (args.filename, header)
+  sys.exit(1)
+
+report = window_data.validate_predictions(args.filename, task[0], args.sample)
+if any(report[k] > 0 for k in ["missing", "extra", "duplicates", "out_of_order", "invalid"]):
+  sys.exit(1)
@@ -0,0 +1,136 @@
+# rolling-origin backtest of the separate GP models (gp_reg_sep.py / gp_reg.py) on the training window data
+# the last --folds days (or weeks) of the training data are the test periods of the folds, each fold trains on the
+# data points whose output windows end before its test period starts and predicts the data points in it
+# by default only data points whose last input window ends at 08:00 or 17:00 are scored, like the test set of the
+# competition (07:40 or 16:40 with 20-min windows, outputs 08:00-10:00 and 17:00-19:00), --eval-all scores every
+# data point of the test period
+# the number and width of the windows are read from the window csv
+# Usage: python gp_backtest.py [--task volume] [--folds 4] [--fold-size day] [--jobs 4] [--model sparse]
+
+import argparse
+import multiprocessing
+import time
+import numpy as np
+import gp_models
+import metrics
+import weather
+import window_data
+
+
+# settings
+max_iters = 200
+eval_ends = [8*3600, 17*3600]
+
+parser = argparse.ArgumentParser(description="Rolling-origin backtest with KDD MAPE per output column")
+parser.add_argument('--task',
+  dest='task',
+  action='store',
+  help='Task to backtest',
+  choices=sorted(window_data.tasks.keys()),
+  default='volume')
+parser.add_argument('--folds',
+  dest='folds',
+  action='store',
+  help='Number of folds',
+  type=int,
+  default=4)
+parser.add_argument('--fold-size',
+  dest='fold_size',
+  action='store',
+  help='Length of the test period of a fold',
+  choices=['day', 'week'],
+  default='day')
+parser.add_argument('--eval-all',
+  dest='eval_all',
+  action='store_true',
+  help='Score every data point of the test periods, not only the ones of the competition test set')
+parser.add_argument('--max-iters',
+  dest='max_iters',
+  action='store',
+  help='Optimizer iterations per model',
+  type=int,
+  default=max_iters)
+parser.add_argument('--jobs',
+  dest='jobs',
+  action='store',
+  help='Number of models trained in parallel worker processes',
+  type=int,
+  default=1)
+gp_models.add_model_args(parser)
+weather.add_weather_args(parser)
+args = parser.parse_args()
+
+
+# load data
+train_filename = window_data.tasks[args.task]["train"]
+(header, x, y, times) = window_data.load_window_file(train_filename, None, weather.selected_columns(args),
+                                                     args.weather_fill)
+targets = window_data.output_targets(header)
+data = window_data.utils.loadWindowData(train_filename, window_data.input_windows(train_filename))
+win_start = np.asarray(data["win_start"])
+time_of_win = np.asarray(data["time_of_win"])
+# last output window ends n_in + n_out windows after the first input window
+(n_in, n_out, width) = window_data.window_geometry(data)
+output_end = win_start + (n_in + n_out) * width
+
+period = 86400 * (7 if args.fold_size == "week" else 1)
+# the test period of the last fold is the last complete day (or week) of the data
+last_origin = output_end.max() // 86400 * 86400 - period
+origins = [last_origin - (args.folds - 1 - k) * period for k in xrange(args.folds)]
+
+
+# train the model of output column m on the training points of the current fold and predict its test points
+# the fold is set before the pool is created, so workers are forked with it
+fold = {}
+def train_model(m):
+  (train_x, train_y, test_x) = (fold["train_x"], fold["train_y"][:,m:m+1], fold["test_x"])
+  (mean_x, std_x) = (np.mean(train_x, 0), np.std(train_x, 0))
+  (mean_y, std_y) = (np.mean(train_y, 0), np.std(train_y, 0))
+  std_x[std_x == 0] = 1.
+  std_y[std_y == 0] = 1.
+
+  model = gp_models.build_model((train_x - mean_x) / std_x, (train_y - mean_y) / std_y,
+                                gp_models.ard_rbf_kernel(train_x.shape[1]), args.model, args.inducing)
+  model.optimize(max_iters = args.max_iters)
+  (pred_mean, pred_var) = model.predict((test_x - mean_x) / std_x)
+  return (pred_mean * std_y + mean_y)[:,0]
+
+
+print "%s: %d data points, %d output columns, %d folds of one %s" % (args.task, x.shape[0], y.shape[1],
+  args.folds, args.fold_size)
+print "%6s %20s %8s %8s %10s %8s" % ("fold", "test period from", "train", "test", "wall s", "MAPE")
+
+(all_pred, all_actual) = ([], [])
+for (k, origin) in enumerate(origins):
+  is_train = output_end <= origin
+  is_test = (win_start >= origin) & (output_end <= origin + period)
+  if not args.eval_all:
+    is_test &= np.in1d((time_of_win + width) % 86400, eval_ends)
+  if is_train.sum() == 0 or is_test.sum() == 0:
+    print "%6d %20s %8d %8d %10s %8s" % (k, window_data.utils.epochToStr(origin), is_train.sum(), is_test.sum(), "-", "-")
+    continue
+
+  fold = {"train_x": x[is_train], "train_y": y[is_train], "test_x": x[is_test]}
+  start = time.time()
+  if args.jobs > 1:
+    pool = multiprocessing.Pool(args.jobs)
+    pred = np.column_stack(pool.map(train_model, xrange(y.shape[1])))
+    pool.close()
+    pool.join()
+  else:
+    pred = np.column_stack(map(train_model, xrange(y.shape[1])))
+  wall = time.time() - start
+
+  all_pred.append(pred)
+  all_actual.append(y[is_test])
+  print "%6d %20s %8d %8d %10.1f %8.4f" % (k, window_data.utils.epochToStr(origin), is_train.sum(), is_test.sum(),
+    wall, metrics.mape(pred, y[is_test]))
+
+if all_pred:
+  (pred, actual) = (np.vstack(all_pred), np.vstack(all_actual))
+  column_mape = metrics.mape(pred, actual, axis = 0)
+  print ""
+  print "MAPE per output column over all folds"
+  for (m, (a, b, shift)) in enumerate(targets):
+    print "%8s %8.4f" % ("%s-%s_%d" % (a, b, shift), column_mape[m])
+  print "overall  %8.4f" % metrics.mape(pred, actual)
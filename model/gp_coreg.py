@@ -0,0 +1,94 @@
+# intrinsic coregionalization model (ICM) for all output columns at once
+# cov(y[i,p], y[j,q]) = Kx(x_i, x_j) B[p,q] + noise * (i==j, p==q), Kx a unit-variance ARD RBF kernel on the inputs,
+# B = W W^T + diag(kappa) the output covariance of rank R plus a diagonal
+# with Kx = Ux diag(sx) Ux^T and B = Ub diag(sb) Ub^T the covariance is (Ux x Ub)(sx x sb + noise)(Ux x Ub)^T,
+# so after one O(n^3) eigendecomposition of Kx the likelihood and its gradient in B and noise cost O(n P^2 + P^3)
+# instead of O(n^3 P^3) for the n x P outputs
+# the lengthscales of Kx are fitted beforehand (see gp_reg_coreg.py), B and the noise by fit()
+
+import numpy as np
+import scipy.linalg as la
+import scipy.optimize as opt
+from gp_posterior import ard_rbf
+
+
+class CoregionalizedGP(object):
+
+  def __init__(self, x, y, lengthscale, rank = 2):
+    self.x = x
+    self.y = y
+    self.rank = rank
+    self.lengthscale = np.asarray(lengthscale, dtype = float)
+    (self.sx, self.ux) = la.eigh(ard_rbf(x, x, self.lengthscale, 1.))
+    self.sx = np.maximum(self.sx, 0)
+    self.yx = self.ux.T.dot(y)
+    num_of_outputs = y.shape[1]
+    self.set_output_cov(np.zeros((num_of_outputs, rank)), np.ones(num_of_outputs), 1.)
+
+  def set_output_cov(self, w, kappa, noise_var):
+    self.w = np.asarray(w, dtype = float).reshape(self.y.shape[1], self.rank)
+    self.kappa = np.asarray(kappa, dtype = float)
+    self.noise_var = float(noise_var)
+    self.b = self.w.dot(self.w.T) + np.diag(self.kappa)
+    (self.sb, self.ub) = la.eigh(self.b)
+    self.sb = np.maximum(self.sb, 0)
+    self.lam = np.outer(self.sx, self.sb) + self.noise_var
+    self.y_rot = self.yx.dot(self.ub)
+    # alpha = (K + noise)^-1 vec(y) as an n x P matrix
+    self.alpha = self.ux.dot(self.y_rot / self.lam).dot(self.ub.T)
+
+  # B initialized from the correlation of the outputs scaled to variance, the rank-R part from its top eigenvectors
+  def init_output_cov(self, variance, noise_var):
+    corr = np.corrcoef(self.y, rowvar = False) * variance
+    (s, u) = la.eigh(corr)
+    w = u[:, -self.rank:] * np.sqrt(np.maximum(s[-self.rank:], 0) * 0.5)
+    kappa = np.maximum(variance - (w*w).sum(1), 0.01 * variance)
+    self.set_output_cov(w, kappa, noise_var)
+
+  # all parameters as one vector (lengthscales, W, kappa, noise), like model.param_array of GPy
+  @property
+  def param_array(self):
+    return np.concatenate([self.lengthscale, self.w.ravel(), self.kappa, [self.noise_var]])
+
+  def set_param_array(self, params):
+    (d, p) = (self.x.shape[1], self.y.shape[1])
+    if params.shape != (d + p * self.rank + p + 1,) or np.any(params[:d] != self.lengthscale):
+      return False
+    self.set_output_cov(params[d:d + p*self.rank], params[d + p*self.rank:-1], params[-1])
+    return True
+
+  def log_likelihood(self):
+    return -0.5 * ((self.y_rot**2 / self.lam).sum() + np.log(self.lam).sum() + self.lam.size * np.log(2 * np.pi))
+
+  # gradients of the log likelihood in B and in the noise variance
+  def gradients(self):
+    q = (self.y_rot / self.lam).dot(self.ub.T)
+    c = (self.sx[:,None] / self.lam).sum(0)
+    grad_b = 0.5 * (q.T.dot(self.sx[:,None] * q) - self.ub.dot(c[:,None] * self.ub.T))
+    grad_noise = 0.5 * ((self.y_rot / self.lam)**2 - 1. / self.lam).sum()
+    return (grad_b, grad_noise)
+
+  # maximize the likelihood in W, log kappa and log noise with L-BFGS, Kx stays fixed
+  def fit(self, max_iters = 200, messages = False):
+    (p, r) = (self.y.shape[1], self.rank)
+
+    def objective(theta):
+      self.set_output_cov(theta[:p*r], np.exp(theta[p*r:-1]), np.exp(theta[-1]))
+      (grad_b, grad_noise) = self.gradients()
+      grad = np.concatenate([(2 * grad_b.dot(self.w)).ravel(), np.diag(grad_b) * self.kappa,
+                             [grad_noise * self.noise_var]])
+      return (-self.log_likelihood(), -grad)
+
+    theta = np.concatenate([self.w.ravel(), np.log(self.kappa), [np.log(self.noise_var)]])
+    (theta, f, info) = opt.fmin_l_bfgs_b(objective, theta, maxiter = max_iters, disp = int(messages))
+    self.set_output_cov(theta[:p*r], np.exp(theta[p*r:-1]), np.exp(theta[-1]))
+    return info
+
+  # means and variances (including noise) of all outputs at x: t x P, variance is None if with_var is False
+  def predict(self, x, with_var = True):
+    k_star = ard_rbf(x, self.x, self.lengthscale, 1.)
+    mean = k_star.dot(self.alpha).dot(self.b)
+    if not with_var:
+      return (mean, None)
+    reduction = (k_star.dot(self.ux)**2).dot(1. / self.lam).dot(self.b.dot(self.ub).T**2)
+    return (mean, np.diag(self.b)[None,:] - reduction + self.noise_var)
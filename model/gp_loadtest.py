@@ -0,0 +1,97 @@
+# load test of gp_server.py
+# replays the windows of the test data as /predict requests from concurrent clients with keep-alive
+# connections and reports the latency percentiles and the throughput
+# Usage: python gp_loadtest.py [--port 8017 | --socket /tmp/gp.sock] [--requests 2000] [--clients 4] [--no-variance]
+#                               [--test-file <window csv>]
+
+import argparse
+import httplib
+import json
+import socket
+import threading
+import time
+import numpy as np
+import window_data
+
+
+parser = argparse.ArgumentParser(description="Latency and throughput of the prediction service")
+parser.add_argument('--test-file', dest='test_filename', action='store',
+  help='Window csv replayed as requests, with the window geometry of the served models',
+  default=window_data.tasks["volume"]["test"])
+parser.add_argument('--port', dest='port', action='store', type=int,
+  help='TCP port of the service on localhost', default=8017)
+parser.add_argument('--socket', dest='socket', action='store',
+  help='Unix socket of the service', default=None)
+parser.add_argument('--requests', dest='requests', action='store', type=int,
+  help='Total number of requests', default=2000)
+parser.add_argument('--clients', dest='clients', action='store', type=int,
+  help='Number of concurrent clients', default=4)
+parser.add_argument('--no-variance', dest='variance', action='store_false',
+  help='Ask for the forecast means only')
+args = parser.parse_args()
+
+
+class UnixHTTPConnection(httplib.HTTPConnection):
+  def __init__(self, path):
+    httplib.HTTPConnection.__init__(self, "localhost")
+    self.path = path
+
+  def connect(self):
+    self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.sock.connect(self.path)
+
+
+class TCPHTTPConnection(httplib.HTTPConnection):
+  # httplib sends the headers and the body in separate writes
+  def connect(self):
+    httplib.HTTPConnection.connect(self)
+    self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+def connect():
+  if args.socket:
+    return UnixHTTPConnection(args.socket)
+  return TCPHTTPConnection("127.0.0.1", args.port)
+
+
+# request bodies from the test windows
+(header, test_x, test_y, test_times) = window_data.load_window_file(args.test_filename)
+bodies = [json.dumps({"time_of_win": str(t), "x": list(x[2:]), "variance": args.variance})
+          for (t, x) in zip(test_times, test_x)]
+
+latencies = [[] for c in xrange(args.clients)]
+errors = [0] * args.clients
+
+
+def client(c):
+  conn = connect()
+  for r in xrange(c, args.requests, args.clients):
+    start = time.time()
+    conn.request("POST", "/predict", bodies[r % len(bodies)], {"Content-Type": "application/json"})
+    resp = conn.getresponse()
+    resp.read()
+    latencies[c].append(time.time() - start)
+    if resp.status != 200:
+      errors[c] += 1
+  conn.close()
+
+
+# one request to check the service is up and warm
+conn = connect()
+conn.request("GET", "/health")
+print "service: " + conn.getresponse().read()
+conn.close()
+
+start = time.time()
+threads = [threading.Thread(target = client, args = (c,)) for c in xrange(args.clients)]
+for t in threads:
+  t.start()
+for t in threads:
+  t.join()
+wall = time.time() - start
+
+lat = np.concatenate([np.asarray(l) for l in latencies]) * 1000
+print "%d requests from %d clients in %.2f s, %d errors" % (lat.size, args.clients, wall, sum(errors))
+print "latency ms: p50 %.2f  p90 %.2f  p99 %.2f  max %.2f" % (np.percentile(lat, 50), np.percentile(lat, 90),
+  np.percentile(lat, 99), lat.max())
+print "throughput: %.1f requests/s" % (lat.size / wall)
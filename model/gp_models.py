@@ -0,0 +1,91 @@
+# GP model construction shared by the gp_reg_* scripts
+# exact:  GPy GPRegression, O(n^3) time and O(n^2) memory in the number of training windows
+# sparse: GPy SparseGPRegression (variational DTC) with M inducing points, O(n M^2) time and O(n M) memory
+# both use the same ARD RBF kernel on the normalized inputs, other kernel families are available to the search
+
+import os
+import sys
+import GPy
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+import profiling
+
+
+backends = ["exact", "sparse"]
+
+
+def add_model_args(parser):
+  parser.add_argument('--model',
+    dest='model',
+    action='store',
+    help='GP backend: exact or sparse (inducing points)',
+    choices=backends,
+    default='exact')
+  parser.add_argument('--inducing',
+    dest='inducing',
+    action='store',
+    help='Number of inducing points of the sparse backend',
+    type=int,
+    default=200)
+  add_optimizer_args(parser)
+
+
+# for scripts without a choice of backend
+def add_optimizer_args(parser):
+  parser.add_argument('--optimizer-messages',
+    dest='optimizer_messages',
+    action='store_true',
+    help='Show the GPy optimizer progress of every model (only without --jobs)')
+
+
+def ard_rbf_kernel(num_of_features):
+  return GPy.kern.RBF(num_of_features, variance = 1., lengthscale=1., ARD = True)
+
+
+kernel_families = ["rbf", "matern32", "matern52", "rbf_periodic"]
+
+
+# kernel of a family on the normalized inputs
+# rbf_periodic adds a periodic kernel on the time of day (input 0) with its period fixed to one day,
+# day_period is one day in normalized units (86400 / std of the time of day)
+def build_kernel(family, num_of_features, day_period = None):
+  if family == "rbf":
+    return ard_rbf_kernel(num_of_features)
+  if family == "matern32":
+    return GPy.kern.Matern32(num_of_features, variance = 1., lengthscale = 1., ARD = True)
+  if family == "matern52":
+    return GPy.kern.Matern52(num_of_features, variance = 1., lengthscale = 1., ARD = True)
+  if family == "rbf_periodic":
+    periodic = GPy.kern.StdPeriodic(1, variance = 1., period = day_period, lengthscale = 1., active_dims = [0])
+    periodic.period.fix()
+    return ard_rbf_kernel(num_of_features) + periodic
+  raise ValueError("unknown kernel family " + family)
+
+
+# inducing points start at training windows evenly spaced in time,
+# which keeps them deterministic (serial and parallel runs fit the same model)
+def initial_inducing(x, num_inducing):
+  idx = np.linspace(0, x.shape[0]-1, min(num_inducing, x.shape[0])).astype(int)
+  return x[idx].copy()
+
+
+def build_model(x, y, kernel, backend = "exact", num_inducing = 200):
+  if backend == "sparse":
+    return GPy.models.SparseGPRegression(x, y, kernel, Z = initial_inducing(x, num_inducing))
+  return GPy.models.GPRegression(x, y, kernel)
+
+
+# saves of the sparse models also hold the inducing inputs, so they get their own file names
+def save_prefix(backend):
+  return "" if backend == "exact" else backend + "_"
+
+
+# optimize a model as the optimize stage of profiling.py, with the number of function evaluations,
+# the optimizer status and the final log likelihood, counters identify the model (e.g. its column)
+def optimize(model, max_iters, messages = False, **counters):
+  with profiling.stage("optimize", **counters) as stats:
+    model.optimize(messages = messages, max_iters = max_iters)
+    run = model.optimization_runs[-1]
+    stats.update({"function_evals": run.funct_eval, "status": run.status,
+                  "log_likelihood": float(model.log_likelihood())})
@@ -0,0 +1,202 @@
+# closed-form posterior of a trained exact GP regression model with ARD RBF kernel
+# the Cholesky factor of K + noise*I and the weights alpha = (K + noise*I)^-1 y are computed once,
+# after that a prediction costs O(n d) for the mean and O(n^2) for the variance, without GPy
+# predictions are in the units of the training data, like model.predict after de-normalization
+# BatchPosterior evaluates the posteriors of all output columns at once, they share the training windows
+# online updates keep the hyperparameters and normalization fixed: new windows are appended by extending the
+# Cholesky factor and the oldest windows are dropped by rank-one updates of the rest of it, O(n^2) per window
+# instead of O(n^3) for refactorizing, alpha is then solved again with the updated factor (also O(n^2))
+
+import math
+import numpy as np
+import scipy.linalg as la
+import model_store
+
+
+def ard_rbf(x1, x2, lengthscale, variance):
+  a = x1 / lengthscale
+  b = x2 / lengthscale
+  sq_dist = (a*a).sum(1)[:,None] + (b*b).sum(1)[None,:] - 2 * a.dot(b.T)
+  return variance * np.exp(-0.5 * np.maximum(sq_dist, 0))
+
+
+# lower Cholesky factor of a, with increasing jitter on the diagonal if a is not numerically positive definite
+# (e.g. a saved model whose noise variance collapsed), the same schedule as GPy.util.linalg.jitchol of GPRegression
+def jitchol(a, max_tries = 5):
+  try:
+    return la.cholesky(a, lower = True)
+  except la.LinAlgError:
+    diag = np.diag(a)
+    if np.any(diag <= 0):
+      raise la.LinAlgError("not positive definite: non-positive diagonal elements")
+    jitter = diag.mean() * 1e-6
+    for k in xrange(max_tries):
+      try:
+        return la.cholesky(a + jitter * np.eye(a.shape[0]), lower = True)
+      except la.LinAlgError:
+        jitter *= 10
+    raise la.LinAlgError("not positive definite, even with jitter")
+
+
+# Cholesky factor of [[K, c], [c^T, k_new]] from the factor l of K: the new rows are l^-1 c and the factor of the
+# Schur complement of K
+def chol_append(l, cross, k_new):
+  l21 = la.solve_triangular(l, cross, lower = True, check_finite = False).T
+  l22 = jitchol(k_new - l21.dot(l21.T))
+  n = l.shape[0]
+  result = np.zeros((n + l22.shape[0],) * 2, order = "F")
+  (result[:n,:n], result[n:,:n], result[n:,n:]) = (l, l21, l22)
+  return result
+
+
+# Cholesky factor of l l^T + v v^T, by Givens rotations over the transposed factor so rows are contiguous
+# factors are kept in Fortran order like the ones of la.cholesky, so the transposed copy is a plain copy
+def chol_update(l, v):
+  (r, v) = (np.array(l.T, order = "C"), np.array(v, dtype = np.float64))
+  for k in xrange(r.shape[0]):
+    (rkk, vk) = (r[k,k], v[k])
+    r[k,k] = math.hypot(rkk, vk)
+    (c, s) = (r[k,k] / rkk, vk / rkk)
+    (row, rest) = (r[k,k+1:], v[k+1:])
+    row += s * rest
+    row /= c
+    rest *= c
+    rest -= s * row
+  return r.T
+
+
+# Cholesky factor of K without its first num rows and columns: with l = [[l11, 0], [l21, l22]] that is
+# l22 l22^T + l21 l21^T, l22 updated by the num columns of l21 in turn
+def chol_drop_first(l, num):
+  result = l[num:,num:]
+  for k in xrange(num):
+    result = chol_update(result, l[num:,k])
+  return result
+
+
+class GPPosterior(object):
+
+  # params is model.param_array of GPRegression: [rbf variance, rbf lengthscales, noise variance]
+  def __init__(self, train_x, train_y, params, stats):
+    self.stats       = stats
+    self.variance    = params[0]
+    self.lengthscale = params[1:-1]
+    self.noise_var   = params[-1]
+    self.x = (train_x - stats["mean_train_x"]) / stats["std_train_x"]
+    self.y = (train_y - stats["mean_train_y"]) / stats["std_train_y"]
+
+    k = ard_rbf(self.x, self.x, self.lengthscale, self.variance)
+    k[np.diag_indices_from(k)] += self.noise_var
+    self.chol  = jitchol(k)
+    self.alpha = la.cho_solve((self.chol, True), self.y)
+
+  # add training windows (in the units of the training data) after the current ones
+  # with solve False, alpha is left to a later solve_alpha
+  def append(self, x, y, solve = True):
+    norm_x = (x - self.stats["mean_train_x"]) / self.stats["std_train_x"]
+    k_new = ard_rbf(norm_x, norm_x, self.lengthscale, self.variance)
+    k_new[np.diag_indices_from(k_new)] += self.noise_var
+    self.chol = chol_append(self.chol, ard_rbf(self.x, norm_x, self.lengthscale, self.variance), k_new)
+    self.x = np.vstack([self.x, norm_x])
+    self.y = np.vstack([self.y, (y - self.stats["mean_train_y"]) / self.stats["std_train_y"]])
+    if solve:
+      self.solve_alpha()
+
+  # forget the num oldest training windows
+  def drop_oldest(self, num, solve = True):
+    if num <= 0:
+      return
+    self.chol = chol_drop_first(self.chol, num)
+    (self.x, self.y) = (self.x[num:], self.y[num:])
+    if solve:
+      self.solve_alpha()
+
+  def solve_alpha(self):
+    self.alpha = la.cho_solve((self.chol, True), self.y, check_finite = False)
+
+  # add windows and drop the oldest ones beyond a history of max_windows (no limit if None)
+  def slide(self, x, y, max_windows = None):
+    if max_windows is not None:
+      self.drop_oldest(self.x.shape[0] + x.shape[0] - max_windows, solve = False)
+    self.append(x, y, solve = False)
+    self.solve_alpha()
+
+  # mean and variance (including noise) of the outputs at x, variance is None if with_var is False
+  def predict(self, x, with_var = True):
+    norm_x = (x - self.stats["mean_train_x"]) / self.stats["std_train_x"]
+    k_star = ard_rbf(norm_x, self.x, self.lengthscale, self.variance)
+    mean = k_star.dot(self.alpha) * self.stats["std_train_y"] + self.stats["mean_train_y"]
+    if not with_var:
+      return (mean, None)
+    v = la.solve_triangular(self.chol, k_star.T, lower = True, check_finite = False)
+    var = (self.variance - (v*v).sum(0) + self.noise_var)[:,None] * self.stats["std_train_y"]**2
+    return (mean, var)
+
+
+class BatchPosterior(object):
+
+  # the test windows are scored in chunks of chunk_size, the kernel of a chunk takes M x chunk_size x n floats
+  # the variances take a triangular solve per model, on Fortran ordered factors so LAPACK reads them in place,
+  # without the finiteness scan of the factor that took two thirds of the time of a single window
+  def __init__(self, posteriors, chunk_size = 256):
+    self.posteriors = posteriors
+    self.chunk_size = chunk_size
+    self.variance  = np.array([p.variance for p in posteriors])
+    self.noise_var = np.array([p.noise_var for p in posteriors])
+    self.alpha     = np.array([p.alpha for p in posteriors])
+    self.chol      = [np.asfortranarray(p.chol) for p in posteriors]
+    self.mean_y    = np.array([p.stats["mean_train_y"] for p in posteriors]).reshape(-1)
+    self.std_y     = np.array([p.stats["std_train_y"] for p in posteriors]).reshape(-1)
+
+    # inputs scaled by the lengthscales of each model: M x n x D
+    self.mean_x  = np.array([p.stats["mean_train_x"] for p in posteriors])
+    self.scale_x = np.array([p.stats["std_train_x"] * p.lengthscale for p in posteriors])
+    self.x    = np.array([p.x / p.lengthscale for p in posteriors])
+    self.x_sq = (self.x * self.x).sum(2)
+
+  # kernel between x and the training windows for every model: M x t x n
+  def kernel(self, x):
+    z = (x[None,:,:] - self.mean_x[:,None,:]) / self.scale_x[:,None,:]
+    sq_dist = (z*z).sum(2)[:,:,None] + self.x_sq[:,None,:] - 2 * np.matmul(z, self.x.transpose(0, 2, 1))
+    return self.variance[:,None,None] * np.exp(-0.5 * np.maximum(sq_dist, 0))
+
+  # means and variances (including noise) of all outputs at x: t x M, variance is None if with_var is False
+  def predict(self, x, with_var = True):
+    (means, variances) = ([], [])
+    for start in xrange(0, x.shape[0], self.chunk_size):
+      k_star = self.kernel(x[start:start+self.chunk_size])
+      means.append(np.matmul(k_star, self.alpha)[:,:,0].T)
+      if with_var:
+        var = np.empty((k_star.shape[1], len(self.posteriors)))
+        for m in xrange(len(self.posteriors)):
+          v = la.solve_triangular(self.chol[m], k_star[m].T, lower = True, check_finite = False)
+          var[:,m] = self.variance[m] - (v*v).sum(0) + self.noise_var[m]
+        variances.append(var)
+    mean = np.vstack(means) * self.std_y + self.mean_y
+    if not with_var:
+      return (mean, None)
+    return (mean, np.vstack(variances) * self.std_y**2)
+
+
+# posteriors of the saved models of gp_reg_sep.py, one per output column
+# a posterior is stale if the training data changed since its model was saved
+# a save of other inputs (trained with other --weather columns or --win-size) cannot be used at all, IOError
+# with history, only the last history training windows are conditioned on (for online updates)
+def load_sep_posteriors(train_x, train_y, save_pattern = "saves/sep_model_save_%d.npz", history = None):
+  fingerprint = model_store.fingerprint(train_x, train_y)
+  posteriors = []
+  for m in xrange(train_y.shape[1]):
+    save = model_store.load_model(save_pattern % m)
+    if save is None or "mean_train_x" not in save:
+      raise IOError("no saved model with normalization for column %d, run gp_reg_sep.py first" % m)
+    # saved normalization of each input and [variance, lengthscales, noise variance]
+    if save["mean_train_x"].shape[0] != train_x.shape[1] or save["params"].shape[0] != train_x.shape[1] + 2:
+      raise IOError("stale save %s: trained on %d inputs, the data has %d" %
+                    (save_pattern % m, save["mean_train_x"].shape[0], train_x.shape[1]))
+    posterior = GPPosterior(train_x[-history:] if history else train_x,
+                            train_y[-history:,m:m+1] if history else train_y[:,m:m+1], save["params"], save)
+    posterior.stale = save["fingerprint"] != fingerprint
+    if posterior.stale:
+      print "warning: training data changed since " + save_pattern % m + " was saved"
+    posteriors.append(posterior)
+  return posteriors
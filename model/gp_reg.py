@@ -0,0 +1,30 @@
+# generic version of gp_reg_sep.py for the volume and the travel time task
+# a separate ARD RBF GP model for each output column of the window csv, the columns are read from its header
+# (y_1-0_3: tollgate 1, direction 0, 4th window after the inputs; y_A-2_3: route from intersection A to tollgate 2)
+# all tasks are loaded once and their models are trained in one process (or one pool of workers),
+# the predictions of each task are written in the submission format of the task, see gp_sep.py
+# Usage: python gp_reg.py [--task volume travel_time] [--jobs 4] [--model sparse] [--predict-only] [--fallback median]
+
+import argparse
+import datetime as dt
+import gp_sep
+import profiling
+import window_data
+
+
+# settings
+output_prefix = "../prediction/"+dt.datetime.strftime(dt.datetime.now(),"%Y-%m-%d_%H:%M:%S")
+
+parser = argparse.ArgumentParser(description="Separate ARD RBF GP model for each output column of each task")
+parser.add_argument('--task',
+  dest='tasks',
+  action='store',
+  nargs='+',
+  help='Tasks to train and predict',
+  choices=sorted(window_data.tasks.keys()),
+  default=['volume', 'travel_time'])
+gp_sep.add_sep_args(parser)
+args = parser.parse_args()
+profiling.configure(args)
+
+gp_sep.run(args, args.tasks, dict((task, "%s_%s.csv" % (output_prefix, task)) for task in args.tasks))
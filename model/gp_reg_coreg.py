@@ -0,0 +1,109 @@
+# this models the problem as a regresssoin problem
+# data inputs consists a 2-hour window (divided to 20-min frames) of volumns and time information
+# data outputs are the 20-min frames of volumn of all gates, directions and shifts after the 2-hour window
+# a single multi-output GP with an intrinsic coregionalization model (see gp_coreg.py): one ARD RBF kernel on the
+# inputs, like gp_reg_joint.py, times a learned covariance between the outputs (low rank plus diagonal)
+# stage 1 fits the input kernel as gp_reg_joint.py does, stage 2 fits the output covariance and noise with the
+# Kronecker solver, which costs O(n^3 + n P^2) once instead of the O(n^3) per output of gp_reg_sep.py
+
+import numpy as np
+import datetime as dt
+import argparse
+import time
+import GPy
+import gp_coreg
+import gp_models
+import model_store
+import profiling
+import weather
+import window_data
+
+
+# settings
+train_filename = "../dataSets/training/volume_table6_training_20min_avg_6_window.csv"
+test_filename = "../dataSets/testing_phase1/volume_table6_test1_20min_avg_6_window.csv"
+output_filename = "../prediction/"+dt.datetime.strftime(dt.datetime.now(),"%Y-%m-%d_%H:%M:%S")+".csv"
+save_filename = "saves/coreg_model_save.npz"
+max_iters = 200
+
+parser = argparse.ArgumentParser(description="Multi-output GP with coregionalized outputs for all gates, directions and shifts")
+parser.add_argument('--rank',
+  dest='rank',
+  action='store',
+  help='Rank of the learned output covariance on top of its diagonal',
+  type=int,
+  default=2)
+gp_models.add_optimizer_args(parser)
+model_store.add_store_args(parser)
+weather.add_weather_args(parser)
+profiling.addProfileArgs(parser)
+args = parser.parse_args()
+profiling.configure(args)
+
+print "output to: " + output_filename
+
+# load data
+(train_header, train_x, train_y, test_x, test_times) = window_data.load_data(train_filename, test_filename,
+  weather_columns = weather.selected_columns(args), weather_fill = args.weather_fill)
+
+
+# load the last saved model, training warm starts from it and prediction-only runs use it as it is
+(num_of_samples, num_of_features) = train_x.shape
+num_of_outputs = train_y.shape[1]
+data_fingerprint = model_store.fingerprint(train_x, train_y)
+save = None if args.cold_start else model_store.load_model(save_filename)
+if save is not None and save["params"].shape != (num_of_features + num_of_outputs * (args.rank + 1) + 1,):
+  save = None
+predict_only = args.predict_only and save is not None and "mean_train_x" in save
+
+# normalize data, with the normalization of the saved model when predicting only
+with profiling.stage("normalize", rows = num_of_samples, inputs = num_of_features, outputs = num_of_outputs):
+  stats = save if predict_only else model_store.normalization(train_x, train_y)
+  norm_train_x = (train_x - stats["mean_train_x"]) / stats["std_train_x"]
+  norm_train_y = (train_y - stats["mean_train_y"]) / stats["std_train_y"]
+  norm_test_x = (test_x - stats["mean_train_x"]) / stats["std_train_x"]
+
+start = time.time()
+if predict_only:
+  if save["fingerprint"] != data_fingerprint:
+    print "warning: training data changed since " + save_filename + " was saved"
+  m = gp_coreg.CoregionalizedGP(norm_train_x, norm_train_y, save["params"][:num_of_features], args.rank)
+  m.set_param_array(save["params"])
+else:
+  # stage 1: input kernel shared by all outputs
+  print "training input kernel ..."
+  kernel = gp_models.ard_rbf_kernel(num_of_features)
+  if save is not None:
+    print "starting from " + save_filename
+    kernel.lengthscale = save["params"][:num_of_features]
+  joint = GPy.models.GPRegression(norm_train_x, norm_train_y, kernel)
+  gp_models.optimize(joint, max_iters, args.optimizer_messages, step = "input_kernel")
+  print "done in %.1f s" % (time.time() - start)
+
+  # stage 2: output covariance and noise with the input kernel fixed
+  print "training output covariance ..."
+  m = gp_coreg.CoregionalizedGP(norm_train_x, norm_train_y, kernel.lengthscale.values, args.rank)
+  if save is not None:
+    m.set_output_cov(save["params"][num_of_features:num_of_features + num_of_outputs*args.rank],
+                     save["params"][num_of_features + num_of_outputs*args.rank:-1], save["params"][-1])
+  else:
+    m.init_output_cov(float(kernel.variance), float(joint.likelihood.variance))
+  with profiling.stage("optimize", step = "output_cov") as counters:
+    info = m.fit(max_iters = max_iters, messages = args.optimizer_messages)
+    counters.update({"iterations": info["nit"], "function_evals": info["funcalls"], "status": info["warnflag"],
+                     "log_likelihood": m.log_likelihood()})
+  model_store.save_model(save_filename, m, stats, data_fingerprint)
+  print "done, log likelihood %.2f" % m.log_likelihood()
+print "model ready in %.1f s" % (time.time() - start)
+
+# testing
+print "testing ..."
+with profiling.stage("predict", rows = test_x.shape[0]):
+  (pred_mean, pred_var) = m.predict(norm_test_x, with_var = False)
+pred_y = pred_mean * stats["std_train_y"] + stats["mean_train_y"]
+print "done"
+
+
+# output prediction
+window_data.write_predictions(output_filename, "volume", window_data.output_targets(train_header), test_times,
+                              (pred_y[:,m] for m in xrange(pred_y.shape[1])))
@@ -12,6 +12,11 @@ import scipy as sc
 import string
 import sys
 import datetime as dt
+import argparse
+import gp_models
+import model_store
+import profiling
+import window_data
 
 
 # settings
@@ -20,86 +25,57 @@ test_filename = "../dataSets/testing_phase1/volume_table6_test1_20min_avg_6_wind
 output_filename = "../prediction/"+dt.datetime.strftime(dt.datetime.now(),"%Y-%m-%d_%H:%M:%S")+".csv"
 max_iters = 200
 
+parser = argparse.ArgumentParser(description="Single ARD RBF GP model for all gates, directions and shifts")
+gp_models.add_model_args(parser)
+model_store.add_store_args(parser)
+profiling.addProfileArgs(parser)
+args = parser.parse_args()
+profiling.configure(args)
+
 print "output to: " + output_filename
 
 # load data
-
-train_header = []
-test_header = []
-train_x = []
-train_y = []
-test_x  = []
-test_times = []
-
-print "load traininging data ..."
-with open(train_filename, "r") as f:
-  lineNum = 0
-  for line in f:
-    lineNum += 1
-    tokens = string.split(line[0:-1], ","); # remove \n
-    if lineNum == 1: # skip header
-      train_header =  tokens
-      continue
-    if len(tokens) != 63:
-      print "Invalid input dimension %d." % (len(tokens))
-      exit()
-
-    time = dt.datetime.strptime(tokens[1], "%Y-%m-%d %H:%M:%S")
-    inputs = [time.hour*3600+time.minute*60+time.second, time.weekday()] +  [float(tok) for tok in tokens[3:33]]
-    outputs = [float(tok) for tok in tokens[33:]]
-    train_x.append(inputs)
-    train_y.append(outputs)
-print "done"
-
-print "load test data ..."
-with open(test_filename, "r") as f:
-  lineNum = 0
-  for line in f:
-    lineNum += 1
-    tokens = string.split(line[0:-1], ","); # remove \n
-    if lineNum == 1: # skip header
-      test_header =  tokens
-      continue
-    if len(tokens) != 33:
-      print "Invalid input dimension %d." % (len(tokens))
-      exit()
-
-    time = dt.datetime.strptime(tokens[1], "%Y-%m-%d %H:%M:%S")
-    inputs = [time.hour*3600+time.minute*60+time.second, time.weekday()] +  [float(tok) for tok in tokens[3:33]]
-    test_x.append(inputs)
-    test_times.append(time)
-
-print "done"
+(train_header, train_x, train_y, test_x, test_times) = window_data.load_data(train_filename, test_filename)
 
 
-# normalize data
-train_x = np.array(train_x)
-train_y = np.array(train_y)
-test_x  = np.array(test_x)
+# load the last saved model, training warm starts from it and prediction-only runs use it as it is
+data_fingerprint = model_store.fingerprint(train_x, train_y)
+save_filename = 'saves/joint_%smodel_save.npz'%(gp_models.save_prefix(args.model))
+save = None if args.cold_start else model_store.load_model(save_filename)
+predict_only = args.predict_only and save is not None and "mean_train_x" in save
 
+# normalize data, with the normalization of the saved model when predicting only
 (num_of_samples, num_of_features) = train_x.shape
+with profiling.stage("normalize", rows = num_of_samples, inputs = num_of_features, outputs = train_y.shape[1]):
+  stats = save if predict_only else model_store.normalization(train_x, train_y)
 
-mean_train_x = np.mean(train_x, 0)
-std_train_x  = np.std (train_x, 0)
-norm_train_x = (train_x - mean_train_x) / std_train_x
+  mean_train_x = stats["mean_train_x"]
+  std_train_x  = stats["std_train_x"]
+  norm_train_x = (train_x - mean_train_x) / std_train_x
 
-mean_train_y = np.mean(train_y, 0)
-std_train_y  = np.std (train_y, 0)
-norm_train_y = (train_y - mean_train_y) / std_train_y
+  mean_train_y = stats["mean_train_y"]
+  std_train_y  = stats["std_train_y"]
+  norm_train_y = (train_y - mean_train_y) / std_train_y
 
-norm_test_x = (test_x - mean_train_x) / std_train_x
+  norm_test_x = (test_x - mean_train_x) / std_train_x
 
 # setup models
-kernel = GPy.kern.RBF(num_of_features, variance = 1., lengthscale=1., ARD = True)
-m = GPy.models.GPRegression(norm_train_x, norm_train_y, kernel)
-
-# training
-print "training ..."
-m.optimize(messages=True, max_iters = max_iters)
-np.save('saves/joint_model_save.npy', m.param_array)
-m.kern.plot_ARD()
-plt.show()
-print "done"
+kernel = gp_models.ard_rbf_kernel(num_of_features)
+m = gp_models.build_model(norm_train_x, norm_train_y, kernel, args.model, args.inducing)
+if save is not None and model_store.set_params(m, save["params"]):
+  print "starting from " + save_filename
+
+if predict_only:
+  if save["fingerprint"] != data_fingerprint:
+    print "warning: training data changed since " + save_filename + " was saved"
+else:
+  # training
+  print "training ..."
+  gp_models.optimize(m, max_iters, args.optimizer_messages)
+  model_store.save_model(save_filename, m, stats, data_fingerprint)
+  m.kern.plot_ARD()
+  plt.show()
+  print "done"
 
 #(pred_mean, pred_var) = m.predict(norm_train_x)
 #plt.plot(norm_train_y[:,1], "-")
@@ -108,28 +84,12 @@ print "done"
 
 # testing
 print "testing ..."
-(pred_mean, pred_var) = m.predict(norm_test_x)
+with profiling.stage("predict", rows = test_x.shape[0]):
+  (pred_mean, pred_var) = m.predict(norm_test_x)
 pred_y = pred_mean * std_train_y + mean_train_y
 print "done"
 
 
 # output prediction
-
-with open(output_filename, "w" ) as f:
-  f.write('tollgate_id,time_window,direction,volume\n')
-  for n in xrange(test_x.shape[0]):
-    for m in xrange(train_y.shape[1]):
-      h        = train_header[33+m]
-      gate_num = int(h[2])
-      dir_num  = int(h[4])
-      shift    = int(h[6])
-
-      time       = test_times[n]
-      time_start = time       + dt.timedelta(minutes = 20*(shift+1))
-      time_end   = time_start + dt.timedelta(minutes = 20)
-
-      f.write('%d,"[%s,%s)",%d,%f\n' %(gate_num, \
-            dt.datetime.strftime(time_start, "%Y-%m-%d %H:%M:%S"), \
-            dt.datetime.strftime(time_end, "%Y-%m-%d %H:%M:%S"), \
-            dir_num, \
-            pred_y[n,m]))
+window_data.write_predictions(output_filename, "volume", window_data.output_targets(train_header), test_times,
+                              (pred_y[:,m] for m in xrange(pred_y.shape[1])))
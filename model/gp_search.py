@@ -0,0 +1,225 @@
+# hyperparameter search for the separate GP models over kernel families, window sizes and restarts
+# a trial trains the models of the searched output columns on the training data before the last --holdout-days days
+# and scores them on the data points of those days (KDD MAPE)
+# trials run in a pool of worker processes; after --prune-iters optimizer iterations a trial is scored once and
+# pruned if it is worse than the median of the trials recorded so far at that point (median pruning)
+# every finished or pruned trial is appended to the results table, an interrupted search skips them when resumed
+# all window sizes are derived from the base window series of the task (python utils.py in scripts/ writes it),
+# so sweeping window sizes does not need a window csv per size
+# Usage: python gp_search.py [--task volume] [--kernels rbf matern52] [--win-sizes 4 6] [--restarts 2] [--jobs 4]
+
+import argparse
+import csv
+import multiprocessing
+import os
+import time
+import numpy as np
+import gp_models
+import metrics
+import model_store
+import window_data
+
+
+# settings
+max_iters = 200
+result_keys = ["trial", "kernel", "win_size", "restart", "status", "partial_mape", "mape", "fit_s"]
+
+parser = argparse.ArgumentParser(description="Search kernel family, window size and restarts with median pruning")
+parser.add_argument('--task',
+  dest='task',
+  action='store',
+  help='Task to search',
+  choices=sorted(window_data.tasks.keys()),
+  default='volume')
+parser.add_argument('--kernels',
+  dest='kernels',
+  action='store',
+  nargs='+',
+  help='Kernel families',
+  choices=gp_models.kernel_families,
+  default=gp_models.kernel_families)
+parser.add_argument('--win-sizes',
+  dest='win_sizes',
+  action='store',
+  nargs='+',
+  help='Numbers of 20-min windows of the inputs (and outputs)',
+  type=int,
+  default=[6])
+parser.add_argument('--restarts',
+  dest='restarts',
+  action='store',
+  help='Restarts per kernel and window size, restart 0 starts from unit parameters, others from random ones',
+  type=int,
+  default=2)
+parser.add_argument('--columns',
+  dest='columns',
+  action='store',
+  nargs='+',
+  help='Output columns to model, e.g. 1-0_0 (default: all columns of every window size)',
+  default=None)
+parser.add_argument('--holdout-days',
+  dest='holdout_days',
+  action='store',
+  help='Days at the end of the training data used for validation',
+  type=int,
+  default=2)
+parser.add_argument('--max-iters',
+  dest='max_iters',
+  action='store',
+  help='Optimizer iterations per model',
+  type=int,
+  default=max_iters)
+parser.add_argument('--prune-iters',
+  dest='prune_iters',
+  action='store',
+  help='Optimizer iterations before a trial is scored for pruning',
+  type=int,
+  default=20)
+parser.add_argument('--prune-factor',
+  dest='prune_factor',
+  action='store',
+  help='Prune a trial if its partial MAPE exceeds the median partial MAPE times this factor',
+  type=float,
+  default=1.)
+parser.add_argument('--min-trials',
+  dest='min_trials',
+  action='store',
+  help='Recorded trials needed before pruning starts',
+  type=int,
+  default=3)
+parser.add_argument('--results',
+  dest='results',
+  action='store',
+  help='Results table, appended to and resumed from, use a new one for other columns or iterations (default: saves/search_<task>.csv)',
+  default=None)
+parser.add_argument('--jobs',
+  dest='jobs',
+  action='store',
+  help='Number of trials run in parallel worker processes',
+  type=int,
+  default=1)
+gp_models.add_model_args(parser)
+args = parser.parse_args()
+results_filename = args.results or "saves/search_%s.csv" % args.task
+
+
+# rows of the results table, a row cut off by an interrupted write is skipped
+def read_results():
+  if not os.path.exists(results_filename):
+    return []
+  with open(results_filename, "r") as f:
+    return [row for row in csv.DictReader(f) if row.get("fit_s")]
+
+
+def append_result(row):
+  is_new = not os.path.exists(results_filename)
+  with open(results_filename, "a") as f:
+    if is_new:
+      f.write(",".join(result_keys) + "\n")
+    f.write(",".join(str(row[k]) for k in result_keys) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+
+# training and validation data of every window size, loaded before the pool is created
+series_filename = window_data.tasks[args.task]["series"]
+if not os.path.exists(series_filename):
+  print "%s not found, run python utils.py in scripts/ first" % series_filename
+  exit()
+base_sec = window_data.utils.loadSeries(series_filename)["base_sec"]
+datasets = {}
+for win_size in args.win_sizes:
+  (header, x, y, times) = window_data.load_series_file(series_filename, win_size)
+  time_of_win = np.array(times, dtype = "datetime64[s]").astype(np.int64)
+  (win_start, output_end) = (time_of_win - (win_size - 1) * base_sec, time_of_win + (win_size + 1) * base_sec)
+  origin = output_end.max() // 86400 * 86400 - args.holdout_days * 86400
+  (is_train, is_val) = (output_end <= origin, win_start >= origin)
+  datasets[win_size] = {"train_x": x[is_train], "train_y": y[is_train], "val_x": x[is_val], "val_y": y[is_val],
+                        "names": ["%s-%s_%d" % t for t in window_data.output_targets(header)]}
+
+names = [datasets[win_size]["names"] for win_size in args.win_sizes]
+columns = args.columns or [n for n in names[0] if all(n in other for other in names)]
+for win_size in args.win_sizes:
+  missing = [c for c in columns if c not in datasets[win_size]["names"]]
+  if missing:
+    print "window size %d has no output column %s" % (win_size, ", ".join(missing))
+    exit()
+
+
+def build_column_model(d, m, kernel_family, params = None):
+  (mean_x, std_x) = (np.mean(d["train_x"], 0), np.std(d["train_x"], 0))
+  (mean_y, std_y) = (np.mean(d["train_y"][:,m:m+1], 0), np.std(d["train_y"][:,m:m+1], 0))
+  std_x[std_x == 0] = 1.
+  std_y[std_y == 0] = 1.
+  kernel = gp_models.build_kernel(kernel_family, d["train_x"].shape[1], 86400. / std_x[0])
+  model = gp_models.build_model((d["train_x"] - mean_x) / std_x, (d["train_y"][:,m:m+1] - mean_y) / std_y,
+                                kernel, args.model, args.inducing)
+  if params is not None:
+    model_store.set_params(model, params)
+  return (model, lambda pred: pred * std_y + mean_y, (d["val_x"] - mean_x) / std_x)
+
+
+# optimize the models of all columns for iters iterations, starting from params (or a new start)
+# only the parameters are kept between the two stages, so one model is in memory at a time
+def optimize_columns(d, kernel_family, restart, iters, params = None):
+  (new_params, preds) = ([], [])
+  for (i, name) in enumerate(columns):
+    m = d["names"].index(name)
+    (model, denormalize, val_x) = build_column_model(d, m, kernel_family, None if params is None else params[i])
+    if params is None and restart > 0:
+      np.random.seed(restart * 1000 + i)
+      model.randomize()
+    model.optimize(max_iters = iters)
+    new_params.append(model.param_array.copy())
+    preds.append(denormalize(model.predict(val_x)[0][:,0]))
+  actual = d["val_y"][:, [d["names"].index(name) for name in columns]]
+  return (new_params, metrics.mape(np.column_stack(preds), actual))
+
+
+def run_trial(trial):
+  (kernel_family, win_size, restart) = trial
+  d = datasets[win_size]
+  row = {"trial": "%s_%d_%d" % trial, "kernel": kernel_family, "win_size": win_size, "restart": restart,
+         "status": "done", "mape": ""}
+  start = time.time()
+
+  (params, row["partial_mape"]) = optimize_columns(d, kernel_family, restart, args.prune_iters)
+  partials = [float(r["partial_mape"]) for r in read_results()]
+  if len(partials) >= args.min_trials and row["partial_mape"] > np.median(partials) * args.prune_factor:
+    row["status"] = "pruned"
+  elif args.max_iters > args.prune_iters:
+    (params, row["mape"]) = optimize_columns(d, kernel_family, restart, args.max_iters - args.prune_iters, params)
+  else:
+    row["mape"] = row["partial_mape"]
+
+  row["fit_s"] = "%.1f" % (time.time() - start)
+  return row
+
+
+# trials not in the results table yet
+done = set(r["trial"] for r in read_results())
+trials = [(k, w, r) for w in args.win_sizes for k in args.kernels for r in xrange(args.restarts)]
+pending = [t for t in trials if "%s_%d_%d" % t not in done]
+print "%d trials, %d in %s already, %d columns: %s" % (len(trials), len(trials) - len(pending), results_filename,
+  len(columns), " ".join(columns))
+
+if args.jobs > 1 and pending:
+  pool = multiprocessing.Pool(args.jobs)
+  rows = pool.imap_unordered(run_trial, pending)
+else:
+  rows = (run_trial(t) for t in pending)
+
+print "%24s %8s %10s %10s %8s" % ("trial", "status", "partial", "MAPE", "fit s")
+for row in rows:
+  append_result(row)
+  print "%24s %8s %10.4f %10s %8s" % (row["trial"], row["status"], row["partial_mape"],
+    row["mape"] if row["mape"] == "" else "%.4f" % row["mape"], row["fit_s"])
+
+if args.jobs > 1 and pending:
+  pool.close()
+  pool.join()
+
+finished = [r for r in read_results() if r["status"] == "done"]
+if finished:
+  best = min(finished, key = lambda r: float(r["mape"]))
+  print "best trial: %s, MAPE %s" % (best["trial"], best["mape"])
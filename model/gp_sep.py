@@ -0,0 +1,169 @@
+# separate ARD RBF GP model for each output column of the window csv of a task, shared by gp_reg.py and gp_reg_sep.py
+# the columns are read from its header
+# (y_1-0_3: tollgate 1, direction 0, 4th window after the inputs; y_A-2_3: route from intersection A to tollgate 2)
+# all tasks are loaded once and their models are trained in one process (or one pool of workers),
+# the predictions of each task are written in the submission format of the task
+
+import itertools
+import multiprocessing
+import numpy as np
+import baselines
+import gp_models
+import gp_posterior
+import model_store
+import profiling
+import weather
+import window_data
+
+
+# settings
+max_iters = 200
+
+
+def add_sep_args(parser):
+  parser.add_argument('--jobs',
+    dest='jobs',
+    action='store',
+    help='Number of models trained in parallel worker processes',
+    type=int,
+    default=1)
+  gp_models.add_model_args(parser)
+  model_store.add_store_args(parser)
+  weather.add_weather_args(parser)
+  baselines.add_fallback_args(parser)
+  profiling.addProfileArgs(parser)
+
+
+# data of every task and the arguments of the run, set before the workers are forked so they share them
+# instead of receiving a pickled copy
+data = {}
+options = None
+
+
+# load and normalize the data of a task
+def load_task(task):
+  print "task: " + task
+  (train_header, train_x, train_y, test_x, test_times) = window_data.load_data(window_data.tasks[task]["train"],
+    window_data.tasks[task]["test"], weather_columns = weather.selected_columns(options),
+    weather_fill = options.weather_fill)
+  with profiling.stage("normalize", task = task, rows = train_x.shape[0], outputs = train_y.shape[1]):
+    normalization = model_store.normalization(train_x, train_y)
+    fingerprint = model_store.fingerprint(train_x, train_y)
+  return {"train_x": train_x, "train_y": train_y, "test_x": test_x, "test_times": test_times,
+          "targets": window_data.output_targets(train_header),
+          "stats": normalization, "fingerprint": fingerprint,
+          "fallback_y": baselines.fallback_predictions(options.fallback, train_x, train_y, test_x)}
+
+
+def save_pattern(task, backend):
+  return window_data.tasks[task]["saves"].replace("%s", gp_models.save_prefix(backend))
+
+
+# train the model of output column m of a task and predict its test data
+# training warm starts from the last saved parameters, prediction-only runs use them as they are
+def train_model(job):
+  (task, m) = job
+  d = data[task]
+  print "building %s model for %s-%s_%d" % ((task,) + d["targets"][m])
+  save_filename = save_pattern(task, options.model) % m
+  save = None if options.cold_start else model_store.load_model(save_filename)
+  # a save of other inputs (other --weather columns or --win-size) is of no use, not even for a warm start
+  if save is not None and "mean_train_x" in save and save["mean_train_x"].shape[0] != d["train_x"].shape[1]:
+    print "%s was trained on %d inputs, the data has %d, retraining" % (save_filename,
+      save["mean_train_x"].shape[0], d["train_x"].shape[1])
+    save = None
+  predict_only = options.predict_only and save is not None and "mean_train_x" in save
+
+  # normalization of the saved model when predicting only, of the current training data otherwise
+  if predict_only:
+    stats = dict((k, save[k]) for k in ["mean_train_x", "std_train_x", "mean_train_y", "std_train_y"])
+  else:
+    stats = {"mean_train_x": d["stats"]["mean_train_x"], "std_train_x": d["stats"]["std_train_x"],
+             "mean_train_y": d["stats"]["mean_train_y"][m:m+1], "std_train_y": d["stats"]["std_train_y"][m:m+1]}
+  model_train_x = (d["train_x"] - stats["mean_train_x"]) / stats["std_train_x"]
+  model_train_y = (d["train_y"][:,m:m+1] - stats["mean_train_y"]) / stats["std_train_y"]
+
+  # setup models
+  kernel = gp_models.ard_rbf_kernel(d["train_x"].shape[1])
+  model = gp_models.build_model(model_train_x, model_train_y, kernel, options.model, options.inducing)
+  if save is not None and model_store.set_params(model, save["params"]):
+    print "starting from " + save_filename
+
+  if predict_only:
+    if save["fingerprint"] != d["fingerprint"]:
+      print "warning: training data changed since " + save_filename + " was saved"
+      if d["fallback_y"] is not None:
+        print "serving the baseline instead"
+        return d["fallback_y"][:,m:m+1]
+  else:
+    print "training ..."
+    gp_models.optimize(model, max_iters, options.optimizer_messages and options.jobs == 1, task = task, column = m)
+    model_store.save_model(save_filename, model, stats, d["fingerprint"])
+    print "done"
+
+  with profiling.stage("predict", task = task, column = m, rows = d["test_x"].shape[0]):
+    (pred_mean, pred_var) = model.predict((d["test_x"] - stats["mean_train_x"]) / stats["std_train_x"])
+  return pred_mean * stats["std_train_y"] + stats["mean_train_y"]
+
+
+# the baseline of a task serves the columns whose model fails to train
+def predict_column(job):
+  (task, m) = job
+  try:
+    return train_model(job)
+  except Exception as e:
+    if data[task]["fallback_y"] is None:
+      raise
+    target = "%s-%s_%d" % data[task]["targets"][m]
+    print "%s model for %s failed (%s), serving the baseline instead" % (task, target, e)
+    return data[task]["fallback_y"][:,m:m+1]
+
+
+# prediction-only runs of the exact models score all columns of a task in one batched pass
+# if a save is missing or its posterior cannot be factorized, the models are built (or fall back) one by one
+def predict_saved(task):
+  d = data[task]
+  try:
+    posteriors = gp_posterior.load_sep_posteriors(d["train_x"], d["train_y"], save_pattern(task, "exact"))
+  except (IOError, np.linalg.LinAlgError) as e:
+    print str(e) + ", building the models instead"
+    return None
+  with profiling.stage("predict", task = task, batched = True, rows = d["test_x"].shape[0]):
+    (pred_mean, pred_var) = gp_posterior.BatchPosterior(posteriors).predict(d["test_x"], with_var = False)
+  if d["fallback_y"] is not None:
+    stale = np.array([p.stale for p in posteriors])
+    pred_mean[:,stale] = d["fallback_y"][:,stale]
+  return [pred_mean[:,m:m+1] for m in xrange(pred_mean.shape[1])]
+
+
+# load the tasks, train (or load) their models and write the predictions of each task to output_filenames[task]
+# the predictions of all jobs come in task and column order, for any number of jobs
+def run(args, tasks, output_filenames):
+  global options
+  options = args
+  for task in tasks:
+    data[task] = load_task(task)
+
+  batched = {}
+  if args.predict_only and args.model == "exact" and not args.cold_start:
+    for task in tasks:
+      pred = predict_saved(task)
+      if pred is not None:
+        batched[task] = pred
+
+  jobs = [(task, m) for task in tasks if task not in batched for m in xrange(data[task]["train_y"].shape[1])]
+  if args.jobs > 1 and jobs:
+    pool = multiprocessing.Pool(args.jobs)
+    trained = pool.imap(predict_column, jobs)
+  else:
+    trained = itertools.imap(predict_column, jobs)
+
+  for task in tasks:
+    d = data[task]
+    print "output to: " + output_filenames[task]
+    pred_ys = batched[task] if task in batched else itertools.islice(trained, d["train_y"].shape[1])
+    window_data.write_predictions(output_filenames[task], task, d["targets"], d["test_times"], pred_ys)
+
+  if args.jobs > 1 and jobs:
+    pool.close()
+    pool.join()
@@ -0,0 +1,229 @@
+# long-running prediction service for the models of gp_reg_sep.py
+# the saved models and their normalization are loaded once and their posteriors (Cholesky factors and
+# weights) are kept in memory, so a request only evaluates the kernel against the training windows
+# Usage: python gp_server.py [--port 8017] [--socket /tmp/gp.sock] [--history 1000] [--train-file <window csv>]
+#                             [--weather [column ...]] [--weather-fill interp]
+#
+# POST /predict  {"time_of_win": "2016-10-18 07:40:00", "x": [30 window values], "variance": true}
+#   time_of_win is the start of the last input window, x the input windows in the order of the window csv
+#   the reply holds one forecast per output column: tollgate, direction, time window, mean and variance
+#   the number and width of the windows are the ones of the window csv (--train-file)
+#   with --weather (the one the models were trained with), the weather columns are joined at time_of_win,
+#   after the last observation of the weather tables that one is used
+# POST /observe  {"time_of_win": "2016-10-18 07:40:00", "x": [30 window values], "y": [30 output values]}
+#   a data point whose output windows have all closed, in the order of the window csv, is added to the posteriors
+#   with the hyperparameters kept fixed, O(n^2) per model (see gp_posterior.py), with --history the oldest data
+#   point is dropped once there are more, data points must come in time order, if a posterior cannot be updated
+#   the update is rejected and none of them changes
+# POST /reload   the scheduled re-optimization: the window csv and the saves of gp_reg_sep.py are read again
+#   (run utils.py --incremental and gp_reg_sep.py before) and the posteriors are refactorized
+# GET  /health   number of loaded models and training windows
+
+import argparse
+import BaseHTTPServer
+import SocketServer
+import copy
+import datetime as dt
+import json
+import os
+import sys
+import threading
+import time
+import numpy as np
+import gp_posterior
+import weather
+import window_data
+
+
+parser = argparse.ArgumentParser(description="Online prediction service for the separate GP models")
+parser.add_argument('--train-file',
+  dest='train_filename',
+  action='store',
+  help='Window csv the saved models were trained on',
+  default=window_data.tasks["volume"]["train"])
+parser.add_argument('--port',
+  dest='port',
+  action='store',
+  help='TCP port on localhost',
+  type=int,
+  default=8017)
+parser.add_argument('--socket',
+  dest='socket',
+  action='store',
+  help='Listen on this Unix socket instead of the TCP port',
+  default=None)
+parser.add_argument('--history',
+  dest='history',
+  action='store',
+  help='Condition on at most this many of the latest training windows, older ones are dropped by /observe',
+  type=int,
+  default=None)
+weather.add_weather_args(parser)
+args = parser.parse_args()
+
+
+# load models
+# columns holds the posterior of every output column, posteriors evaluates all of them, both are replaced as a whole
+# by /observe and /reload so requests in flight keep a consistent posterior, updates take update_lock
+# targets are the (tollgate, direction, shift) of the output columns and width the window width in seconds
+# weather holds the weather observations joined to the requests with --weather, None without it
+update_lock = threading.Lock()
+model = {}
+def load_models():
+  print "load traininging data ..."
+  weather_columns = weather.selected_columns(args)
+  (train_header, train_x, train_y, train_times) = window_data.load_window_file(args.train_filename,
+    weather_columns = weather_columns, weather_fill = args.weather_fill)
+  data = window_data.utils.loadWindowData(args.train_filename, window_data.input_windows(args.train_filename))
+  (n_in, n_out, width) = window_data.window_geometry(data)
+  print "done"
+
+  print "computing posteriors ..."
+  start = time.time()
+  columns = gp_posterior.load_sep_posteriors(train_x, train_y, history = args.history)
+  model.update({"columns": columns, "posteriors": gp_posterior.BatchPosterior(columns),
+                "last_time": np.datetime64(max(train_times), "s").astype(np.int64),
+                "targets": window_data.output_targets(train_header),
+                "num_of_inputs": train_x.shape[1] - 2 - len(weather_columns or []), "width": width,
+                "weather": weather.load_weather() if weather_columns else None})
+  print "done in %.1f s" % (time.time() - start)
+
+
+# a missing save, a save of other inputs (other --weather columns or window csv) or a posterior that cannot be
+# factorized even with jitter stops the server before it listens
+try:
+  load_models()
+except (IOError, np.linalg.LinAlgError) as e:
+  print "cannot load the models: %s" % e
+  sys.exit(1)
+
+
+# time of the last input window and the input row of a request
+def request_inputs(request):
+  values = np.asarray(request["x"], dtype = float)
+  if values.shape != (model["num_of_inputs"],):
+    raise ValueError("x has %d values, expected %d" % (values.size, model["num_of_inputs"]))
+  time_of_win = np.datetime64(request["time_of_win"], 's').astype(np.int64)
+  x = np.hstack([window_data.time_features(np.array([time_of_win]))[0], values])
+  if model["weather"] is not None:
+    x = np.hstack([x, weather.join_weather(model["weather"], np.array([time_of_win]), weather.selected_columns(args),
+                                           args.weather_fill)[0]])
+  return (time_of_win, x[None,:])
+
+
+def predict(request):
+  (time_of_win, x) = request_inputs(request)
+  with_var = request.get("variance", True)
+
+  (posteriors, targets, width) = (model["posteriors"], model["targets"], model["width"])
+  (mean, var) = posteriors.predict(x, with_var)
+  forecasts = []
+  last_window = dt.datetime.utcfromtimestamp(time_of_win)
+  for (m, (gate, direction, shift)) in enumerate(targets):
+    time_start = last_window + dt.timedelta(seconds = width*(shift+1))
+    forecasts.append({"tollgate_id": int(gate), "direction": int(direction),
+                      "time_window": "[%s,%s)" % (time_start, time_start + dt.timedelta(seconds = width)),
+                      "volume": float(mean[0,m]), "variance": None if var is None else float(var[0,m])})
+  return {"forecasts": forecasts}
+
+
+def observe(request):
+  (time_of_win, x) = request_inputs(request)
+  y = np.asarray(request["y"], dtype = float)
+  if y.shape != (len(model["targets"]),):
+    raise ValueError("y has %d values, expected %d" % (y.size, len(model["targets"])))
+  with update_lock:
+    if time_of_win <= model["last_time"]:
+      raise ValueError("time_of_win %s is not after the last training window %s" % (request["time_of_win"],
+                       dt.datetime.utcfromtimestamp(model["last_time"])))
+    start = time.time()
+    # slide copies and swap them in together, a column that fails leaves all of them as they were
+    # (slide replaces the arrays of a posterior instead of writing into them, so shallow copies do)
+    columns = [copy.copy(posterior) for posterior in model["columns"]]
+    for (m, posterior) in enumerate(columns):
+      posterior.slide(x, y[None,m:m+1], args.history)
+    model.update({"columns": columns, "posteriors": gp_posterior.BatchPosterior(columns), "last_time": time_of_win})
+    return {"training_windows": columns[0].x.shape[0], "update_s": time.time() - start}
+
+
+def reload_models():
+  with update_lock:
+    start = time.time()
+    load_models()
+    return {"training_windows": model["columns"][0].x.shape[0], "reload_s": time.time() - start}
+
+
+class PredictHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  # keep-alive, a client reuses its connection for every request
+  # the reply is buffered and sent in one write with Nagle off, otherwise every reply waits for a delayed ACK
+  protocol_version = "HTTP/1.1"
+  wbufsize = -1
+  disable_nagle_algorithm = True
+
+  def reply(self, code, body):
+    data = json.dumps(body)
+    self.send_response(code)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(data)))
+    self.end_headers()
+    self.wfile.write(data)
+
+  def do_GET(self):
+    if self.path == "/health":
+      self.reply(200, {"models": len(model["targets"]), "training_windows": model["columns"][0].x.shape[0]})
+    else:
+      self.reply(404, {"error": "unknown path " + self.path})
+
+  def do_POST(self):
+    body = self.rfile.read(int(self.headers.getheader("Content-Length", 0)))
+    handlers = {"/predict": predict, "/observe": observe, "/reload": lambda request: reload_models()}
+    # a failed /observe or /reload keeps serving the posteriors from before it
+    failures = {"/predict": "prediction failed", "/observe": "update rejected, the posteriors are unchanged",
+                "/reload": "cannot load the models"}
+    if self.path not in handlers:
+      self.reply(404, {"error": "unknown path " + self.path})
+      return
+    try:
+      self.reply(200, handlers[self.path](json.loads(body or "{}")))
+    except (ValueError, KeyError, TypeError) as e:
+      self.reply(400, {"error": str(e)})
+    except (IOError, np.linalg.LinAlgError) as e:
+      self.reply(500, {"error": "%s: %s" % (failures[self.path], e)})
+
+  def log_message(self, format, *args):
+    pass
+
+
+class UnixPredictHandler(PredictHandler):
+  # no TCP options on a Unix socket, and its clients have no address
+  disable_nagle_algorithm = False
+
+  def address_string(self):
+    return args.socket
+
+
+class TCPHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+  daemon_threads = True
+
+
+class UnixHTTPServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+  daemon_threads = True
+
+  def server_bind(self):
+    if os.path.exists(self.server_address):
+      os.remove(self.server_address)
+    SocketServer.UnixStreamServer.server_bind(self)
+
+
+# one thread per connection, so a kept-alive connection does not block the other clients
+if args.socket:
+  server = UnixHTTPServer(args.socket, UnixPredictHandler)
+  print "listening on " + args.socket
+else:
+  server = TCPHTTPServer(("127.0.0.1", args.port), PredictHandler)
+  print "listening on 127.0.0.1:%d" % args.port
+
+try:
+  server.serve_forever()
+except KeyboardInterrupt:
+  server.server_close()
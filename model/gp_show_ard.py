@@ -9,6 +9,8 @@ import scipy as sc
 import string
 import sys
 import datetime as dt
+import model_store
+import window_data
 
 
 if len(sys.argv) != 2:
@@ -20,60 +22,10 @@ train_filename = "../dataSets/training/volume_table6_training_20min_avg_6_window
 test_filename = "../dataSets/testing_phase1/volume_table6_test1_20min_avg_6_window.csv"
 
 # load data
-
-train_header = []
-test_header = []
-train_x = []
-train_y = []
-test_x  = []
-test_times = []
-
-print "load traininging data ..."
-with open(train_filename, "r") as f:
-  lineNum = 0
-  for line in f:
-    lineNum += 1
-    tokens = string.split(line[0:-1], ","); # remove \n
-    if lineNum == 1: # skip header
-      train_header =  tokens
-      continue
-    if len(tokens) != 63:
-      print "Invalid input dimension %d." % (len(tokens))
-      exit()
-
-    time = dt.datetime.strptime(tokens[1], "%Y-%m-%d %H:%M:%S")
-    inputs = [time.hour*3600+time.minute*60+time.second, time.weekday()] +  [float(tok) for tok in tokens[3:33]]
-    outputs = [float(tok) for tok in tokens[33:]]
-    train_x.append(inputs)
-    train_y.append(outputs)
-print "done"
-
-print "load test data ..."
-with open(test_filename, "r") as f:
-  lineNum = 0
-  for line in f:
-    lineNum += 1
-    tokens = string.split(line[0:-1], ","); # remove \n
-    if lineNum == 1: # skip header
-      test_header =  tokens
-      continue
-    if len(tokens) != 33:
-      print "Invalid input dimension %d." % (len(tokens))
-      exit()
-
-    time = dt.datetime.strptime(tokens[1], "%Y-%m-%d %H:%M:%S")
-    inputs = [time.hour*3600+time.minute*60+time.second, time.weekday()] +  [float(tok) for tok in tokens[3:33]]
-    test_x.append(inputs)
-    test_times.append(time)
-
-print "done"
+(train_header, train_x, train_y, test_x, test_times) = window_data.load_data(train_filename, test_filename)
 
 
 # normalize data
-train_x = np.array(train_x)
-train_y = np.array(train_y)
-test_x  = np.array(test_x)
-
 (num_of_samples, num_of_features) = train_x.shape
 
 mean_train_x = np.mean(train_x, 0)
@@ -89,15 +41,16 @@ norm_test_x = (test_x - mean_train_x) / std_train_x
 
 # compute labels
 dim      = int(sys.argv[1])
-h        = train_header[33+dim]
-print h + ": gate " + h[2] + " dir " + h[4] + " shift " + h[6] 
+h        = [name for name in train_header if name.startswith("y_")][dim]
+(gate_num, dir_num, shift) = window_data.parse_target(h)
+print h + ": gate " + gate_num + " dir " + dir_num + " shift " + str(shift)
 
 # load model
 kernel = GPy.kern.RBF(num_of_features, variance = 1., lengthscale=1., ARD = True)
 m_load = GPy.models.GPRegression(norm_train_x, np.reshape(norm_train_y[:,dim], (norm_train_x.shape[0], 1)), kernel, initialize=False)
 m_load.update_model(False)
 m_load.initialize_parameter()
-m_load[:] = np.load('saves/sep_model_save_%d.npy'%(dim))
+m_load[:] = model_store.load_model('saves/sep_model_save_%d.npz'%(dim))["params"]
 m_load.update_model(True) 
 
 # plot importance and performance on training data
@@ -0,0 +1,13 @@
+# evaluation metric of KDD Cup 2017
+# MAPE = mean over all (tollgate-direction or route, window) cells of |prediction - actual| / actual
+# cells whose actual value is 0 are skipped, the metric is undefined there
+
+import numpy as np
+
+
+def mape(pred, actual, axis = None):
+  pred   = np.asarray(pred, dtype = float)
+  actual = np.asarray(actual, dtype = float)
+  valid  = actual > 0
+  err    = np.where(valid, np.abs(pred - actual) / np.where(valid, actual, 1.), 0.)
+  return err.sum(axis) / np.maximum(valid.sum(axis), 1)
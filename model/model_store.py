@@ -0,0 +1,61 @@
+# store for trained GP models in saves/
+# a save holds the model parameters together with the normalization of the training data
+# (mean_train_x, std_train_x, mean_train_y, std_train_y) and a fingerprint of the training data,
+# so that training can warm start from it and prediction-only runs can skip optimization
+# older saves only hold model.param_array as .npy, they are still used for warm starts
+
+import hashlib
+import os
+import numpy as np
+
+
+def add_store_args(parser):
+  parser.add_argument('--cold-start',
+    dest='cold_start',
+    action='store_true',
+    help='Start optimization from unit kernel parameters instead of the last saved ones')
+  parser.add_argument('--predict-only',
+    dest='predict_only',
+    action='store_true',
+    help='Predict with the saved models and their normalization, skipping optimization')
+
+
+def fingerprint(train_x, train_y):
+  md5 = hashlib.md5()
+  for arr in [train_x, train_y]:
+    arr = np.ascontiguousarray(arr, dtype = np.float64)
+    md5.update(str(arr.shape))
+    md5.update(arr.tostring())
+  return md5.hexdigest()
+
+
+def save_model(filename, model, stats, data_fingerprint):
+  tmp_filename = filename[:-len(".npz")] + ".tmp.npz"
+  np.savez(tmp_filename, params = model.param_array, fingerprint = data_fingerprint, **stats)
+  os.rename(tmp_filename, filename)
+
+
+def load_model(filename):
+  if os.path.exists(filename):
+    save = dict(np.load(filename))
+    save["fingerprint"] = str(save["fingerprint"])
+    return save
+  legacy_filename = filename[:-len(".npz")] + ".npy"
+  if os.path.exists(legacy_filename):
+    return {"params": np.load(legacy_filename)}
+  return None
+
+
+# copy saved parameters into a freshly built model, False if they do not fit it
+def set_params(model, params):
+  if params.shape != model.param_array.shape:
+    return False
+  model.update_model(False)
+  model[:] = params
+  model.update_model(True)
+  return True
+
+
+def normalization(train_x, train_y):
+  return {"mean_train_x": np.mean(train_x, 0), "std_train_x": np.std(train_x, 0),
+          "mean_train_y": np.mean(train_y, 0), "std_train_y": np.std(train_y, 0)}
@@ -0,0 +1,114 @@
+# weather features (table 7) for the window data
+# weather is observed every 3 hours, the observations are joined to the last input window of each data point
+# by interpolation or carrying the last observation forward, with one searchsorted over the sorted observation times
+# the joined columns are cached next to the window cache of the window csv, keyed by the weather files and the windows
+#
+# weather_table7_training_update.csv fills a 10-day gap of weather_table7_training.csv and is shipped twice
+# (weather_table7_training_update.csv, weather_table-7_training_update.csv); files are read in the order listed,
+# files with the same content are read once and a later file wins for the same observation time
+
+import hashlib
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+import utils
+
+
+# settings
+weather_files = ["../dataSets/training/weather_table7_training.csv",
+                 "../weather_table7_training_update.csv",
+                 "../weather_table-7_training_update.csv",
+                 "../dataSets/testing_phase1/weather_table7_test1.csv"]
+default_columns = ["precipitation", "temperature", "wind_speed"]
+fill_methods = ["interp", "ffill"]
+
+
+def add_weather_args(parser):
+  parser.add_argument('--weather',
+    dest='weather',
+    action='store',
+    nargs='*',
+    help='Append weather columns to the inputs (default: ' + ' '.join(default_columns) + ')',
+    default=None)
+  parser.add_argument('--weather-fill',
+    dest='weather_fill',
+    action='store',
+    help='interp: linear between observations, ffill: last observation (no look-ahead)',
+    choices=fill_methods,
+    default='interp')
+
+
+# columns selected by --weather, None without it
+def selected_columns(args):
+  if args.weather is None:
+    return None
+  return args.weather or default_columns
+
+
+def file_md5(filename):
+  # a column store of scripts/column_store.py hashes its partitions
+  if os.path.isdir(filename):
+    md5 = hashlib.md5()
+    for part_file in utils.storePartitions(filename):
+      md5.update(file_md5(part_file))
+    return md5.hexdigest()
+  with open(filename, "rb") as f:
+    return hashlib.md5(f.read()).hexdigest()
+
+
+# observations of all existing weather files, sorted by time, one per time
+def load_weather(filenames = weather_files):
+  (seen, parts) = (set(), [])
+  for filename in filenames:
+    if not os.path.exists(filename):
+      continue
+    md5 = file_md5(filename)
+    if md5 not in seen:
+      seen.add(md5)
+      parts.append(utils.loadWeatherColumns(filename))
+  if not parts:
+    raise IOError("no weather file found in " + ", ".join(filenames))
+
+  weather = dict((k, np.concatenate([p[k] for p in parts])) for k in parts[0])
+  # stable sort keeps the file order within a time, the last one of each time wins
+  order = np.argsort(weather["time"], kind = "mergesort")
+  last = np.append(np.diff(weather["time"][order]) != 0, True)
+  return dict((k, v[order][last]) for (k, v) in weather.items())
+
+
+# position of each time between the observations: left observation and the weight of the right one
+def weather_index(obs_time, times):
+  right = np.clip(np.searchsorted(obs_time, times, side = "right"), 1, len(obs_time) - 1)
+  left = right - 1
+  weight = (times - obs_time[left]).astype(float) / np.maximum(obs_time[right] - obs_time[left], 1)
+  return (left, np.clip(weight, 0., 1.))
+
+
+def join_weather(weather, times, columns = default_columns, fill = "interp"):
+  if len(weather["time"]) == 1:
+    return np.tile([weather[c][0] for c in columns], (len(times), 1))
+  (left, weight) = weather_index(weather["time"], times)
+  if fill == "ffill":
+    weight = (weight >= 1.).astype(float)
+  return np.column_stack([weather[c][left] * (1 - weight) + weather[c][left + 1] * weight for c in columns])
+
+
+# weather columns of the data points of a window csv, through the cache
+def window_weather(csv_file, time_of_win, columns = default_columns, fill = "interp", filenames = weather_files):
+  md5 = hashlib.md5()
+  for filename in filenames:
+    if os.path.exists(filename):
+      md5.update(file_md5(filename))
+  md5.update(",".join(columns) + "," + fill)
+  md5.update(np.ascontiguousarray(time_of_win, dtype = np.int64).tostring())
+  cache_file = os.path.join(utils.windowCacheDir(csv_file), "weather_%s.npy" % md5.hexdigest())
+  if os.path.exists(cache_file):
+    return np.load(cache_file)
+
+  joined = join_weather(load_weather(filenames), np.asarray(time_of_win), columns, fill)
+  if os.path.isdir(os.path.dirname(cache_file)):
+    np.save(cache_file[:-len(".npy")] + ".tmp.npy", joined)
+    os.rename(cache_file[:-len(".npy")] + ".tmp.npy", cache_file)
+  return joined
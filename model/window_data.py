@@ -0,0 +1,248 @@
+# shared data loading for the GP models
+# the window matrices are memory-mapped from the binary cache written by scripts/utils.py,
+# the csv files are only parsed when their cache is missing or stale
+# inputs are the time of day (in seconds) and weekday of the last input window followed by the window values
+# weather columns (see weather.py) can be appended to the inputs
+# output columns are named y_<a>-<b>_<shift>, tollgate and direction for volume, intersection and tollgate for travel time
+
+import itertools
+import os
+import sys
+import datetime as dt
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+import profiling
+import utils
+import weather
+
+
+# window files and submission format of each task
+# rows are the key, formatted from a, b (of the column name) and the time window, and the predicted value
+# sample is the submission sample of the task, submissions are written in its row order and checked against it
+tasks = {
+  "volume": {
+    "train":  "../dataSets/training/volume_table6_training_20min_avg_6_window.csv",
+    "test":   "../dataSets/testing_phase1/volume_table6_test1_20min_avg_6_window.csv",
+    "header": "tollgate_id,time_window,direction,volume",
+    "key":    '%(a)s,"%(window)s",%(b)s',
+    "sample": "../submission_sample_volume.csv",
+    "saves":  "saves/sep_%smodel_save_%d.npz",
+    "series": "../dataSets/training/volume_table6_training_20min_series.npz"},
+  "travel_time": {
+    "train":  "../dataSets/training/trajectories_table5_training_20min_avg_6_window.csv",
+    "test":   "../dataSets/testing_phase1/trajectories_table5_test1_20min_avg_6_window.csv",
+    "header": "intersection_id,tollgate_id,time_window,avg_travel_time",
+    "key":    '%(a)s,%(b)s,"%(window)s"',
+    "sample": "../submission_sample_travelTime.csv",
+    "saves":  "saves/travel_time_sep_%smodel_save_%d.npz",
+    "series": "../dataSets/training/trajectories_table5_training_20min_series.npz"},
+}
+
+
+# (a, b, shift) of an output column, e.g. y_1-0_3 -> ("1", "0", 3) and y_A-2_3 -> ("A", "2", 3)
+def parse_target(name):
+  (target, shift) = name[len("y_"):].rsplit("_", 1)
+  (a, b) = target.split("-", 1)
+  return (a, b, int(shift))
+
+
+def output_targets(header):
+  return [parse_target(h) for h in header if h.startswith("y_")]
+
+
+# shifts of the input columns <a>-<b>_<shift> of a window header
+def input_shifts(header):
+  return [parse_target("y_" + h)[2] for h in header[3:] if not h.startswith("y_")]
+
+
+# number of input windows of a window csv, read from its header
+def input_windows(filename):
+  with open(filename, "r") as f:
+    return 1 + max(input_shifts(f.readline().strip().split(",")))
+
+
+# number of input and output windows and the window width (seconds) of window data loaded by utils.loadWindowData
+# or utils.seriesWindows, the last input window starts n_in - 1 windows after the first one
+def window_geometry(data):
+  header = list(data["header"])
+  n_in = 1 + max(input_shifts(header))
+  n_out = len(set(shift for (a, b, shift) in output_targets(header)))
+  if "win_size_sec" in data:
+    width = data["win_size_sec"]
+  elif n_in > 1:
+    width = (data["time_of_win"][0] - data["win_start"][0]) // (n_in - 1)
+  else:
+    # a data point every window
+    width = data["win_start"][1] - data["win_start"][0]
+  return (n_in, n_out, int(width))
+
+
+def time_features(time_of_win):
+  return np.column_stack([time_of_win % 86400, utils.epochWeekday(time_of_win)])
+
+
+def window_inputs(filename, data, weather_columns, weather_fill):
+  x = np.hstack([time_features(data["time_of_win"]), data["x"]])
+  if weather_columns:
+    x = np.hstack([x, weather.window_weather(filename, data["time_of_win"], weather_columns, weather_fill)])
+  times = [dt.datetime.utcfromtimestamp(t) for t in data["time_of_win"]]
+  return (data["header"], x, np.asarray(data["y"]), times)
+
+
+# win_size is the number of input windows, read from the header if None
+def load_window_file(filename, win_size = None, weather_columns = None, weather_fill = "interp"):
+  with profiling.stage("load", file = filename) as stats:
+    data = utils.loadWindowData(filename, win_size or input_windows(filename))
+    result = window_inputs(filename, data, weather_columns, weather_fill)
+    stats.update({"rows": result[1].shape[0], "inputs": result[1].shape[1]})
+  return result
+
+
+# data points of any window geometry from the base window series written by scripts/utils.py (see seriesWindows),
+# the same as load_window_file on the window csv of that geometry but without parsing any csv
+def load_series_file(filename, win_size, horizon = None, stride = 1, merge = 1, weather_columns = None,
+                     weather_fill = "interp"):
+  with profiling.stage("load", file = filename, win_size = win_size) as stats:
+    data = utils.seriesWindows(utils.loadSeries(filename), win_size, horizon, stride, merge)
+    result = window_inputs(filename, data, weather_columns, weather_fill)
+    stats.update({"rows": result[1].shape[0], "inputs": result[1].shape[1]})
+  return result
+
+
+def load_data(train_filename, test_filename, win_size = None, weather_columns = None, weather_fill = "interp"):
+  print "load traininging data ..."
+  (train_header, train_x, train_y, train_times) = load_window_file(train_filename, win_size,
+                                                                   weather_columns, weather_fill)
+  print "done"
+
+  print "load test data ..."
+  (test_header, test_x, test_y, test_times) = load_window_file(test_filename, win_size,
+                                                               weather_columns, weather_fill)
+  print "done"
+
+  if train_x.shape[1] != test_x.shape[1] or train_y.shape[1] == 0:
+    print "Invalid input dimension %d, %d." % (train_x.shape[1], test_x.shape[1])
+    exit()
+
+  return (train_header, train_x, train_y, test_x, test_times)
+
+
+# submission rows as columns: (a, b) pairs and the pair code, start of the time window (epoch seconds) and value
+def submission_columns(pairs, pair, start, value):
+  return {"pairs": list(pairs), "pair": np.asarray(pair), "start": np.asarray(start, dtype = np.int64),
+          "value": np.asarray(value)}
+
+
+# columns of a submission file of a task, all rows are split at once
+# without quotes and brackets every row has 5 fields, their order is given by the key format of the task
+def read_submission(filename, task):
+  with open(filename) as f:
+    f.readline()
+    text = f.read().replace('"', "").replace("[", "").replace(")", "").replace("\r", "").strip("\n")
+  fields = np.array(text.replace("\n", ",").split(",") if text else [], dtype = str).reshape(-1, 5)
+  names = (tasks[task]["key"] % {"a": "a", "b": "b", "window": "[start,end)"}).replace('"', "")
+  column = dict((name, k) for (k, name) in enumerate(names.replace("[", "").replace(")", "").split(",")))
+  (levels_a, codes_a) = utils.encodeColumn(fields[:,column["a"]])
+  (levels_b, codes_b) = utils.encodeColumn(fields[:,column["b"]])
+  (pairs, pair) = utils.combineCodes(levels_a, codes_a, levels_b, codes_b)
+  return submission_columns(pairs, pair, utils.parseTimeColumn(fields[:,column["start"]]), fields[:,4])
+
+
+# integer join keys of the rows of submissions: code of the (a, b) pair among the pairs of all of them and window start
+def join_keys(*submissions):
+  levels = sorted(set(itertools.chain.from_iterable(sub["pairs"] for sub in submissions)))
+  index = dict((p, k) for (k, p) in enumerate(levels))
+  return [np.array([index[p] for p in sub["pairs"]], dtype = np.int64)[sub["pair"]] * 2**32 + sub["start"]
+          for sub in submissions]
+
+
+# position of each row in the sample submission by an indexed join on the join keys, -1 for rows not in the sample
+def sample_positions(keys, sample_keys):
+  if len(sample_keys) == 0:
+    return np.full(len(keys), -1, int)
+  order = np.argsort(sample_keys, kind = "mergesort")
+  idx = np.minimum(np.searchsorted(sample_keys[order], keys), len(order) - 1)
+  return np.where(sample_keys[order][idx] == keys, order[idx], -1)
+
+
+def finite_values(values):
+  try:
+    return np.isfinite(values.astype(np.float64))
+  except ValueError:
+    return np.array([finite_value(v) for v in values], dtype = bool)
+
+
+def finite_value(value):
+  try:
+    return np.isfinite(float(value))
+  except ValueError:
+    return False
+
+
+# check submission rows against the sample submission: every sample row once, in sample order, with a finite value
+# returns the number of rows, missing, extra and duplicate keys, rows out of sample order and invalid values
+def compare_with_sample(sub, sample):
+  (keys, sample_keys) = join_keys(sub, sample)
+  pos = sample_positions(keys, sample_keys)
+  matched = pos[pos >= 0]
+  return {"rows": len(keys), "missing": len(sample_keys) - len(np.unique(matched)),
+          "extra": int(np.sum(pos < 0)), "duplicates": len(keys) - len(np.unique(keys)),
+          "out_of_order": int(np.sum(np.diff(matched) < 0)), "invalid": int(np.sum(~finite_values(sub["value"])))}
+
+
+def print_report(filename, report, sample):
+  problems = ["%d %s" % (report[k], k) for k in ["missing", "extra", "duplicates", "out_of_order", "invalid"]
+              if report[k] > 0]
+  print "%s: %d rows, %s against %s" % (filename, report["rows"], ", ".join(problems) or "valid", sample)
+
+
+# check a submission file of a task against a sample submission (the sample of the task by default)
+def validate_predictions(filename, task, sample = None):
+  sample = sample or tasks[task]["sample"]
+  with profiling.stage("validate", file = filename) as report:
+    report.update(compare_with_sample(read_submission(filename, task), read_submission(sample, task)))
+  print_report(filename, report, sample)
+  return report
+
+
+# write predictions in the submission format of a task, atomically, and check them against the sample submission
+# pred_ys yields the predictions of the test windows for each of the targets (a, b, shift) in turn, it can be a
+# generator over models still being trained
+# the window of shift k is the (k+1)-th 20-min window after the last input window of a test data point
+# rows are formatted all at once and written in the order of the sample submission if there is one,
+# rows missing from the sample follow in target order
+def write_predictions(filename, task, targets, test_times, pred_ys, sample = None):
+  pred_y = np.vstack([np.ravel(y) for (t, y) in itertools.izip(targets, pred_ys)])
+  time_of_win = np.array(test_times, dtype = "datetime64[s]").astype(np.int64)
+  sample = sample or tasks[task]["sample"]
+  with profiling.stage("write", file = filename, rows = pred_y.size):
+    shift = np.repeat([t[2] for t in targets], len(time_of_win))
+    sub = submission_columns([t[:2] for t in targets], np.repeat(np.arange(len(targets)), len(time_of_win)),
+                             np.tile(time_of_win, len(targets)) + 1200 * (shift + 1), pred_y.ravel())
+    report = None
+    order = np.arange(len(shift))
+    if os.path.exists(sample):
+      sample_sub = read_submission(sample, task)
+      (keys, sample_keys) = join_keys(sub, sample_sub)
+      pos = sample_positions(keys, sample_keys)
+      order = np.lexsort((order, np.where(pos < 0, len(sample_keys), pos)))
+      with profiling.stage("validate", file = filename) as report:
+        sorted_sub = submission_columns(sub["pairs"], sub["pair"][order], sub["start"][order], sub["value"][order])
+        report.update(compare_with_sample(sorted_sub, sample_sub))
+
+    # format each window and each target once, rows are put together from them
+    (starts, window_idx) = np.unique(sub["start"][order], return_inverse = True)
+    windows = np.char.add(np.char.add("[", utils.epochToStrArray(starts)), ",")
+    windows = np.char.add(windows, np.char.add(utils.epochToStrArray(starts + 1200), ")")).astype(object)
+    key_parts = [(tasks[task]["key"] % {"a": a, "b": b, "window": "\0"}).split("\0") for (a, b, _) in targets]
+    (prefix, suffix) = [np.array([p[k] for p in key_parts], dtype = object) for k in (0, 1)]
+    target_idx = order // len(time_of_win)
+    lines = prefix[target_idx] + windows[window_idx] + suffix[target_idx] + ","
+    values = ("%f\n" * len(order)) % tuple(pred_y.ravel()[order])
+    with open(filename + ".tmp", "w") as f:
+      f.write(tasks[task]["header"] + "\n")
+      f.write("".join(itertools.chain.from_iterable(itertools.izip(lines, values.splitlines(True)))))
+    os.rename(filename + ".tmp", filename)
+  if report is not None:
+    print_report(filename, report, sample)
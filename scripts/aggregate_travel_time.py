@@ -8,7 +8,7 @@ Calculate the average travel time for each 20-minute time window.
 """
 
 # import necessary modules
-import math
+import math, argparse
 from datetime import datetime,timedelta
 
 file_suffix = '.csv'
@@ -40,7 +40,7 @@ def avgTravelTime(in_file):
 
         trace_start_time = each_traj[3]
         trace_start_time = datetime.strptime(trace_start_time, "%Y-%m-%d %H:%M:%S")
-        time_window_minute = math.floor(trace_start_time.minute / 20) * 20
+        time_window_minute = int(math.floor(trace_start_time.minute / 20) * 20)
         start_time_window = datetime(trace_start_time.year, trace_start_time.month, trace_start_time.day,
                                      trace_start_time.hour, time_window_minute, 0)
         tt = float(each_traj[-1]) # travel time
@@ -66,11 +66,120 @@ def avgTravelTime(in_file):
             fw.writelines(out_line)
     fw.close()
 
+def flushTravelTimes(fw, travel_times, watermark=None):
+    """
+    Write out and forget the time windows that ended before watermark (all if None).
+    Returns the start of the latest window written out, or None.
+    """
+    last_closed = None
+    for time_window_start in sorted(travel_times.keys()):
+        start_time_window = datetime.strptime(time_window_start, "%Y-%m-%d %H:%M:%S")
+        time_window_end = start_time_window + timedelta(minutes=20)
+        if watermark is not None and time_window_end > watermark:
+            break
+        for route in sorted(travel_times[time_window_start].keys()):
+            tt_sum, tt_count = travel_times[time_window_start][route]
+            avg_tt = round(tt_sum / float(tt_count), 2)
+            out_line = ','.join(['"' + route[0] + '"', '"' + route[1] + '"',
+                                 '"[' + str(start_time_window) + ',' + str(time_window_end) + ')"',
+                                 '"' + str(avg_tt) + '"']) + '\n'
+            fw.writelines(out_line)
+        del travel_times[time_window_start]
+        last_closed = time_window_start
+    return last_closed
+
+def streamTravelTime(in_file, chunk_bytes=1 << 22, max_delay=300):
+    """
+    Streaming version of avgTravelTime for input sorted by starting time.
+    Only a running sum and count per route of the open time windows are kept in
+    memory. A window is written out once the latest trajectory starts more than
+    max_delay seconds past its end; later trajectories for an already written
+    window are dropped and reported.
+    Output is ordered by time window with routes sorted within, instead of by route.
+    """
+
+    out_suffix = '_20min_avg_travel_time'
+    in_file_name = in_file + file_suffix
+    out_file_name = in_file.split('_')[1] + out_suffix + file_suffix
+
+    fr = open(path + in_file_name, 'r')
+    fr.readline()  # skip the header
+    fw = open(out_file_name, 'w')
+    fw.writelines(','.join(['"intersection_id"', '"tollgate_id"', '"time_window"', '"avg_travel_time"']) + '\n')
+
+    travel_times = {}  # open windows only. key: time window start string, value: {(intersection_id, tollgate_id): [sum, count]}
+    last_closed = ''
+    latest_start = ''
+    dropped = 0
+    while True:
+        # Step 1: Load the next chunk of trajectories
+        traj_data = fr.readlines(chunk_bytes)
+        if not traj_data:
+            break
+
+        # Step 2: Update running sums of the open time windows
+        for line in traj_data:
+            each_traj = line.replace('"', '').split(',')
+            trace_start_time = each_traj[3]
+            time_window_minute = int(trace_start_time[14:16]) // 20 * 20
+            start_time_window = '%s%02d:00' % (trace_start_time[:14], time_window_minute)
+            if start_time_window <= last_closed:
+                dropped += 1
+                continue
+            if trace_start_time > latest_start:
+                latest_start = trace_start_time
+
+            route = (each_traj[0], each_traj[1])
+            tt = float(each_traj[-1]) # travel time
+            window_tts = travel_times.setdefault(start_time_window, {})
+            if route not in window_tts:
+                window_tts[route] = [tt, 1]
+            else:
+                window_tts[route][0] += tt
+                window_tts[route][1] += 1
+
+        # Step 3: Write out the windows the input has moved past
+        watermark = datetime.strptime(latest_start, "%Y-%m-%d %H:%M:%S") - timedelta(seconds=max_delay)
+        last_closed = flushTravelTimes(fw, travel_times, watermark) or last_closed
+
+    flushTravelTimes(fw, travel_times)
+    fr.close()
+    fw.close()
+
+    if dropped > 0:
+        print('Dropped %d trajectories arriving more than %d seconds late' % (dropped, max_delay))
+
 def main():
 
+    parser = argparse.ArgumentParser(description="Calculate average travel time for each 20-minute time window")
+
+    parser.add_argument('--stream',
+        dest='stream',
+        action='store_true',
+        help='Aggregate time-sorted input in chunks, keeping only open windows in memory')
+
+    parser.add_argument('--chunk-bytes',
+        dest='chunk_bytes',
+        action='store',
+        help='Approximate number of bytes read per chunk in streaming mode',
+        type=int,
+        default=1 << 22)
+
+    parser.add_argument('--max-delay',
+        dest='max_delay',
+        action='store',
+        help='Out-of-order tolerance in seconds in streaming mode',
+        type=int,
+        default=300)
+
+    args = parser.parse_args()
+
 #    in_file = 'trajectories(table 5)_training'
     in_file = 'trajectories_table5_training'
-    avgTravelTime(in_file)
+    if args.stream:
+        streamTravelTime(in_file, args.chunk_bytes, args.max_delay)
+    else:
+        avgTravelTime(in_file)
 
 if __name__ == '__main__':
     main()
@@ -4,7 +4,7 @@
 """
 Calculate volume for each 20-minute time window.
 """
-import math
+import math, argparse
 from datetime import datetime,timedelta
 
 file_suffix = '.csv'
@@ -62,10 +62,114 @@ def avgVolume(in_file):
                fw.writelines(out_line)
     fw.close()
 
+def flushVolumes(fw, volumes, watermark=None):
+    """
+    Write out and forget the time windows that ended before watermark (all if None).
+    Returns the start of the latest window written out, or None.
+    """
+    last_closed = None
+    for time_window_start in sorted(volumes.keys()):
+        start_time_window = datetime.strptime(time_window_start, "%Y-%m-%d %H:%M:%S")
+        time_window_end = start_time_window + timedelta(minutes=20)
+        if watermark is not None and time_window_end > watermark:
+            break
+        for tollgate_id, direction in sorted(volumes[time_window_start].keys()):
+            out_line = ','.join(['"' + str(tollgate_id) + '"',
+                                 '"[' + str(start_time_window) + ',' + str(time_window_end) + ')"',
+                                 '"' + str(direction) + '"',
+                                 '"' + str(volumes[time_window_start][(tollgate_id, direction)]) + '"',
+                               ]) + '\n'
+            fw.writelines(out_line)
+        del volumes[time_window_start]
+        last_closed = time_window_start
+    return last_closed
+
+def streamVolume(in_file, chunk_bytes=1 << 22, max_delay=300):
+    """
+    Streaming version of avgVolume for time-sorted input.
+    Only running counts of the open time windows are kept in memory. A window is
+    written out once the latest pass is more than max_delay seconds past its end,
+    so passes may arrive out of order by up to max_delay seconds. Later passes
+    for an already written window are dropped and reported.
+    Windows are written in time order, tollgates and directions sorted within.
+    """
+
+    out_suffix = '_20min_avg_volume'
+    in_file_name = in_file + file_suffix
+    out_file_name = in_file.split('_')[1] + out_suffix + file_suffix
+
+    fr = open(path + in_file_name, 'r')
+    fr.readline()  # skip the header
+    fw = open(out_file_name, 'w')
+    fw.writelines(','.join(['"tollgate_id"', '"time_window"', '"direction"', '"volume"']) + '\n')
+
+    volumes = {}  # open windows only. key: time window start string, value: {(tollgate_id, direction): count}
+    last_closed = ''
+    latest_pass = ''
+    dropped = 0
+    while True:
+        # Step 1: Load the next chunk of volume data
+        vol_data = fr.readlines(chunk_bytes)
+        if not vol_data:
+            break
+
+        # Step 2: Update running counts of the open time windows
+        for line in vol_data:
+            each_pass = line.replace('"', '').split(',')
+            pass_time = each_pass[0]
+            time_window_minute = int(pass_time[14:16]) // 20 * 20
+            start_time_window = '%s%02d:00' % (pass_time[:14], time_window_minute)
+            if start_time_window <= last_closed:
+                dropped += 1
+                continue
+            if pass_time > latest_pass:
+                latest_pass = pass_time
+
+            toll_dir = (each_pass[1], each_pass[2])
+            window_volumes = volumes.setdefault(start_time_window, {})
+            window_volumes[toll_dir] = window_volumes.get(toll_dir, 0) + 1
+
+        # Step 3: Write out the windows the input has moved past
+        watermark = datetime.strptime(latest_pass, "%Y-%m-%d %H:%M:%S") - timedelta(seconds=max_delay)
+        last_closed = flushVolumes(fw, volumes, watermark) or last_closed
+
+    flushVolumes(fw, volumes)
+    fr.close()
+    fw.close()
+
+    if dropped > 0:
+        print('Dropped %d passes arriving more than %d seconds late' % (dropped, max_delay))
+
 def main():
 
+    parser = argparse.ArgumentParser(description="Calculate volume for each 20-minute time window")
+
+    parser.add_argument('--stream',
+        dest='stream',
+        action='store_true',
+        help='Aggregate time-sorted input in chunks, keeping only open windows in memory')
+
+    parser.add_argument('--chunk-bytes',
+        dest='chunk_bytes',
+        action='store',
+        help='Approximate number of bytes read per chunk in streaming mode',
+        type=int,
+        default=1 << 22)
+
+    parser.add_argument('--max-delay',
+        dest='max_delay',
+        action='store',
+        help='Out-of-order tolerance in seconds in streaming mode',
+        type=int,
+        default=300)
+
+    args = parser.parse_args()
+
     in_file = 'volume_table6_training'
-    avgVolume(in_file)
+    if args.stream:
+        streamVolume(in_file, args.chunk_bytes, args.max_delay)
+    else:
+        avgVolume(in_file)
 
 if __name__ == '__main__':
     main()
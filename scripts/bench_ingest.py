@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python
+
+"""
+Benchmark raw data ingestion: per-row dict parsing vs columnar numpy loaders,
+from the .csv files and from their day-partitioned column stores (see column_store.py).
+Each implementation runs in a fresh process so that peak RSS is not shared.
+The stores are imported first if missing.
+
+Usage: python bench_ingest.py [--vol-file ...] [--traj-file ...]
+"""
+
+import argparse, csv, os, resource, subprocess, sys, time
+from datetime import datetime
+
+import column_store
+import utils
+
+
+def legacyParseVolume(in_file):
+    '''
+    Previous parseVolumeFile: one dict per record
+    '''
+    return utils.readCSVToList(in_file, 'time', '%Y-%m-%d %H:%M:%S')
+
+
+def legacyParseTraj(in_file, time_fmt='%Y-%m-%d %H:%M:%S'):
+    '''
+    Previous parseTrajFile: one dict per record, strptime on every hop
+    '''
+    veh_info = []
+    with open(in_file, 'r') as csv_file:
+        csv_r = csv.reader(csv_file)
+        keys = csv_r.next()
+        for row in csv_r:
+            rec = {x:y for x,y in zip(keys, row)}
+            travel_seq = [x.split('#') for x in rec['travel_seq'].split(';')]
+            for t in travel_seq:
+                t[1] = datetime.strptime(t[1], time_fmt)
+            rec.update({'travel_seq':travel_seq})
+            rec.update({'starting_time':datetime.strptime(rec['starting_time'], time_fmt)})
+            rec.update({'time_window':utils.calcTimeWindow(rec['starting_time'])})
+            veh_info.append(rec)
+    return veh_info
+
+
+PARSERS = {
+    ('legacy', 'volume'): (legacyParseVolume, len),
+    ('legacy', 'traj'): (legacyParseTraj, len),
+    ('columnar', 'volume'): (utils.loadVolumeColumns, lambda x: len(x['time'])),
+    ('columnar', 'traj'): (utils.loadTrajColumns, lambda x: len(x['travel_time'])),
+    ('store', 'volume'): (lambda f: utils.loadVolumeColumns(column_store.storeDir(f)), lambda x: len(x['time'])),
+    ('store', 'traj'): (lambda f: utils.loadTrajColumns(column_store.storeDir(f)), lambda x: len(x['travel_time'])),
+}
+
+
+def runOne(impl, table, in_file, repeat):
+    '''
+    Parse in_file repeat times and print "rows seconds peak_rss_kb"
+    '''
+    parse, count = PARSERS[(impl, table)]
+    start = time.time()
+    for _ in range(repeat):
+        n_rows = count(parse(in_file))
+    elapsed = (time.time() - start) / repeat
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print('%d %f %d' % (n_rows, elapsed, peak_kb))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Benchmark raw data ingestion")
+
+    parser.add_argument('--vol-file',
+        dest='vol_in',
+        action='store',
+        help='Traffic volume data file',
+        type=str,
+        default='../dataSets/testing_phase1/volume_table6_test1.csv')
+
+    parser.add_argument('--traj-file',
+        dest='traj_in',
+        action='store',
+        help='Trajectory data file',
+        type=str,
+        default='../dataSets/testing_phase1/trajectories_table5_test1.csv')
+
+    parser.add_argument('--repeat',
+        dest='repeat',
+        action='store',
+        help='Number of parses per measurement',
+        type=int,
+        default=3)
+
+    parser.add_argument('--run-one',
+        dest='run_one',
+        action='store',
+        nargs=3,
+        help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.run_one:
+        runOne(args.run_one[0], args.run_one[1], args.run_one[2], args.repeat)
+        return
+
+    for in_file in [args.vol_in, args.traj_in]:
+        if not os.path.isdir(column_store.storeDir(in_file)):
+            column_store.importTable(in_file)
+
+    print('%-8s %-9s %10s %10s %12s %12s' % ('table', 'impl', 'rows', 'sec', 'rows/sec', 'peak RSS MB'))
+    for table, in_file in [('volume', args.vol_in), ('traj', args.traj_in)]:
+        for impl in ['legacy', 'columnar', 'store']:
+            out = subprocess.check_output([sys.executable, __file__, '--repeat', str(args.repeat),
+                                           '--run-one', impl, table, in_file])
+            n_rows, elapsed, peak_kb = out.split()[-3:]
+            n_rows, elapsed = int(n_rows), float(elapsed)
+            print('%-8s %-9s %10d %10.3f %12.0f %12.1f' % (table, impl, n_rows, elapsed,
+                  n_rows / elapsed, int(peak_kb) / 1024.))
+
+if __name__ == '__main__':
+    main()
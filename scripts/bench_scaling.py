@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python
+
+"""
+Scaling benchmark of the preprocessing and model stages on synthetic data.
+
+For every scale s, gen_synthetic.py writes 7*s days of tables 3-7 (1x is about the size of
+the shipped test volume table) to <work-dir>/synthetic_<s>x, reused by later runs.
+utils.py then parses, aggregates and windows them (with link features), and model/bench_stages.py
+loads the volume windows and fits a sparse GP and the median and ridge baselines.
+Both run in fresh processes with --stats-file, so peak RSS is per scale; see profiling.py.
+
+Per stage the table shows wall time, throughput (rows/sec) and peak RSS. With --baseline, every
+stage is compared with the stored run and stages slower than --tolerance times the baseline fail
+the run (exit code 1). --save-baseline stores the current run instead.
+
+Usage: python bench_scaling.py [--scales 1 10 100] [--baseline bench_scaling_baseline.json [--save-baseline]]
+"""
+
+import argparse, json, os, subprocess, sys
+from collections import OrderedDict
+
+import gen_synthetic
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+model_dir = os.path.join(script_dir, '..', 'model')
+
+
+def scaleDir(work_dir, scale):
+    return os.path.join(work_dir, 'synthetic_%dx' % scale)
+
+
+def runStages(work_dir, scale):
+    '''
+    Generate the data of a scale if needed and run all stages on it
+    Returns the JSON line records of the run
+    '''
+
+    data_dir = scaleDir(work_dir, scale)
+    vol_file = os.path.join(data_dir, 'volume_table6_training.csv')
+    traj_file = os.path.join(data_dir, 'trajectories_table5_training.csv')
+    if not os.path.exists(vol_file):
+        print('Generating %s ...' % data_dir)
+        gen_synthetic.generate(data_dir, 7 * scale, 3, 6, 25., 4.)
+
+    stats_file = os.path.join(data_dir, 'stats.jsonl')
+    if os.path.exists(stats_file):
+        os.remove(stats_file)
+    subprocess.check_call([sys.executable, 'utils.py', '--vol-file', vol_file, '--traj-file', traj_file,
+                           '--link-features', '--links-file', os.path.join(data_dir, 'links_table3.csv'),
+                           '--routes-file', os.path.join(data_dir, 'routes_table4.csv'),
+                           '--stats-file', stats_file], cwd=script_dir, stdout=open(os.devnull, 'w'))
+    subprocess.check_call([sys.executable, 'bench_stages.py', '--stats-file', stats_file, '--train-file',
+                           '%s_20min_avg_6_window.csv' % vol_file.split('.csv')[0]],
+                          cwd=model_dir, stdout=open(os.devnull, 'w'))
+
+    with open(stats_file) as f:
+        return [json.loads(line) for line in f]
+
+
+def summarize(records):
+    '''
+    Sum wall time and rows (or windows) of the records of each stage, by table, backend or model where given
+    Returns {stage: {'wall_s', 'rows', 'rows_per_s', 'peak_rss_mb'}} in the order of the run
+    '''
+
+    summary = OrderedDict()
+    for rec in records:
+        name = rec['stage'] + ''.join(':%s' % rec[k] for k in ['table', 'backend', 'model'] if k in rec)
+        s = summary.setdefault(name, {'wall_s': 0., 'rows': 0, 'peak_rss_mb': 0.})
+        s['wall_s'] += rec['wall_s']
+        s['rows'] += rec.get('rows', rec.get('windows', 0))
+        s['peak_rss_mb'] = max(s['peak_rss_mb'], rec['peak_rss_mb'])
+    for s in summary.values():
+        s['rows_per_s'] = s['rows'] / max(s['wall_s'], 1e-6)
+    return summary
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Scaling benchmark on synthetic data")
+
+    parser.add_argument('--scales',
+        dest='scales',
+        action='store',
+        nargs='+',
+        help='Data sizes as multiples of 7 days',
+        type=int,
+        default=[1, 10, 100])
+
+    parser.add_argument('--work-dir',
+        dest='work_dir',
+        action='store',
+        help='Directory of the generated data',
+        type=str,
+        default='../dataSets/synthetic')
+
+    parser.add_argument('--baseline',
+        dest='baseline',
+        action='store',
+        help='Stored run to compare with (JSON)',
+        type=str,
+        default=None)
+
+    parser.add_argument('--save-baseline',
+        dest='save_baseline',
+        action='store_true',
+        help='Store this run as --baseline instead of comparing with it')
+
+    parser.add_argument('--tolerance',
+        dest='tolerance',
+        action='store',
+        help='Fail stages slower than this multiple of the baseline wall time',
+        type=float,
+        default=1.5)
+
+    parser.add_argument('--min-wall',
+        dest='min_wall',
+        action='store',
+        help='Stages faster than this (seconds) in the baseline are not compared',
+        type=float,
+        default=0.05)
+
+    args = parser.parse_args()
+
+    results = OrderedDict()
+    for scale in args.scales:
+        results['%dx' % scale] = summarize(runStages(os.path.abspath(args.work_dir), scale))
+
+    baseline = {}
+    if args.baseline and not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    regressions = []
+    print('%-5s %-24s %10s %12s %14s %12s %10s' % ('scale', 'stage', 'rows', 'sec', 'rows/sec', 'peak RSS MB',
+                                                   'vs base'))
+    for scale, summary in results.items():
+        for name, s in summary.items():
+            base = baseline.get(scale, {}).get(name)
+            ratio = '' if base is None else '%.2fx' % (s['wall_s'] / max(base['wall_s'], 1e-6))
+            if base is not None and base['wall_s'] >= args.min_wall and \
+                    s['wall_s'] > args.tolerance * base['wall_s']:
+                regressions.append('%s %s' % (scale, name))
+                ratio += ' !'
+            print('%-5s %-24s %10d %12.3f %14.0f %12.1f %10s' % (scale, name, s['rows'], s['wall_s'],
+                  s['rows_per_s'], s['peak_rss_mb'], ratio))
+
+    if args.save_baseline and args.baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1)
+        print('Saved baseline to %s' % args.baseline)
+    if regressions:
+        print('Slower than %.1fx the baseline: %s' % (args.tolerance, ', '.join(regressions)))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
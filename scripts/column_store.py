@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python
+
+"""
+Import raw tables 5, 6 and 7 into day-partitioned, compressed column stores.
+
+A table <name>.csv is stored in the directory <name>_store:
+    schema.npz        an empty array of every column, with its type
+    <YYYY-MM-DD>.<k>.npz  the records of one day (by time, starting_time or weather time) read from
+                      the k-th chunk of the .csv file, one compressed array per column
+
+Times are stored as epoch seconds and numbers as ints and floats, ids and travel_seq stay strings.
+The loaders of utils.py (loadVolumeColumns, loadTrajColumns, loadWeatherColumns, and through them
+parseVolumeFile, parseTrajFile and utils.py --vol-file/--traj-file) accept a store in place of the
+.csv file. They only read the day partitions overlapping a time range and only the columns they need,
+members of an .npz file are decompressed on access. Records keep their .csv order within a day.
+
+The .csv file is read in chunks of --chunk-bytes, so memory does not grow with the file size.
+Importing again replaces the store.
+
+Usage: python column_store.py ../dataSets/training/volume_table6_training.csv [...] [--chunk-bytes 67108864]
+"""
+
+import argparse, os, shutil, time
+import numpy as np
+
+import profiling
+import utils
+
+# time column and typed columns of each table, other columns are stored as strings
+schemas = {
+    'volume': {'time': 'time', 'int': ['vehicle_model', 'has_etc'], 'float': []},
+    'traj': {'time': 'starting_time', 'int': ['vehicle_id'], 'float': ['travel_time']},
+    'weather': {'time': 'time', 'int': [],
+                'float': ['pressure', 'sea_pressure', 'wind_direction', 'wind_speed', 'temperature',
+                          'rel_humidity', 'precipitation']},
+}
+
+
+def storeDir(in_file):
+    return '%s_store' % in_file.split('.csv')[0]
+
+
+def tableOf(in_file):
+    '''
+    Table of a raw .csv file by its header
+    '''
+    with open(in_file, 'r') as csv_file:
+        keys = csv_file.readline().strip().replace('"', '').split(',')
+    if 'travel_seq' in keys:
+        return 'traj'
+    if 'vehicle_model' in keys:
+        return 'volume'
+    if 'precipitation' in keys:
+        return 'weather'
+    raise ValueError('%s is not a volume, trajectory or weather table' % in_file)
+
+
+def typedColumns(raw, table):
+    '''
+    Convert the string columns of a .csv chunk to the stored types
+    '''
+
+    schema = schemas[table]
+    cols = dict(raw)
+    if table == 'weather':
+        cols['time'] = utils.parseTimeColumn(cols.pop('date')) + cols.pop('hour').astype(np.int64) * 3600
+    else:
+        cols[schema['time']] = utils.parseTimeColumn(cols[schema['time']])
+    for key in schema['int']:
+        cols[key] = cols[key].astype(np.int64)
+    for key in schema['float']:
+        cols[key] = cols[key].astype(np.float64)
+    return cols
+
+
+def importTable(in_file, store_dir=None, chunk_bytes=1 << 26):
+    '''
+    Write the day partitions of a raw .csv file to store_dir (storeDir(in_file) if None)
+    Returns the table, the number of records and of day partitions
+    '''
+
+    table = tableOf(in_file)
+    store_dir = store_dir or storeDir(in_file)
+    tmp_dir = store_dir + '.tmp'
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+
+    time_key = schemas[table]['time']
+    n_rows, n_parts = 0, 0
+    with profiling.stage('import', table=table, file=in_file) as counters:
+        n_chunks = max(1, -(-os.path.getsize(in_file) // chunk_bytes))
+        for k, (start, end) in enumerate(utils.byteRanges(in_file, n_chunks)):
+            cols = typedColumns(utils.readCSVColumns(in_file, start, end), table)
+            if k == 0:
+                np.savez(os.path.join(tmp_dir, 'schema.npz'), **{key: col[:0] for key, col in cols.items()})
+            days = cols[time_key] // 86400 * 86400
+            for day in np.unique(days):
+                in_day = days == day
+                part_file = '%s.%05d.npz' % (utils.epochToStr(day)[:10], k)
+                np.savez_compressed(os.path.join(tmp_dir, part_file), **{key: col[in_day] for key, col in cols.items()})
+                n_parts += 1
+            n_rows += len(days)
+        counters.update({'rows': n_rows, 'partitions': n_parts})
+
+    if os.path.exists(store_dir):
+        shutil.rmtree(store_dir)
+    os.rename(tmp_dir, store_dir)
+    return table, n_rows, n_parts
+
+
+def diskSize(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Import raw tables 5-7 into day-partitioned column stores")
+
+    parser.add_argument('in_files',
+        action='store',
+        nargs='+',
+        help='Raw volume, trajectory or weather .csv files')
+
+    parser.add_argument('--chunk-bytes',
+        dest='chunk_bytes',
+        action='store',
+        help='Approximate number of bytes of the .csv file parsed at once',
+        type=int,
+        default=1 << 26)
+
+    profiling.addProfileArgs(parser)
+
+    args = parser.parse_args()
+    profiling.configure(args)
+
+    for in_file in args.in_files:
+        start = time.time()
+        table, n_rows, n_parts = importTable(in_file, chunk_bytes=args.chunk_bytes)
+        print('%s: %s table, %d records in %d partitions, %.1f MB -> %.1f MB (%.1f sec)' % (
+            storeDir(in_file), table, n_rows, n_parts, diskSize(in_file) / 1048576.,
+            diskSize(storeDir(in_file)) / 1048576., time.time() - start))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python
+
+"""
+Generate synthetic raw tables with the schema of the KDD Cup 2017 data, for scaling tests.
+
+Writes to --out-dir:
+    volume_table6_training.csv        one row per vehicle passing a tollgate
+    trajectories_table5_training.csv  one row per vehicle on a route, with its travel_seq
+    weather_table7_training.csv       one observation every 3 hours
+    links_table3.csv, routes_table4.csv
+
+Volume and the number of trajectories per 20-min window follow a daily profile with a morning
+and an evening peak and lighter weekends, link travel times slow down with the same profile.
+With the defaults, 7 days give about 30k volume rows, the size of the shipped test volume table.
+Days are generated one at a time, so memory does not grow with --days.
+
+Usage: python gen_synthetic.py --out-dir ../dataSets/synthetic_1x [--days 7] [--tollgates 3] [--routes 6]
+"""
+
+import argparse, os
+import numpy as np
+
+import utils
+
+win_size_sec = 1200
+n_windows_per_day = 86400 // win_size_sec
+
+
+def dailyProfile(time_of_day):
+    '''
+    Relative traffic at a time of day (seconds): a morning peak at 8:00, an evening peak at 17:30
+    '''
+    hour = time_of_day / 3600.
+    return 0.15 + np.exp(-0.5 * ((hour - 8.) / 1.2)**2) + 0.8 * np.exp(-0.5 * ((hour - 17.5) / 1.5)**2)
+
+
+def windowRates(day_start, rate):
+    '''
+    Expected number of events in each 20-min window of a day for a mean peak rate
+    '''
+    tws = day_start + np.arange(n_windows_per_day) * win_size_sec
+    weekend = utils.epochWeekday(day_start) >= 5
+    return tws, rate * dailyProfile(tws % 86400 + win_size_sec / 2.) * (0.8 if weekend else 1.)
+
+
+def eventTimes(rng, tws, counts):
+    '''
+    Sorted event times, counts[i, k] events of column k uniformly within window tws[i]
+    Returns event times and their column
+    '''
+    cells = np.repeat(np.arange(counts.size), counts.ravel())
+    times = tws[cells // counts.shape[1]] + rng.randint(0, win_size_sec, len(cells))
+    order = np.argsort(times, kind='mergesort')
+    return times[order], (cells % counts.shape[1])[order]
+
+
+def quotedRows(columns):
+    '''
+    Format equally long string columns as fully quoted csv lines, like the KDD tables
+    '''
+    if len(columns[0]) == 0:
+        return ''
+    return '\n'.join('"' + '","'.join(row) + '"' for row in zip(*columns)) + '\n'
+
+
+def writeVolumeDay(out, rng, day_start, pairs, pair_scale, rate):
+    tws, rates = windowRates(day_start, rate)
+    counts = rng.poisson(rates[:, None] * pair_scale[None, :])
+    times, pair = eventTimes(rng, tws, counts)
+    n = len(times)
+    vehicle_model = rng.choice(8, n, p=[.05, .45, .2, .1, .08, .06, .04, .02])
+    vehicle_type = np.where(rng.rand(n) < .5, '', (vehicle_model > 3).astype(int).astype(str))
+    out.write(quotedRows([utils.epochToStrArray(times),
+                          np.array([p[0] for p in pairs])[pair], np.array([p[1] for p in pairs])[pair],
+                          vehicle_model.astype(str), (rng.rand(n) < .3).astype(int).astype(str),
+                          vehicle_type]))
+    return n
+
+
+def writeTrajDay(out, rng, day_start, routes, route_links, link_ids, link_length, rate):
+    tws, rates = windowRates(day_start, rate)
+    counts = rng.poisson(rates[:, None] * np.ones(len(routes))[None, :])
+    starts, route = eventTimes(rng, tws, counts)
+    n_hops = np.array([len(route_links[r]) for r in route])
+    traj_idx = np.repeat(np.arange(len(starts)), n_hops)
+    if len(traj_idx) == 0:
+        return 0
+
+    ### Link travel time: free flow at 10 m/s, up to 2.5 times slower in the peaks ###
+    link = np.concatenate([route_links[r] for r in route])
+    congestion = 1. + dailyProfile(starts[traj_idx] % 86400)
+    link_time = np.round(link_length[link] / 10. * congestion * rng.lognormal(0., .25, len(link)), 2)
+    first_hop = np.cumsum(n_hops) - n_hops
+    entered = np.cumsum(link_time) - link_time
+    enter_time = starts[traj_idx] + (entered - np.repeat(entered[first_hop], n_hops)).astype(np.int64)
+
+    hops = np.char.add(np.char.add(np.char.add(link_ids[link].astype(str), '#'), utils.epochToStrArray(enter_time)),
+                       np.char.mod('#%.2f', link_time))
+    travel_seq = [';'.join(hops[a:a+k]) for a, k in zip(first_hop, n_hops)]
+    travel_time = np.bincount(traj_idx, link_time)
+    out.write(quotedRows([np.array([routes[r][0] for r in route]), np.array([routes[r][1] for r in route]),
+                          rng.randint(1000000, 2000000, len(starts)).astype(str), utils.epochToStrArray(starts),
+                          np.array(travel_seq), np.char.mod('%.2f', travel_time)]))
+    return len(starts)
+
+
+def writeWeather(out_file, rng, first_day, n_days):
+    times = first_day + np.arange(n_days * 8) * 3 * 3600
+    n = len(times)
+    day = (times - first_day) / 86400.
+    temperature = 20. - 8. * day / max(n_days, 1) + 5. * np.sin(2 * np.pi * (day - .375)) + rng.normal(0, 1, n)
+    rain = rng.rand(n) < .08
+    with open(out_file, 'w') as out:
+        out.write('"date","hour","pressure","sea_pressure","wind_direction","wind_speed","temperature",'
+                  '"rel_humidity","precipitation"\n')
+        out.write(quotedRows([np.array([x[:10] for x in utils.epochToStrArray(times)]),
+                              (times % 86400 // 3600).astype(str),
+                              np.char.mod('%.1f', 1000. + rng.normal(0, 4, n)),
+                              np.char.mod('%.1f', 1010. + rng.normal(0, 4, n)),
+                              np.char.mod('%.1f', rng.uniform(0, 360, n)),
+                              np.char.mod('%.1f', rng.gamma(2., 1., n)),
+                              np.char.mod('%.1f', temperature),
+                              np.char.mod('%.1f', np.clip(rng.normal(70, 12, n), 20, 100)),
+                              np.char.mod('%.1f', np.where(rain, rng.exponential(3., n), 0.))]))
+
+
+def writeRouteTables(links_file, routes_file, rng, routes):
+    '''
+    Every route gets its own 3 to 8 links, routes from one intersection share their first link
+    Returns the link indices of each route, the link ids and the link lengths
+    '''
+    first_link, route_links, n_links = {}, [], 0
+    for intersection, tollgate in routes:
+        links = []
+        if intersection not in first_link:
+            first_link[intersection] = n_links
+            n_links += 1
+        links.append(first_link[intersection])
+        n_own = rng.randint(2, 8)
+        links += range(n_links, n_links + n_own)
+        n_links += n_own
+        route_links.append(np.array(links))
+    link_length = rng.randint(50, 400, n_links).astype(float)
+    link_ids = 100 + np.arange(n_links)
+
+    with open(links_file, 'w') as out:
+        out.write('"link_id","length","width","lanes","in_top","out_top","lane_width"\n')
+        for k in range(n_links):
+            out.write('"%d","%d","9","3","","","3"\n' % (link_ids[k], link_length[k]))
+    with open(routes_file, 'w') as out:
+        out.write('"intersection_id","tollgate_id","link_seq"\n')
+        for (intersection, tollgate), links in zip(routes, route_links):
+            out.write('"%s","%s","%s"\n' % (intersection, tollgate, ','.join(str(link_ids[k]) for k in links)))
+    return route_links, link_ids, link_length
+
+
+def generate(out_dir, n_days, n_tollgates, n_routes, vol_rate, traj_rate, first_day='2016-07-19', seed=0):
+    '''
+    Write all tables for n_days days from first_day
+    Returns the number of volume and trajectory rows
+    '''
+
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    rng = np.random.RandomState(seed)
+    day0 = int(np.datetime64(first_day, 's').astype(np.int64))
+
+    ### Both directions of every tollgate, routes from intersections A, B, ... to every tollgate ###
+    tollgates = [str(k + 1) for k in range(n_tollgates)]
+    pairs = [(t, d) for t in tollgates for d in ['0', '1']]
+    pair_scale = rng.uniform(.5, 1.5, len(pairs))
+    routes = [(chr(ord('A') + k // n_tollgates), tollgates[k % n_tollgates]) for k in range(n_routes)]
+    route_links, link_ids, link_length = writeRouteTables(os.path.join(out_dir, 'links_table3.csv'),
+                                                os.path.join(out_dir, 'routes_table4.csv'), rng, routes)
+
+    n_vol, n_traj = 0, 0
+    with open(os.path.join(out_dir, 'volume_table6_training.csv'), 'w') as vol_out, \
+            open(os.path.join(out_dir, 'trajectories_table5_training.csv'), 'w') as traj_out:
+        vol_out.write('"time","tollgate_id","direction","vehicle_model","has_etc","vehicle_type"\n')
+        traj_out.write('"intersection_id","tollgate_id","vehicle_id","starting_time","travel_seq","travel_time"\n')
+        for day in range(n_days):
+            day_start = day0 + day * 86400
+            n_vol += writeVolumeDay(vol_out, rng, day_start, pairs, pair_scale, vol_rate)
+            n_traj += writeTrajDay(traj_out, rng, day_start, routes, route_links, link_ids, link_length,
+                                   traj_rate)
+    writeWeather(os.path.join(out_dir, 'weather_table7_training.csv'), rng, day0, n_days)
+
+    return n_vol, n_traj
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Generate synthetic tables 3-7 for scaling tests")
+
+    parser.add_argument('--out-dir',
+        dest='out_dir',
+        action='store',
+        help='Output directory',
+        type=str,
+        default='../dataSets/synthetic')
+
+    parser.add_argument('--days',
+        dest='days',
+        action='store',
+        help='Number of days',
+        type=int,
+        default=7)
+
+    parser.add_argument('--tollgates',
+        dest='tollgates',
+        action='store',
+        help='Number of tollgates, each with directions 0 and 1',
+        type=int,
+        default=3)
+
+    parser.add_argument('--routes',
+        dest='routes',
+        action='store',
+        help='Number of (intersection, tollgate) routes',
+        type=int,
+        default=6)
+
+    parser.add_argument('--volume-rate',
+        dest='vol_rate',
+        action='store',
+        help='Mean vehicles per 20-min window and tollgate direction at the morning peak',
+        type=float,
+        default=25.)
+
+    parser.add_argument('--traj-rate',
+        dest='traj_rate',
+        action='store',
+        help='Mean trajectories per 20-min window and route at the morning peak',
+        type=float,
+        default=4.)
+
+    parser.add_argument('--seed',
+        dest='seed',
+        action='store',
+        help='Random seed',
+        type=int,
+        default=0)
+
+    args = parser.parse_args()
+
+    n_vol, n_traj = generate(args.out_dir, args.days, args.tollgates, args.routes,
+                             args.vol_rate, args.traj_rate, seed=args.seed)
+    print('%s: %d volume rows, %d trajectories in %d days' % (args.out_dir, n_vol, n_traj, args.days))
+
+if __name__ == '__main__':
+    main()
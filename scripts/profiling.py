@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python
+
+"""
+Stage timers and counters for the preprocessing and training scripts.
+
+Every stage (parse, aggregate, window_build, load, normalize, optimize, predict, ...)
+records its wall and CPU time, the peak RSS of the process so far and how much the
+stage raised it, plus counters of the stage (rows, windows, function evaluations, ...).
+Records are appended as JSON lines to --stats-file, one object per stage:
+
+    {"script": "gp_reg_sep.py", "pid": 123, "stage": "optimize", "wall_s": 12.3, "cpu_s": 12.1,
+     "peak_rss_mb": 210.5, "rss_growth_mb": 3.2, "column": 4, "function_evals": 87, ...}
+
+Pool workers append to the same file, lines are written in a single write so they do not interleave.
+--cprofile and --tracemalloc are opt-in dumps of the main process at exit.
+tracemalloc is in the standard library from Python 3.4, Python 2 needs the pytracemalloc backport.
+"""
+
+import atexit, json, os, resource, sys, time
+from contextlib import contextmanager
+
+config = {'stats_file': None, 'tracemalloc': None, 'script': os.path.basename(sys.argv[0])}
+
+
+def addProfileArgs(parser):
+
+    parser.add_argument('--stats-file',
+        dest='stats_file',
+        action='store',
+        help='Append stage timings, peak memory and counters to this file as JSON lines',
+        type=str,
+        default=None)
+
+    parser.add_argument('--cprofile',
+        dest='cprofile',
+        action='store',
+        help='Dump cProfile stats of the main process to this file (read with pstats)',
+        type=str,
+        default=None)
+
+    parser.add_argument('--tracemalloc',
+        dest='tracemalloc',
+        action='store',
+        help='Trace Python allocations, add the traced peak to every stage and dump the top allocation sites here',
+        type=str,
+        default=None)
+
+
+def configure(args):
+    '''
+    Start the opt-in profilers of addProfileArgs, their dumps are written at exit
+    '''
+
+    config['stats_file'] = args.stats_file
+
+    if args.cprofile:
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+        atexit.register(lambda: (profile.disable(), profile.dump_stats(args.cprofile)))
+
+    if args.tracemalloc:
+        try:
+            import tracemalloc
+        except ImportError:
+            print('tracemalloc is not available, run with Python 3 or install pytracemalloc')
+            return
+        tracemalloc.start()
+        config['tracemalloc'] = tracemalloc
+        atexit.register(dumpAllocations, args.tracemalloc)
+
+
+def dumpAllocations(out_file, n_top=50):
+    '''
+    Write the n_top source lines holding the most traced memory
+    '''
+
+    snapshot = config['tracemalloc'].take_snapshot()
+    with open(out_file, 'w') as f:
+        for stat in snapshot.statistics('lineno')[:n_top]:
+            f.write('%s\n' % stat)
+
+
+def peakRSS():
+    '''
+    Peak resident set size of this process in MB (ru_maxrss is in KB on Linux)
+    '''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+def cpuTime():
+    t = os.times()
+    return t[0] + t[1]
+
+
+def jsonValue(value):
+    # numpy scalars and arrays
+    return value.tolist() if hasattr(value, 'tolist') else str(value)
+
+
+def record(stage_name, **fields):
+    '''
+    Append one JSON line for a stage, nothing is written without --stats-file
+    '''
+
+    if config['stats_file'] is None:
+        return
+    fields.update({'script': config['script'], 'pid': os.getpid(), 'stage': stage_name, 'time': time.time()})
+    line = json.dumps(fields, sort_keys=True, default=jsonValue) + '\n'
+    with open(config['stats_file'], 'a') as f:
+        f.write(line)
+
+
+@contextmanager
+def stage(stage_name, **counters):
+    '''
+    Time the body of a with statement as a stage
+    The yielded dict holds the counters of the stage, the body can add to it
+    A stage that raises is not recorded
+    '''
+
+    tracer = config['tracemalloc']
+    if tracer is not None and hasattr(tracer, 'reset_peak'):
+        tracer.reset_peak()
+    start_wall, start_cpu, start_rss = time.time(), cpuTime(), peakRSS()
+    yield counters
+    counters.update({'wall_s': time.time() - start_wall, 'cpu_s': cpuTime() - start_cpu,
+                     'peak_rss_mb': peakRSS(), 'rss_growth_mb': peakRSS() - start_rss})
+    if tracer is not None:
+        counters['traced_peak_mb'] = tracer.get_traced_memory()[1] / 1048576.
+    record(stage_name, **counters)
@@ -3,10 +3,13 @@
 
 
 # import necessary modules
-import math, csv, time, argparse
+import math, csv, time, argparse, os, hashlib, multiprocessing
 import numpy as np
+from numpy.lib.stride_tricks import as_strided
 from datetime import datetime, timedelta
 
+import profiling
+
 file_suffix = '.csv'
 path = '../'  # set the data directory
 
@@ -41,10 +44,257 @@ def calcTimeWindow(time_obj, win_size_min=20):
                                     time_obj.hour, time_window_minute, 0)
 
 
+def readCSVColumns(in_file, start=0, end=None):
+    '''
+    Read quoted .csv file with first line as keys into a dict of string columns
+    Each column is a numpy string array sized to its own longest field
+    Only the records in byte range [start, end) are read, start must be at a line start
+    '''
+
+    with open(in_file, 'r') as csv_file:
+        keys = csv_file.readline().strip().replace('"', '').split(',')
+        if start > csv_file.tell():
+            csv_file.seek(start)
+        size = -1 if end is None else max(end - csv_file.tell(), 0)
+        text = csv_file.read(size).replace('"', '').replace('\r', '').strip('\n')
+
+    return splitColumns(text, keys)
+
+
+def byteRanges(in_file, n_parts):
+    '''
+    Split the records of a .csv file into n_parts byte ranges [start, end) of about equal size
+    Every range starts at a line start, so readCSVColumns reads whole records of each
+    '''
+
+    size = os.path.getsize(in_file)
+    with open(in_file, 'rb') as f:
+        f.readline()
+        bounds = [f.tell()]
+        for k in range(1, n_parts):
+            f.seek(max(bounds[0] + (size - bounds[0]) * k // n_parts - 1, bounds[-1]))
+            f.readline()
+            bounds.append(min(f.tell(), size))
+    bounds.append(size)
+    return [(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+def storePartitions(store_dir, time_range=None):
+    '''
+    Day partition files of a column store (see column_store.py) in day order
+    Only the days overlapping time_range [t0, t1) (epoch seconds) if given
+    '''
+
+    files = sorted(f for f in os.listdir(store_dir) if f.endswith('.npz') and f != 'schema.npz')
+    if time_range is not None:
+        first_day = epochToStr(time_range[0] // 86400 * 86400)[:10]
+        last_day = epochToStr((time_range[1] - 1) // 86400 * 86400)[:10]
+        files = [f for f in files if first_day <= f[:10] <= last_day]
+    return [os.path.join(store_dir, f) for f in files]
+
+
+def readStoreColumns(store_dir, time_key, columns=None, time_range=None):
+    '''
+    Read typed columns of a column store, time_key in epoch seconds
+    Only the partitions of the days in time_range and only the listed columns (all if None) are read
+    '''
+
+    with np.load(os.path.join(store_dir, 'schema.npz')) as schema:
+        keys = [k for k in schema.files if columns is None or k in columns or k == time_key]
+        parts = {k: [schema[k]] for k in keys}
+    for part_file in storePartitions(store_dir, time_range):
+        with np.load(part_file) as part:
+            for k in keys:
+                parts[k].append(part[k])
+
+    return selectTimeRange({k: np.concatenate(v) for k, v in parts.items()}, time_key, time_range)
+
+
+def selectTimeRange(cols, time_key, time_range=None):
+    '''
+    Keep the rows of a dict of columns with time_key in [t0, t1)
+    '''
+    if time_range is None:
+        return cols
+    keep = (cols[time_key] >= time_range[0]) & (cols[time_key] < time_range[1])
+    return {k: v[keep] for k, v in cols.items()}
+
+
+def readTableColumns(in_file, time_key, columns=None, time_range=None, start=0, end=None):
+    '''
+    Read a raw table from its .csv file or from its column store directory (see column_store.py)
+    time_key is converted to epoch seconds, the other columns of a .csv file stay strings
+    Byte ranges [start, end) only apply to .csv files
+    '''
+
+    if os.path.isdir(in_file):
+        return readStoreColumns(in_file, time_key, columns, time_range)
+
+    raw = readCSVColumns(in_file, start, end)
+    if columns is not None:
+        raw = {k: v for k, v in raw.items() if k in columns or k == time_key}
+    raw[time_key] = parseTimeColumn(raw[time_key])
+    return selectTimeRange(raw, time_key, time_range)
+
+
+def splitColumns(text, keys):
+    '''
+    Split unquoted csv text (no header) into a dict of string columns
+    Fields must not contain commas, which holds for tables 5-7
+    '''
+
+    n_keys = len(keys)
+    fields = text.replace('\n', ',').split(',') if text else []
+    if len(fields) % n_keys != 0:
+        raise ValueError('Malformed csv: %d fields for %d columns' % (len(fields), n_keys))
+
+    return {k: np.array(fields[i::n_keys], dtype=str) for i, k in enumerate(keys)}
+
+
+def parseTimeColumn(col):
+    '''
+    Convert a column of '%Y-%m-%d %H:%M:%S' strings to epoch seconds
+    '''
+    return col.astype('datetime64[s]').astype(np.int64)
+
+
+def calcTimeWindowEpoch(epoch, win_size_min=20):
+    '''
+    Vectorized calcTimeWindow on epoch seconds
+    '''
+    win_size_sec = win_size_min * 60
+    return epoch // win_size_sec * win_size_sec
+
+
+def encodeColumn(col):
+    '''
+    Encode a string column as (sorted levels, int32 codes)
+    '''
+    levels, codes = np.unique(col, return_inverse=True)
+    return levels, codes.astype(np.int32)
+
+
+def epochToStr(epoch):
+    '''
+    Format epoch seconds the same way as str(datetime)
+    '''
+    return str(datetime.utcfromtimestamp(epoch))
+
+
+def epochWeekday(epoch):
+    '''
+    Same as datetime.weekday() for epoch seconds (1970-01-01 is a Thursday)
+    '''
+    return (epoch // 86400 + 3) % 7
+
+
+def loadVolumeColumns(in_file, start=0, end=None, time_range=None, columns=None):
+    '''
+    Load volume data file (table 6) or its column store as typed columns
+    Keys:
+    time, time_window (epoch seconds), tollgate_id, direction, vehicle_type (codes),
+    vehicle_model, has_etc (int)
+    Levels of the coded columns are kept in 'levels'
+    Only records with time in time_range [t0, t1) and the listed columns (all if None) are loaded
+    '''
+
+    raw = readTableColumns(in_file, 'time', columns, time_range, start, end)
+    vol = {'levels': {}}
+    vol['time'] = raw['time']
+    vol['time_window'] = calcTimeWindowEpoch(vol['time'])
+    for key in ['tollgate_id', 'direction', 'vehicle_type']:
+        if key in raw:
+            vol['levels'][key], vol[key] = encodeColumn(raw[key])
+    for key in ['vehicle_model', 'has_etc']:
+        if key in raw:
+            vol[key] = raw[key].astype(np.int32)
+
+    return vol
+
+
+def loadTrajColumns(in_file, start=0, end=None, time_range=None, columns=None):
+    '''
+    Load trajectory data file (table 5) or its column store as typed columns
+    Keys:
+    intersection_id, tollgate_id (codes), vehicle_id (int), starting_time,
+    time_window (epoch seconds), travel_seq (raw strings), travel_time (float)
+    Levels of the coded columns are kept in 'levels'
+    Only records with starting_time in time_range [t0, t1) and the listed columns (all if None) are loaded
+    '''
+
+    raw = readTableColumns(in_file, 'starting_time', columns, time_range, start, end)
+    traj = {'levels': {}}
+    for key in ['intersection_id', 'tollgate_id']:
+        if key in raw:
+            traj['levels'][key], traj[key] = encodeColumn(raw[key])
+    if 'vehicle_id' in raw:
+        traj['vehicle_id'] = raw['vehicle_id'].astype(np.int64)
+    traj['starting_time'] = raw['starting_time']
+    traj['time_window'] = calcTimeWindowEpoch(traj['starting_time'])
+    if 'travel_seq' in raw:
+        traj['travel_seq'] = raw['travel_seq']
+    if 'travel_time' in raw:
+        traj['travel_time'] = raw['travel_time'].astype(np.float64)
+
+    return traj
+
+
+def loadWeatherColumns(in_file, time_range=None):
+    '''
+    Load weather data file (table 7) or its column store as typed columns
+    Keys:
+    time (epoch seconds of date + hour), pressure, sea_pressure, wind_direction,
+    wind_speed, temperature, rel_humidity, precipitation (float)
+    '''
+
+    if os.path.isdir(in_file):
+        return readStoreColumns(in_file, 'time', time_range=time_range)
+
+    raw = readCSVColumns(in_file)
+    weather = {}
+    weather['time'] = raw['date'].astype('datetime64[s]').astype(np.int64) + \
+        raw['hour'].astype(np.int64) * 3600
+    for key in raw:
+        if key not in ('date', 'hour'):
+            weather[key] = raw[key].astype(np.float64)
+
+    return selectTimeRange(weather, 'time', time_range)
+
+
+def combineCodes(levels_a, codes_a, levels_b, codes_b):
+    '''
+    Combine two coded columns into one, e.g. (tollgate, direction) pairs
+    Combined levels are sorted tuples of the observed pairs
+    '''
+    pair_codes, codes = np.unique(codes_a.astype(np.int64) * len(levels_b) + codes_b,
+                                  return_inverse=True)
+    levels = [(levels_a[x // len(levels_b)], levels_b[x % len(levels_b)]) for x in pair_codes]
+    return levels, codes
+
+
+def aggregateWindows(time_window, keys, n_keys, values=None):
+    '''
+    Count rows (and sum values) per (time window, key) cell
+    Returns sorted window starts and (n_windows x n_keys) counts and sums
+    '''
+
+    tws, tw_idx = np.unique(time_window, return_inverse=True)
+    cells = tw_idx * n_keys + keys
+    counts = np.bincount(cells, minlength=len(tws)*n_keys).reshape(len(tws), n_keys)
+    if values is None:
+        return tws, counts, None
+    sums = np.bincount(cells, weights=values, minlength=len(tws)*n_keys).reshape(len(tws), n_keys)
+    return tws, counts, sums
+
+
+
+# columns the window aggregation needs besides the time
+windowColumns = {'volume': ['tollgate_id', 'direction'], 'traj': ['intersection_id', 'tollgate_id', 'travel_time']}
+
 
-def parseTrajFile(in_file, time_fmt='%Y-%m-%d %H:%M:%S'):
+def parseTrajFile(in_file, start=0, end=None, time_range=None, columns=None):
     '''
-    Parse trajectory data file
+    Parse trajectory data file into typed columns (see loadTrajColumns)
     Keys:
     intersection_id, tollgate_id, vehicle_id, starting_time, travel_seq, travel_time
     travel_seq: 105#2016-07-19 00:14:24#9.56;
@@ -52,179 +302,813 @@ def parseTrajFile(in_file, time_fmt='%Y-%m-%d %H:%M:%S'):
                 111#2016-07-19 00:14:41#13.00;
                 103#2016-07-19 00:14:54#7.47;
                 122#2016-07-19 00:15:02#32.85
+    travel_seq is kept as raw strings, hops are only split when needed
+    in_file may be a column store, time_range and columns are passed to loadTrajColumns
     '''
 
-    # f = open(in_file, 'r')
-    routes = set()
-    veh_info = []
-    fmt_str = '%Y-%m-%d %H:%M:%S'
+    with profiling.stage('parse', table='traj', file=in_file) as counters:
+        traj_info = loadTrajColumns(in_file, start, end, time_range, columns)
+        levels = traj_info['levels']
+        traj_info['levels']['route'], traj_info['route'] = combineCodes(
+            levels['intersection_id'], traj_info['intersection_id'],
+            levels['tollgate_id'], traj_info['tollgate_id'])
+        counters['rows'] = len(traj_info['starting_time'])
 
-    with open(in_file, 'r') as csv_file:
-        csv_r = csv.reader(csv_file)
-        keys = csv_r.next()
-        for row in csv_r:
-            rec = {x:y for x,y in zip(keys, row)}
-            ### Split travel seq as a list and convert time string to seconds ###
-            travel_seq = [x.split('#') for x in rec['travel_seq'].split(';')]
-            for t in travel_seq:
-                t[1] = datetime.strptime(t[1], time_fmt)
-            rec.update({'travel_seq':travel_seq})
-            rec.update({'starting_time':datetime.strptime(rec['starting_time'], time_fmt)})
-            ### Update related time window ###
-            time_window_minute = int(math.floor(rec['starting_time'].minute / 20) * 20)
-            start_time_window = datetime(rec['starting_time'].year, rec['starting_time'].month, rec['starting_time'].day,
-                                    rec['starting_time'].hour, time_window_minute, 0)
-            rec.update({'time_window':start_time_window})
-            veh_info.append(rec)
-            routes.add('%s-%s' % (row[0], row[1]))
-
-    print('All routes: %s' % ', '.join(list(routes)))
-    print('# of vehicles: %d' % len(veh_info))
-    # print(veh_info[:5])
-
-    return veh_info
-
-
-def dumpAverageTravelTime(traj_info, out_file, d_type, n_dps):
-    ''''
-    Aggregate and dump travel time info
+    print('All routes: %s' % ', '.join(['-'.join(x) for x in levels['route']]))
+    print('# of vehicles: %d' % len(traj_info['starting_time']))
+
+    return traj_info
+
+
+def splitTravelSeq(travel_seq):
+    '''
+    Split travel_seq strings into hops, all at once
+    Returns per hop: trajectory index, link id (int), link enter time (epoch seconds)
+    and link travel time (float)
+    '''
+
+    if len(travel_seq) == 0:
+        return (np.zeros(0, np.int64), np.zeros(0, np.int32), np.zeros(0, np.int64),
+                np.zeros(0, np.float64))
+
+    n_hops = np.char.count(travel_seq, ';') + 1
+    fields = ';'.join(travel_seq).replace('#', ';').split(';')
+    traj_idx = np.repeat(np.arange(len(travel_seq)), n_hops)
+    link_id = np.array(fields[0::3]).astype(np.int32)
+    enter_time = parseTimeColumn(np.array(fields[1::3]))
+    link_time = np.array(fields[2::3]).astype(np.float64)
+    return traj_idx, link_id, enter_time, link_time
+
+
+def loadRouteLinks(links_file, routes_file):
+    '''
+    Load link ids (table 3) and link sequences of the routes (table 4)
+    Returns sorted link ids, sorted (intersection, tollgate) routes and
+    a (n_routes x n_links) 0/1 matrix of the links on each route
+    '''
+
+    # in_top, out_top and link_seq hold commas, so these small tables go through the csv module
+    link_ids = np.sort(np.array([int(x['link_id']) for x in readCSVToList(links_file)], np.int32))
+    route_seqs = sorted(((x['intersection_id'], x['tollgate_id']), x['link_seq'])
+                        for x in readCSVToList(routes_file))
+    routes = [x[0] for x in route_seqs]
+    route_links = np.zeros((len(routes), len(link_ids)), np.int8)
+    for i, (route, link_seq) in enumerate(route_seqs):
+        route_links[i, np.searchsorted(link_ids, [int(x) for x in link_seq.split(',')])] = 1
+    return link_ids, routes, route_links
+
+
+def aggregateLinkTravelTime(traj_info, link_ids):
+    '''
+    Aggregate link travel time per (link, time window), windows by the time a vehicle enters the link
+    A link shared by several routes gets the hops of all of them
+    Returns window starts and (n_links x n_windows) counts and travel time sums
+    '''
+
+    _, link_id, enter_time, link_time = splitTravelSeq(traj_info['travel_seq'])
+    links = np.minimum(np.searchsorted(link_ids, link_id), len(link_ids) - 1)
+    if np.any(link_ids[links] != link_id):
+        raise ValueError('Unknown links in travel_seq: %s' %
+                         ', '.join(map(str, np.unique(link_id[link_ids[links] != link_id]))))
+    tws, counts, sums = aggregateWindows(calcTimeWindowEpoch(enter_time), links, len(link_ids), link_time)
+    return tws, counts.T, sums.T
+
+
+def dumpLinkTravelTime(traj_info, out_file, links_file, routes_file):
+    '''
+    Aggregate and dump link travel time as a compressed .npz
+    Keys: tws, link_ids, counts and sums (n_links x n_windows), routes and route_links
+    '''
+
+    link_ids, routes, route_links = loadRouteLinks(links_file, routes_file)
+    tws, counts, sums = aggregateLinkTravelTime(traj_info, link_ids)
+    np.savez_compressed(out_file, tws=tws, link_ids=link_ids,
+                        counts=counts.astype(np.int32), sums=sums.astype(np.float32),
+                        routes=np.array(['-'.join(x) for x in routes]), route_links=route_links)
+    print('# of link hops: %d in %d windows' % (counts.sum(), len(tws)))
+
+    return
+
+
+def aggregateTravelTime(traj_info):
+    '''
+    Aggregate travel time per (time window, route)
+    Returns window starts, routes and (n_windows x n_routes) counts and travel time sums
+    '''
+
+    routes = traj_info['levels']['route']
+    with profiling.stage('aggregate', table='traj') as counters:
+        tws, counts, sums = aggregateWindows(traj_info['time_window'], traj_info['route'],
+                                             len(routes), traj_info['travel_time'])
+        counters['windows'] = len(tws)
+    return tws, routes, counts, sums
+
+
+fillPolicies = ['zero', 'ffill', 'seasonal']
+
+
+def denseWindowStarts(tws, win_size_sec=1200):
+    '''
+    Starts of all windows from the first to the last of tws
+    '''
+    return np.arange(tws[0] // win_size_sec, tws[-1] // win_size_sec + 1) * win_size_sec
+
+
+def windowIndex(dense_tws, epoch, win_size_sec=1200):
+    '''
+    Row of the window holding epoch in a dense window index, -1 outside of it
+    Window number is epoch // win_size_sec, so the lookup is O(1)
+    '''
+    row = epoch // win_size_sec - dense_tws[0] // win_size_sec
+    return np.where((row >= 0) & (row < len(dense_tws)), row, -1)
+
+
+def denseWindows(tws, values, observed, win_size_sec=1200):
+    '''
+    Place per-window values on a dense window index, one row for every window
+    Windows missing from tws get 0 values and are not observed
+    Returns dense window starts, values and observed mask
+    '''
+
+    if len(tws) == 0:
+        return tws, values, observed
+
+    dense_tws = denseWindowStarts(tws, win_size_sec)
+    rows = windowIndex(dense_tws, tws, win_size_sec)
+    dense_values = np.zeros((len(dense_tws), values.shape[1]), values.dtype)
+    dense_observed = np.zeros((len(dense_tws), values.shape[1]), bool)
+    dense_values[rows] = values
+    dense_observed[rows] = observed
+
+    is_missing = np.ones(len(dense_tws), bool)
+    is_missing[rows] = False
+    for miss_win in dense_tws[is_missing]:
+        print 'Added missing data point: %s' % epochToStr(miss_win)
+
+    return dense_tws, dense_values, dense_observed
+
+
+def fillMissing(tws, values, observed, policy='zero', win_size_sec=1200):
+    '''
+    Fill the cells that are not observed
+    zero:     0
+    ffill:    last observed value of the same column, 0 before the first one
+    seasonal: mean of the observed values of the same column at the same time of week
+    Returns filled values and the cells that hold a value (observed or filled by ffill/seasonal)
+    '''
+
+    if policy == 'zero':
+        return np.where(observed, values, 0), observed
+
+    if policy == 'ffill':
+        last = np.where(observed, np.arange(len(tws))[:, None], -1)
+        last = np.maximum.accumulate(last, axis=0) if len(tws) > 0 else last
+        has_value = last >= 0
+        filled = values[np.maximum(last, 0), np.arange(values.shape[1])]
+        return np.where(has_value, filled, 0), has_value
+
+    if policy == 'seasonal':
+        n_slots = 7 * 86400 // win_size_sec
+        n_keys = values.shape[1]
+        cells = ((tws // win_size_sec) % n_slots)[:, None] * n_keys + np.arange(n_keys)
+        counts = np.bincount(cells[observed], minlength=n_slots*n_keys)
+        sums = np.bincount(cells[observed], weights=values[observed], minlength=n_slots*n_keys)
+        mean = (sums / np.maximum(counts, 1))[cells]
+        if values.dtype.kind in 'iu':
+            mean = np.rint(mean).astype(values.dtype)
+        has_value = observed | (counts[cells] > 0)
+        return np.where(observed, values, np.where(has_value, mean, 0)), has_value
+
+    raise ValueError('Unknown fill policy %s, expected one of %s' % (policy, ', '.join(fillPolicies)))
+
+
+def windowValues(tws, values, observed, d_type, fill='zero', win_size_sec=1200):
+    '''
+    Per-window values of a window csv
+    Training data is put on a dense window index first, so data points never straddle a gap;
+    testing data only holds the windows before the predicted ones and keeps the observed windows
+    Returns window starts, filled values and the cells that hold a value
+    '''
+
+    if d_type == 'train':
+        tws, values, observed = denseWindows(tws, values, observed, win_size_sec)
+    values, has_value = fillMissing(tws, values, observed, fill, win_size_sec)
+    return tws, values, has_value
+
+
+def windowOutputKeys(labels, n_dps, d_type, horizon=None):
+    '''
+    Header of the window csv, target columns are only included for training data
+    There are n_dps target windows unless horizon is given
     '''
 
-    avg_travel_time = {} # {time_window:{(intersec, tollgate): [tt, ...], ...}, ...}
-    routes = set()
-    for traj in traj_info:
-        route = (traj['intersection_id'], traj['tollgate_id'])
-        routes.add(route)
-        # avg_travel_time.setdefault(route, {})
-        # avg_travel_time[route].setdefault(traj['time_window'], []).append(float(traj['travel_time']))
-        avg_travel_time.setdefault(traj['time_window'], {})
-        avg_travel_time[traj['time_window']].setdefault(route, []).append(float(traj['travel_time']))
-
-    tws = avg_travel_time.keys()
-    tws.sort()
-    routes = list(routes)
-    routes.sort()
     output_keys = ['win_start','time_of_win','weekday'] + \
-        ['%s_%d' % ('-'.join(x),y) for y in range(n_dps) for x in routes]
+        ['%s_%d' % ('-'.join(x),y) for y in range(n_dps) for x in labels]
+    if d_type == 'train':
+        output_keys += ['y_%s_%d' % ('-'.join(x),y) for y in range(n_dps if horizon is None else horizon)
+                        for x in labels]
+    return output_keys
+
+
+def windowRowStarts(n_windows, n_dps, d_type):
+    '''
+    Index of the first window of every data point
+    Training data creates a data point with each 20min window, testing data one per n_dps windows
+    '''
 
     if d_type == 'train':
-        ### Add missing time windows with 0 values for all routes ###
-        for i in range(1,len(tws)):
-            diff_win = (tws[i] - tws[i-1]).seconds / 1200
-            if diff_win > 1:
-                for j in range(diff_win-1):
-                    miss_win = tws[i-1] + timedelta(seconds=1200*(j+1))
-                    avg_travel_time[miss_win] = {}
-                    for rt in routes:
-                        avg_travel_time[miss_win][rt] = [0]
-                    print 'Added missing data point: %s %s' % (str(miss_win), avg_travel_time[miss_win])
-
-        ### Update time windws ###
-        tws = avg_travel_time.keys()
-        tws.sort()
-
-        ### For training data, add target values and creat data points with each 20min window ###
-        output_keys += ['y_%s_%d' % ('-'.join(x),y) for y in range(n_dps) for x in routes]
         last_dp = 2*n_dps-1
         dp_to_use = 1
     elif d_type == 'test':
         last_dp = n_dps-1
         dp_to_use = n_dps
+    return np.arange(0, max(n_windows-last_dp, 0), dp_to_use)
 
-    with open(out_file, 'w') as csv_file:
-        csv_file.write('%s\n' % ','.join(output_keys))
-        # for i, tw in enumerate(tws[:last_dp if last_dp != 0 else None]):
-        for i in range(0, len(tws)-last_dp, dp_to_use):
-            line = '%s,%s,%d' % (str(tws[i]), str(tws[i+n_dps-1]), tws[i].weekday())
-            for j in range(n_dps):
-                for rt in routes:
-                    if rt in avg_travel_time[tws[i+j]]:
-                        line = '%s,%.4f' % (line, np.mean(avg_travel_time[tws[i+j]][rt]))
-                    else:
-                        line = '%s,0' % line
-
-            if d_type == 'train':
-                for j in range(n_dps):
-                    for rt in routes:
-                        if rt in avg_travel_time[tws[n_dps+i+j]]:
-                            line = '%s,%.4f' % (line, np.mean(avg_travel_time[tws[n_dps+i+j]][rt]))
-                        else:
-                            line = '%s,0' % line
-
-            csv_file.write(line+'\n')
+
+def windowTensor(per_window, span, row_starts):
+    '''
+    Sliding-window view of a (n_windows x n_keys) array as (n_points x span x n_keys)
+    Only the selected rows are copied out of the strided view
+    '''
+
+    n_views = max(per_window.shape[0] - span + 1, 0)
+    view = as_strided(per_window, shape=(n_views, span, per_window.shape[1]),
+                      strides=(per_window.strides[0], per_window.strides[0], per_window.strides[1]))
+    return view[row_starts]
+
+
+def epochToStrArray(epoch):
+    '''
+    Vectorized epochToStr
+    '''
+    return np.char.replace(np.datetime_as_string(epoch.astype('datetime64[s]')), 'T', ' ')
+
+
+def buildWindowTable(tws, values, has_value, fmt, n_dps, d_type, first_row=0):
+    '''
+    Build the csv cells of every data point, starting with data point first_row
+    Cells without a value are written as 0
+    Returns a (n_points x n_columns) string array
+    '''
+
+    row_starts = windowRowStarts(len(tws), n_dps, d_type)[first_row:]
+    span = 2*n_dps if d_type == 'train' else n_dps
+    if len(row_starts) == 0:
+        return np.zeros((0, 3 + span * values.shape[1]), dtype=str)
+
+    with profiling.stage('window_build', rows=len(row_starts), columns=values.shape[1]):
+        ### Format every window once, data points are views over the formatted windows ###
+        first = row_starts[0]
+        cells = np.where(has_value[first:], np.char.mod(fmt, values[first:]), '0')
+        features = windowTensor(cells, span, row_starts - first)
+
+        return np.hstack([epochToStrArray(tws[row_starts])[:, None],
+                          epochToStrArray(tws[row_starts+n_dps-1])[:, None],
+                          epochWeekday(tws[row_starts]).astype(str)[:, None],
+                          features.reshape(len(row_starts), -1)])
+
+
+def writeWindowRows(csv_file, table):
+    '''
+    Write the data points of a window table
+    Returns the file offset after each written line
+    '''
+
+    offset = csv_file.tell()
+    np.savetxt(csv_file, table, fmt='%s', delimiter=',')
+
+    line_len = np.char.str_len(table).sum(1) + table.shape[1]
+    return list(offset + np.cumsum(line_len))
+
+
+def readWindowTable(csv_file):
+    '''
+    Read a window csv as header and (n_points x n_columns) string array
+    '''
+
+    with open(csv_file, 'r') as f:
+        header = f.readline().strip().split(',')
+        text = f.read().strip('\n')
+    fields = text.replace('\n', ',').split(',') if text else []
+    return header, np.array(fields, dtype=str).reshape(-1, len(header))
+
+
+def windowCacheDir(csv_file):
+    '''
+    Directory of the binary cache of a window csv
+    '''
+    return '%s.cache' % csv_file.split('.csv')[0]
+
+
+def windowCacheKey(csv_file, n_dps):
+    '''
+    Cache key: md5 of the window csv and the window size
+    '''
+    md5 = hashlib.md5()
+    with open(csv_file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            md5.update(block)
+    return '%s_%d' % (md5.hexdigest(), n_dps)
+
+
+def windowCacheArrays(header, table):
+    '''
+    Typed arrays of a window table
+    header, win_start, time_of_win (epoch seconds), x (inputs), y (targets)
+    '''
+
+    n_inputs = len([h for h in header[3:] if not h.startswith('y_')])
+    values = table[:, 3:].astype(np.float64)
+    return {'header': np.array(header),
+            'win_start': parseTimeColumn(table[:, 0]),
+            'time_of_win': parseTimeColumn(table[:, 1]),
+            'x': values[:, :n_inputs],
+            'y': values[:, n_inputs:]}
+
+
+def saveWindowCache(csv_file, n_dps, arrays):
+    '''
+    Save window arrays as .npy files in the cache directory of csv_file
+    The key file is written last, so a partially written cache never looks valid
+    '''
+
+    cache_dir = windowCacheDir(csv_file)
+    key_file = os.path.join(cache_dir, 'key')
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    if os.path.exists(key_file):
+        os.remove(key_file)
+
+    for name, arr in arrays.items():
+        tmp_file = os.path.join(cache_dir, '%s.tmp.npy' % name)
+        np.save(tmp_file, arr)
+        os.rename(tmp_file, os.path.join(cache_dir, '%s.npy' % name))
+
+    with open(key_file + '.tmp', 'w') as f:
+        f.write(windowCacheKey(csv_file, n_dps))
+    os.rename(key_file + '.tmp', key_file)
+
+
+def dumpWindowCache(csv_file, n_dps, header, table):
+    '''
+    Save the binary cache of a window csv from its header and string table
+    '''
+    saveWindowCache(csv_file, n_dps, windowCacheArrays(header, table))
+
+
+def loadWindowCache(csv_file, n_dps):
+    '''
+    Memory-map the binary cache of a window csv
+    Returns None if the cache is missing or was built from a different csv or window size
+    '''
+
+    cache_dir = windowCacheDir(csv_file)
+    key_file = os.path.join(cache_dir, 'key')
+    if not os.path.exists(key_file):
+        return None
+    with open(key_file, 'r') as f:
+        if f.read() != windowCacheKey(csv_file, n_dps):
+            return None
+
+    cache = {}
+    for name in ['header', 'win_start', 'time_of_win', 'x', 'y']:
+        cache[name] = np.load(os.path.join(cache_dir, '%s.npy' % name), mmap_mode='r')
+    cache['header'] = list(cache['header'])
+    return cache
+
+
+def loadWindowData(csv_file, n_dps):
+    '''
+    Load a window csv through its binary cache, parsing the csv only if the cache is stale
+    '''
+
+    cache = loadWindowCache(csv_file, n_dps)
+    if cache is None:
+        print('Window cache of %s is stale, parsing csv' % csv_file)
+        header, table = readWindowTable(csv_file)
+        dumpWindowCache(csv_file, n_dps, header, table)
+        cache = loadWindowCache(csv_file, n_dps)
+    return cache
+
+
+def outputBase(in_file, time_range=None):
+    '''
+    Base name of the files written for a raw volume or trajectory file (or column store)
+    A time range [t0, t1) is part of the name, so a slice never replaces the outputs of the full history
+    '''
+    base = in_file.split('.csv')[0]
+    if time_range is None:
+        return base
+    tags = [epochToStr(t)[:10] if t % 86400 == 0 else epochToStr(t).replace(' ', 'T').replace(':', '')
+            for t in time_range]
+    return '%s_%s_%s' % (base, tags[0], tags[1])
+
+
+def seriesFile(in_file, base_min=20, time_range=None):
+    '''
+    Base window series of a raw volume or trajectory file
+    '''
+    return '%s_%dmin_series.npz' % (outputBase(in_file, time_range), base_min)
+
+
+def aggregateSeries(info, table, base_min=20):
+    '''
+    Aggregate parsed volume or trajectory records per (base window, label) for any base window width
+    Returns window starts, labels, counts and travel time sums (None for volume)
+    '''
+
+    if table == 'volume':
+        labels, keys, time, values = info['levels']['toll_dir'], info['toll_dir'], info['time'], None
+    else:
+        labels, keys, time, values = info['levels']['route'], info['route'], info['starting_time'], info['travel_time']
+    tws, counts, sums = aggregateWindows(calcTimeWindowEpoch(time, base_min), keys, len(labels), values)
+    return tws, labels, counts, sums
+
+
+def dumpSeries(series_file, tws, labels, counts, sums, base_sec, table):
+    '''
+    Save a base window series: observed window starts, labels and per-window counts (and travel time sums)
+    Any window geometry is derived from it by seriesWindows, without parsing the raw file again
+    '''
+
+    tmp_file = series_file[:-len('.npz')] + '.tmp.npz'
+    np.savez(tmp_file, tws=np.asarray(tws, np.int64), labels=np.array([list(x) for x in labels]),
+             counts=counts, sums=np.zeros((0, 0)) if sums is None else sums, base_sec=base_sec, table=table)
+    os.rename(tmp_file, series_file)
+
+
+def loadSeries(series_file):
+    series = dict(np.load(series_file))
+    series['table'] = str(series['table'])
+    series['base_sec'] = int(series['base_sec'])
+    return series
+
+
+def mergeSeriesWindows(tws, counts, sums, win_size_sec):
+    '''
+    Merge base windows into windows of win_size_sec (a multiple of the base width)
+    '''
+    if len(tws) == 0:
+        return tws, counts, sums
+    merged_tws, first = np.unique(tws // win_size_sec * win_size_sec, return_index=True)
+    return merged_tws, np.add.reduceat(counts, first, axis=0), \
+        None if sums is None else np.add.reduceat(sums, first, axis=0)
+
+
+def seriesWindows(series, n_in, horizon=None, stride=1, merge=1, d_type='train', fill='zero'):
+    '''
+    Data points of any window geometry from a base window series
+    n_in input windows, horizon target windows (n_in by default), a data point every stride windows,
+    windows of merge base windows each; testing data has no targets and a data point every n_in windows
+    Data points are taken from a strided view over the per-window values, like in buildWindowTable,
+    so only the selected points are copied
+    Returns the arrays of windowCacheArrays and the window width in seconds
+    '''
+
+    win_size_sec = series['base_sec'] * merge
+    labels = [tuple(x) for x in series['labels']]
+    sums = series['sums'] if series['table'] != 'volume' else None
+    tws, counts, sums = mergeSeriesWindows(series['tws'], series['counts'], sums, win_size_sec)
+    if sums is None:
+        values, observed = counts, np.ones(counts.shape, bool)
+    else:
+        values, observed = sums / np.maximum(counts, 1), counts > 0
+    tws, values, _ = windowValues(tws, values, observed, d_type, fill, win_size_sec)
+
+    if d_type == 'train':
+        horizon = n_in if horizon is None else horizon
+    else:
+        horizon, stride = 0, n_in
+    span = n_in + horizon
+    n_views = max(len(tws) - span + 1, 0)
+    points = as_strided(values, shape=(n_views, span, values.shape[1]),
+                        strides=(values.strides[0], values.strides[0], values.strides[1]))[::stride]
+    row_starts = np.arange(n_views)[::stride]
+
+    return {'header': windowOutputKeys(labels, n_in, d_type, horizon),
+            'win_start': tws[row_starts],
+            'time_of_win': tws[row_starts + n_in - 1],
+            'x': points[:, :n_in].reshape(len(row_starts), -1).astype(np.float64),
+            'y': points[:, n_in:].reshape(len(row_starts), -1).astype(np.float64),
+            'win_size_sec': win_size_sec}
+
+
+def dumpAverageTravelTime(traj_info, out_file, d_type, n_dps, fill='zero'):
+    ''''
+    Aggregate and dump travel time info
+    A (window, route) cell is missing if no vehicle started the route in the window
+    '''
+
+    tws, routes, counts, sums = aggregateTravelTime(traj_info)
+    dumpTravelTimeWindows(tws, routes, counts, sums, out_file, d_type, n_dps, fill)
 
     return
 
 
-def parseVolumeFile(in_file, time_fmt='%Y-%m-%d %H:%M:%S'):
+def dumpTravelTimeWindows(tws, routes, counts, sums, out_file, d_type, n_dps, fill='zero'):
+    '''
+    Dump per-window travel time counts and sums of routes as the average travel time window csv
     '''
-    Parse data file and aggregate volume info
+
+    tws, avg_travel_time, has_tt = windowValues(tws, sums / np.maximum(counts, 1), counts > 0, d_type, fill)
+
+    output_keys = windowOutputKeys(routes, n_dps, d_type)
+    table = buildWindowTable(tws, avg_travel_time, has_tt, '%.4f', n_dps, d_type)
+    with profiling.stage('write', file=out_file, rows=len(table)):
+        with open(out_file, 'w') as csv_file:
+            csv_file.write('%s\n' % ','.join(output_keys))
+            writeWindowRows(csv_file, table)
+        dumpWindowCache(out_file, n_dps, output_keys, table)
+
+    return
+
+
+def parseVolumeFile(in_file, start=0, end=None, time_range=None, columns=None):
+    '''
+    Parse volume data file into typed columns (see loadVolumeColumns)
     Format:
         "time","tollgate_id","direction","vehicle_model","has_etc","vehicle_type"
         "2016-09-19 23:09:25","2","0","1","0",""
-
+    in_file may be a column store, time_range and columns are passed to loadVolumeColumns
     '''
 
-    vol_info = readCSVToList(in_file, 'time', time_fmt)
+    with profiling.stage('parse', table='volume', file=in_file) as counters:
+        vol_info = loadVolumeColumns(in_file, start, end, time_range, columns)
+        levels = vol_info['levels']
+        vol_info['levels']['toll_dir'], vol_info['toll_dir'] = combineCodes(
+            levels['tollgate_id'], vol_info['tollgate_id'],
+            levels['direction'], vol_info['direction'])
+        counters['rows'] = len(vol_info['time'])
+
     return vol_info
 
 
-def dumpAverageVolume(vol_info, out_file, d_type, n_dps):
+def aggregateVolume(vol_info):
+    '''
+    Aggregate traffic volume per (time window, tollgate, direction)
+    Returns window starts, (tollgate, direction) pairs and (n_windows x n_pairs) counts
+    '''
+
+    tollgates = vol_info['levels']['toll_dir']
+    with profiling.stage('aggregate', table='volume') as counters:
+        tws, counts, _ = aggregateWindows(vol_info['time_window'], vol_info['toll_dir'], len(tollgates))
+        counters['windows'] = len(tws)
+    return tws, tollgates, counts
+
+
+def dumpAverageVolume(vol_info, out_file, d_type, n_dps, fill='zero'):
     ''''
     Aggregate and dump traffic volume info
+    Only windows without any vehicle are missing, otherwise a tollgate without vehicles has volume 0
     '''
 
-    agg_vol = {} # {(intersec, tollgate):{time_window: [tt, ...], ...}, ...}
-    tollgates = set()
-    for vol in vol_info:
-        toll_dir = (vol['tollgate_id'], vol['direction'])
-        tollgates.add(toll_dir)
-        # agg_vol.setdefault(toll_dir, {})
-        # agg_vol[toll_dir].setdefault(vol['time_window'], []).append(1)
-        agg_vol.setdefault(vol['time_window'], {})
-        agg_vol[vol['time_window']].setdefault(toll_dir, []).append(1)
-
-    tws = agg_vol.keys()
-    tws.sort()
-    tollgates = list(tollgates)
-    tollgates.sort()
-    output_keys = ['win_start','time_of_win','weekday'] + \
-        ['%s_%d' % ('-'.join(x),y) for y in range(n_dps) for x in tollgates]
+    tws, tollgates, agg_vol = aggregateVolume(vol_info)
+    dumpVolumeWindows(tws, tollgates, agg_vol, out_file, d_type, n_dps, fill)
 
-    if d_type == 'train':
-        ### For training data, add target values and creat data points with each 20min window ###
-        output_keys += ['y_%s_%d' % ('-'.join(x),y) for y in range(n_dps) for x in tollgates]
-        last_dp = 2*n_dps-1
-        dp_to_use = 1
-    elif d_type == 'test':
-        last_dp = n_dps-1
-        dp_to_use = n_dps
+    return
+
+
+def dumpVolumeWindows(tws, tollgates, agg_vol, out_file, d_type, n_dps, fill='zero'):
+    '''
+    Dump per-window volume of (tollgate, direction) pairs as the volume window csv
+    '''
+
+    tws, agg_vol, has_vol = windowValues(tws, agg_vol, np.ones(agg_vol.shape, bool), d_type, fill)
 
-    with open(out_file, 'w') as csv_file:
-        csv_file.write('%s\n' % ','.join(output_keys))
-        # for i, tw in enumerate(tws[:last_dp if last_dp != 0 else None]):
-        for i in range(0, len(tws)-last_dp, dp_to_use):
-            line = '%s,%s,%d' % (str(tws[i]), str(tws[i+n_dps-1]), tws[i].weekday())
-            for j in range(n_dps):
-                for toll in tollgates:
-                    if toll in agg_vol[tws[i+j]]:
-                        line = '%s,%d' % (line, len(agg_vol[tws[i+j]][toll]))
-                    else:
-                        line = '%s,0' % line
-
-            if d_type == 'train':
-                for j in range(n_dps):
-                    for toll in tollgates:
-                        if toll in agg_vol[tws[n_dps+i+j]]:
-                            line = '%s,%d' % (line, len(agg_vol[tws[n_dps+i+j]][toll]))
-                        else:
-                            line = '%s,0' % line
-
-            csv_file.write(line+'\n')
+    output_keys = windowOutputKeys(tollgates, n_dps, d_type)
+    table = buildWindowTable(tws, agg_vol, has_vol, '%d', n_dps, d_type)
+    with profiling.stage('write', file=out_file, rows=len(table)):
+        with open(out_file, 'w') as csv_file:
+            csv_file.write('%s\n' % ','.join(output_keys))
+            writeWindowRows(csv_file, table)
+        dumpWindowCache(out_file, n_dps, output_keys, table)
 
     return 
 
 
+def fileHeadHash(in_file, n_bytes=1 << 16):
+    '''
+    md5 of the first n_bytes of a file, used to tell appends from rewrites
+    '''
+    with open(in_file, 'rb') as f:
+        return hashlib.md5(f.read(n_bytes)).hexdigest()
+
+
+def loadWindowState(state_file, in_file):
+    '''
+    Load the persisted per-window aggregates of in_file
+    Returns None if there is no state or in_file was rewritten since it was saved
+    '''
+
+    if not os.path.exists(state_file):
+        return None
+    with open(state_file, 'rb') as f:
+        state = dict(np.load(f))
+    if os.path.getsize(in_file) < state['offset'] or \
+            fileHeadHash(in_file, int(state['head_bytes'])) != str(state['head_hash']):
+        print('%s was rewritten, rebuilding %s' % (in_file, state_file))
+        return None
+
+    state['labels'] = [tuple(x) for x in state['labels']]
+    return state
+
+
+def saveWindowState(state_file, state):
+    '''
+    Atomically save per-window aggregates
+    '''
+
+    tmp_file = state_file + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        np.savez(f, **state)
+    os.rename(tmp_file, state_file)
+
+
+def mergeWindowState(state, tws, labels, counts, sums):
+    '''
+    Add new per-window counts (and sums) to the persisted ones
+    Windows and labels missing from the state are inserted in sorted order
+    '''
+
+    all_labels = sorted(set(state['labels']) | set(labels))
+    all_tws = np.union1d(state['tws'], tws)
+    merged = {'labels': all_labels, 'tws': all_tws}
+    for key, new in [('counts', counts), ('sums', sums)]:
+        if new is None:
+            continue
+        agg = np.zeros((len(all_tws), len(all_labels)), new.dtype)
+        if len(state['tws']) > 0:
+            agg[np.ix_(np.searchsorted(all_tws, state['tws']),
+                       [all_labels.index(x) for x in state['labels']])] += state[key]
+        agg[np.ix_(np.searchsorted(all_tws, tws),
+                   [all_labels.index(x) for x in labels])] += new
+        merged[key] = agg
+    return merged
+
+
+def aggregateRange(job):
+    '''
+    Parse and aggregate the records of one byte range of a raw file (or one time range of a column store),
+    run by the workers of parallelAggregate
+    '''
+
+    in_file, table, start, end, time_range, base_min = job
+    if table == 'volume':
+        info = parseVolumeFile(in_file, start=start, end=end, time_range=time_range,
+                               columns=windowColumns['volume'])
+    else:
+        info = parseTrajFile(in_file, start=start, end=end, time_range=time_range, columns=windowColumns['traj'])
+    return aggregateSeries(info, table, base_min)
+
+
+def storeTimeRanges(store_dir, n_parts, time_range=None):
+    '''
+    Split the days of a column store into n_parts time ranges of consecutive day partitions
+    '''
+
+    days = np.unique([int(parseTimeColumn(np.array([os.path.basename(f)[:10]]))[0])
+                      for f in storePartitions(store_dir, time_range)])
+    ranges = []
+    for part in np.array_split(days, min(n_parts, len(days))) if len(days) > 0 else []:
+        t0, t1 = part[0], part[-1] + 86400
+        if time_range is not None:
+            t0, t1 = max(t0, time_range[0]), min(t1, time_range[1])
+        ranges.append((t0, t1))
+    return ranges
+
+
+def parallelAggregate(in_file, table, workers, base_min=20, range_bytes=1 << 26, time_range=None):
+    '''
+    Parse and aggregate a raw volume or trajectory file on a pool of worker processes
+    The file is split into newline-aligned byte ranges of at most range_bytes (at least one per worker),
+    a column store into ranges of day partitions,
+    per-window counts (and travel time sums) of the ranges are added up with mergeWindowState
+    Returns window starts, labels, counts and sums like aggregateSeries on the whole file
+    '''
+
+    if os.path.isdir(in_file):
+        jobs = [(in_file, table, 0, None, tr, base_min) for tr in storeTimeRanges(in_file, workers, time_range)]
+    else:
+        n_parts = max(workers, -(-os.path.getsize(in_file) // range_bytes))
+        jobs = [(in_file, table, start, end, time_range, base_min) for start, end in byteRanges(in_file, n_parts)]
+    state = {'labels': [], 'tws': np.zeros(0, np.int64),
+             'counts': np.zeros((0, 0), np.int64), 'sums': np.zeros((0, 0))}
+
+    with profiling.stage('parallel_aggregate', table=table, file=in_file, workers=workers,
+                         ranges=len(jobs)) as counters:
+        pool = multiprocessing.Pool(workers)
+        try:
+            for tws, labels, counts, sums in pool.imap(aggregateRange, jobs):
+                merged = mergeWindowState(state, tws, labels, counts, sums)
+                state.update(merged)
+        finally:
+            pool.close()
+            pool.join()
+        counters['rows'] = int(state['counts'].sum())
+        counters['windows'] = len(state['tws'])
+
+    return state['tws'], state['labels'], state['counts'], state['sums'] if table == 'traj' else None
+
+
+def updateAverageWindows(in_file, out_file, d_type, n_dps, table, fill='zero'):
+    '''
+    Incrementally update the window csv of a raw volume or trajectory file
+    Per-window counts (and travel time sums) are kept in <in_file>_20min_state.npz
+    with the byte offset of in_file already processed, so only appended records are
+    parsed and only the data points covering their windows are rewritten
+    '''
+
+    state_file = '%s_20min_state.npz' % in_file.split('.csv')[0]
+    state = loadWindowState(state_file, in_file)
+    start = int(state['offset']) if state else 0
+    end = os.path.getsize(in_file)
+
+    if table == 'volume':
+        tws, labels, counts = aggregateVolume(parseVolumeFile(in_file, start=start, end=end))
+        sums = None
+    else:
+        tws, labels, counts, sums = aggregateTravelTime(parseTrajFile(in_file, start=start, end=end))
+    print('%s: %d new records in %d windows' % (in_file, counts.sum(), len(tws)))
+
+    if state is None:
+        state = {'labels': [], 'tws': np.zeros(0, np.int64), 'row_ends': np.zeros(0, np.int64),
+                 'counts': np.zeros((0, 0), np.int64), 'sums': np.zeros((0, 0))}
+        old_labels, old_tws = None, None
+    else:
+        old_labels, old_tws = state['labels'], state['tws']
+    if len(tws) == 0 and os.path.exists(out_file):
+        return
+
+    merged = mergeWindowState(state, tws, labels, counts, sums)
+    merged['sums'] = merged.get('sums', np.zeros((0, 0)))
+    merged.update({'offset': end, 'n_dps': n_dps, 'd_type': d_type, 'fill': fill,
+                   'head_bytes': min(end, 1 << 16), 'head_hash': fileHeadHash(in_file, min(end, 1 << 16))})
+
+    ### Build per-window values the same way as the dump functions ###
+    if table == 'volume':
+        values, observed, fmt = merged['counts'], np.ones(merged['counts'].shape, bool), '%d'
+    else:
+        values, observed, fmt = merged['sums'] / np.maximum(merged['counts'], 1), merged['counts'] > 0, '%.4f'
+    win_tws, values, has_value = windowValues(merged['tws'], values, observed, d_type, fill)
+    old_win_tws = old_tws
+    if d_type == 'train' and old_tws is not None and len(old_tws) > 0:
+        old_win_tws = denseWindowStarts(old_tws)
+
+    ### Find the first data point that changed, everything before it is kept ###
+    ### Seasonal means depend on all windows, so seasonal fill always rewrites everything ###
+    row_ends = list(state['row_ends'])
+    rewrite_all = old_labels != merged['labels'] or not os.path.exists(out_file) or \
+        int(state.get('n_dps', -1)) != n_dps or str(state.get('d_type', '')) != d_type or \
+        str(state.get('fill', 'zero')) != fill or fill == 'seasonal' or \
+        len(row_ends) == 0 or os.path.getsize(out_file) != row_ends[-1]
+    first_row = 0
+    if not rewrite_all:
+        first_win = np.searchsorted(win_tws, tws[0])
+        n_common = min(len(old_win_tws), len(win_tws))
+        differs = np.nonzero(old_win_tws[:n_common] != win_tws[:n_common])[0]
+        if len(differs) > 0:
+            first_win = min(first_win, differs[0])
+        first_win = min(first_win, n_common)
+        row_starts = windowRowStarts(len(win_tws), n_dps, d_type)
+        last_dp = 2*n_dps-1 if d_type == 'train' else n_dps-1
+        first_row = int(np.searchsorted(row_starts, first_win - last_dp))
+        first_row = min(first_row, len(row_ends) - 1)
+
+    old_cache = loadWindowCache(out_file, n_dps) if first_row > 0 else None
+    window_table = buildWindowTable(win_tws, values, has_value, fmt, n_dps, d_type, first_row)
+    if first_row == 0:
+        with open(out_file, 'w') as csv_file:
+            csv_file.write('%s\n' % ','.join(windowOutputKeys(merged['labels'], n_dps, d_type)))
+            row_ends = [csv_file.tell()]
+            row_ends += writeWindowRows(csv_file, window_table)
+    else:
+        ### row_ends[0] is the end of the header, row_ends[k+1] the end of data point k ###
+        with open(out_file, 'r+') as csv_file:
+            csv_file.seek(row_ends[first_row])
+            csv_file.truncate()
+            row_ends = row_ends[:first_row+1]
+            row_ends += writeWindowRows(csv_file, window_table)
+        print('Rewrote data points %d to %d of %s' % (first_row, len(row_ends)-2, out_file))
+
+    ### Keep the cached data points before first_row as well ###
+    output_keys = windowOutputKeys(merged['labels'], n_dps, d_type)
+    arrays = windowCacheArrays(output_keys, window_table)
+    if old_cache is not None:
+        for name in ['win_start', 'time_of_win', 'x', 'y']:
+            arrays[name] = np.concatenate([old_cache[name][:first_row], arrays[name]])
+    elif first_row > 0:
+        arrays = windowCacheArrays(*readWindowTable(out_file))
+    saveWindowCache(out_file, n_dps, arrays)
+
+    merged['row_ends'] = np.array(row_ends, np.int64)
+    merged['labels'] = np.array(merged['labels'])
+    saveWindowState(state_file, merged)
+    dumpSeries(seriesFile(in_file), merged['tws'], merged['labels'], merged['counts'],
+               merged['sums'] if table == 'traj' else None, 1200, table)
+
+    return
+
+
 def main():
 
     parser = argparse.ArgumentParser(description="Script to parse volume and traffic time data file")
@@ -250,6 +1134,11 @@ def main():
         type=str,
         default='train')
 
+    parser.add_argument('--incremental',
+        dest='incremental',
+        action='store_true',
+        help='Only process records appended since the last incremental run')
+
     parser.add_argument('--win-size',
         dest='win_size',
         action='store',
@@ -257,6 +1146,57 @@ def main():
         type=int,
         default=6)
 
+    parser.add_argument('--link-features',
+        dest='link_features',
+        action='store_true',
+        help='Also dump link travel time per 20-min window (<traj-file>_20min_link.npz)')
+
+    parser.add_argument('--links-file',
+        dest='links_in',
+        action='store',
+        help='Link data file (table 3)',
+        type=str,
+        default='../dataSets/training/links_table3.csv')
+
+    parser.add_argument('--routes-file',
+        dest='routes_in',
+        action='store',
+        help='Route data file (table 4)',
+        type=str,
+        default='../dataSets/training/routes_table4.csv')
+
+    parser.add_argument('--series-min',
+        dest='series_min',
+        action='store',
+        help='Width in minutes of the base windows of <file>_<n>min_series.npz (10 or 30 allow merged windows)',
+        type=int,
+        default=20)
+
+    parser.add_argument('--workers',
+        dest='workers',
+        action='store',
+        help='Parse and aggregate the raw files in byte ranges (day ranges of a column store) on this many processes',
+        type=int,
+        default=1)
+
+    parser.add_argument('--time-range',
+        dest='time_range',
+        action='store',
+        nargs=2,
+        help='Only use the records in [START, END), dates or "YYYY-MM-DD HH:MM:SS" times (not with --incremental), '
+             'the range is added to the output file names',
+        type=str,
+        default=None)
+
+    parser.add_argument('--fill',
+        dest='fill',
+        action='store',
+        help='Fill policy of missing windows: zero, ffill (carry forward) or seasonal (time-of-week mean)',
+        choices=fillPolicies,
+        default='zero')
+
+    profiling.addProfileArgs(parser)
+
     # parser.add_argument('--dump-target',
     #     dest='tar_val',
     #     action='store',
@@ -265,18 +1205,51 @@ def main():
     #     default=False)
 
     args = parser.parse_args()
+    profiling.configure(args)
+    if args.incremental and (args.time_range or os.path.isdir(args.traj_in) or os.path.isdir(args.vol_in)):
+        parser.error('--incremental needs the raw .csv files and no --time-range')
+    time_range = None if args.time_range is None else tuple(parseTimeColumn(np.array(args.time_range)))
 
     traj_in_file = args.traj_in
-    traj_out_file = '%s_20min_avg_%d_window.csv' % (traj_in_file.split('.csv')[0], args.win_size)
+    traj_out_file = '%s_20min_avg_%d_window.csv' % (outputBase(traj_in_file, time_range), args.win_size)
     vol_in_file = args.vol_in
-    vol_out_file = '%s_20min_avg_%d_window.csv' % (vol_in_file.split('.csv')[0], args.win_size)
+    vol_out_file = '%s_20min_avg_%d_window.csv' % (outputBase(vol_in_file, time_range), args.win_size)
 
-    traj_info = parseTrajFile(traj_in_file)
-    vol_info = parseVolumeFile(vol_in_file)
-    dumpAverageTravelTime(traj_info, traj_out_file, args.d_type, args.win_size)
-    dumpAverageVolume(vol_info, vol_out_file, args.d_type, args.win_size)
+    link_out_file = '%s_20min_link.npz' % outputBase(traj_in_file, time_range)
+
+    traj_info = None
+    if args.incremental:
+        updateAverageWindows(traj_in_file, traj_out_file, args.d_type, args.win_size, 'traj', args.fill)
+        updateAverageWindows(vol_in_file, vol_out_file, args.d_type, args.win_size, 'volume', args.fill)
+    elif args.workers > 1:
+        for in_file, out_file, table in [(traj_in_file, traj_out_file, 'traj'), (vol_in_file, vol_out_file, 'volume')]:
+            tws, labels, counts, sums = parallelAggregate(in_file, table, args.workers, time_range=time_range)
+            if table == 'traj':
+                dumpTravelTimeWindows(tws, labels, counts, sums, out_file, args.d_type, args.win_size, args.fill)
+            else:
+                dumpVolumeWindows(tws, labels, counts, out_file, args.d_type, args.win_size, args.fill)
+            if args.series_min != 20:
+                tws, labels, counts, sums = parallelAggregate(in_file, table, args.workers, args.series_min,
+                                                              time_range=time_range)
+            dumpSeries(seriesFile(in_file, args.series_min, time_range), tws, labels, counts, sums, args.series_min * 60, table)
+    else:
+        traj_info = parseTrajFile(traj_in_file, time_range=time_range,
+                                  columns=None if args.link_features else windowColumns['traj'])
+        vol_info = parseVolumeFile(vol_in_file, time_range=time_range, columns=windowColumns['volume'])
+        dumpAverageTravelTime(traj_info, traj_out_file, args.d_type, args.win_size, args.fill)
+        dumpAverageVolume(vol_info, vol_out_file, args.d_type, args.win_size, args.fill)
+        for in_file, info, table in [(traj_in_file, traj_info, 'traj'), (vol_in_file, vol_info, 'volume')]:
+            tws, labels, counts, sums = aggregateSeries(info, table, args.series_min)
+            dumpSeries(seriesFile(in_file, args.series_min, time_range), tws, labels, counts, sums, args.series_min * 60, table)
     print 'Output files: \n%s\n%s\n' % (traj_out_file, vol_out_file)
 
+    # link features are always rebuilt from the whole trajectory file (within --time-range)
+    if args.link_features:
+        if traj_info is None:
+            traj_info = parseTrajFile(traj_in_file, time_range=time_range)
+        dumpLinkTravelTime(traj_info, link_out_file, args.links_in, args.routes_in)
+        print 'Link features: %s\n' % link_out_file
+
 if __name__ == '__main__':
     main()
 